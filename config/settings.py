@@ -64,6 +64,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "partnerships.audit.AuditLogMiddleware",  # Logs d'audit groupés par requête
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -182,6 +183,9 @@ STATICFILES_DIRS = [
 
 # WhiteNoise Configuration - STORAGES dict (Django 4.2+)
 STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
@@ -208,11 +212,20 @@ EMAIL_PORT = env.int("EMAIL_PORT", default=587)
 EMAIL_USE_TLS = env("EMAIL_USE_TLS", default=True)
 EMAIL_HOST_USER = env("EMAIL_HOST_USER", default="")
 EMAIL_HOST_PASSWORD = env("EMAIL_HOST_PASSWORD", default="")
+# Connexions gardées ouvertes par students.email_backends.PooledSMTPEmailBackend
+EMAIL_POOL_SIZE = env.int("EMAIL_POOL_SIZE", default=2)
+# Bail (secondes) d'un email réservé par send_queued_emails : repris ensuite si le worker s'est arrêté
+EMAIL_SENDING_LEASE = env.int("EMAIL_SENDING_LEASE", default=600)
 DEFAULT_FROM_EMAIL = env(
     "DEFAULT_FROM_EMAIL", default="noreply@instituttorii.com"
 )
 SERVER_EMAIL = env("SERVER_EMAIL", default="server@instituttorii.com")
 
+# Mode digest : les notifications partenaire / admin sont regroupées par destinataire
+# et envoyées en un seul email par fenêtre (minutes) au lieu d'un email par inscription
+EMAIL_DIGEST_ENABLED = env.bool("EMAIL_DIGEST_ENABLED", default=False)
+EMAIL_DIGEST_WINDOW = env.int("EMAIL_DIGEST_WINDOW", default=15)
+
 # Admin notifications
 ADMINS = env.list("ADMINS", default=["Admin <admin@instituttorii.com>"])
 # Convert string format to tuple format
@@ -317,9 +330,49 @@ if SENTRY_DSN:
     )
 
 # Redis Cache (optional)
+# Sans Redis, CACHE_URL permet un cache fichier partagé entre workers
+# (ex: filecache:///home/user/cache) ; sinon cache mémoire local par process.
 REDIS_URL = env("REDIS_URL", default="")
+CACHE_URL = env("CACHE_URL", default="")
 if REDIS_URL:
     CACHES = {"default": env.cache_url("REDIS_URL")}
+elif CACHE_URL:
+    CACHES = {"default": env.cache_url("CACHE_URL")}
+
+# Cache des stats des dashboards partenaires (invalidé par signaux)
+PARTNER_STATS_CACHE_ALIAS = env("PARTNER_STATS_CACHE_ALIAS", default="default")
+PARTNER_STATS_CACHE_TIMEOUT = env.int("PARTNER_STATS_CACHE_TIMEOUT", default=300)
+
+# URL publique du site, utilisée hors requête (commandes de génération des QR codes / PDF)
+SITE_URL = env("SITE_URL", default="http://localhost:8000")
+
+# Cache des images QR code (adressé par contenu) : "cache" (CACHES) ou "storage" (MEDIA_ROOT/qrcodes)
+QR_CACHE_BACKEND = env("QR_CACHE_BACKEND", default="cache")
+QR_CACHE_ALIAS = env("QR_CACHE_ALIAS", default="default")
+QR_CACHE_TIMEOUT = env.int("QR_CACHE_TIMEOUT", default=30 * 24 * 3600)
+
+# Traitement des reçus (commande process_receipts) : orientation EXIF, réduction, recompression, miniature
+RECEIPT_MAX_SIZE = env.int("RECEIPT_MAX_SIZE", default=1600)  # plus grand côté, en pixels
+RECEIPT_THUMBNAIL_SIZE = env.int("RECEIPT_THUMBNAIL_SIZE", default=400)
+RECEIPT_FORMAT = env("RECEIPT_FORMAT", default="WEBP")  # WEBP ou JPEG
+RECEIPT_QUALITY = env.int("RECEIPT_QUALITY", default=80)
+RECEIPT_KEEP_ORIGINAL = env.bool("RECEIPT_KEEP_ORIGINAL", default=False)
+# Bail (secondes) d'un reçu réservé par un worker process_receipts : repris ensuite s'il s'est arrêté
+RECEIPT_PROCESSING_LEASE = env.int("RECEIPT_PROCESSING_LEASE", default=600)
+# Taille maximale d'une photo de reçu, appliquée pendant la réception (partnerships/uploads.py)
+RECEIPT_MAX_UPLOAD_SIZE = env.int("RECEIPT_MAX_UPLOAD_SIZE", default=5 * 1024 * 1024)
+# Même partenaire, même montant, même photo dans cette fenêtre : paiement considéré comme un doublon
+RECEIPT_DUPLICATE_WINDOW_HOURS = env.int("RECEIPT_DUPLICATE_WINDOW_HOURS", default=72)
+# Reçus servis après contrôle d'accès (ReceiptFileView) : le serveur frontal envoie le fichier.
+# "" (Django), "x-sendfile" (Apache mod_xsendfile) ou "x-accel-redirect" (nginx, avec une
+# location internal sur RECEIPT_SENDFILE_PREFIX pointant vers MEDIA_ROOT). MEDIA_ROOT/receipts
+# ne doit pas être servi publiquement.
+RECEIPT_SENDFILE_BACKEND = env("RECEIPT_SENDFILE_BACKEND", default="")
+RECEIPT_SENDFILE_PREFIX = env("RECEIPT_SENDFILE_PREFIX", default="/protected-media/")
+
+# Logs d'audit écrits après le commit (partnerships/audit.py). Spool local des entrées pas encore
+# en base, rejoué par la commande flush_audit_spool après un crash ("" : désactivé)
+AUDIT_SPOOL_DIR = env("AUDIT_SPOOL_DIR", default="")
 
 # ============================================
 # WHITENOISE SETTINGS
@@ -4,12 +4,12 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_http_methods
-from .models import Partner, PartnershipCode, Payment, PartnershipRequest, PaymentCheckpoint
+from .models import Partner, PartnershipCode, Payment, PartnershipRequest, PaymentCheckpoint, DailyPartnerStats
 
 
 @admin.register(Partner)
 class PartnerAdmin(admin.ModelAdmin):
-    list_display = ('name', 'partner_code', 'email', 'status', 'total_students_confirmed', 'revenue_real', 'payment_status')
+    list_display = ('name', 'partner_code', 'email', 'status', 'confirmed_since_checkpoint', 'revenue_since_checkpoint', 'payment_status_display')
     list_filter = ('status', 'created_at')
     search_fields = ('name', 'email', 'contact_person')
     readonly_fields = ('id', 'created_at', 'updated_at', 'partner_code', 'revenue_info')
@@ -30,10 +30,28 @@ class PartnerAdmin(admin.ModelAdmin):
     )
     actions = ['create_payment_checkpoint']
 
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.with_stats()
+
     def partner_code(self, obj):
         return obj.partner_code
     partner_code.short_description = "Code Partenaire"
 
+    def confirmed_since_checkpoint(self, obj):
+        return obj.confirmed_since_checkpoint_count
+    confirmed_since_checkpoint.short_description = "Confirmés (depuis checkpoint)"
+    confirmed_since_checkpoint.admin_order_field = 'confirmed_since_checkpoint_count'
+
+    def revenue_since_checkpoint(self, obj):
+        return obj.commission_per_student * obj.confirmed_since_checkpoint_count
+    revenue_since_checkpoint.short_description = "Revenu réel"
+
+    def payment_status_display(self, obj):
+        revenue = self.revenue_since_checkpoint(obj)
+        return Partner.get_payment_status(revenue, revenue)
+    payment_status_display.short_description = "Statut"
+
     def revenue_info(self, obj):
         """Affiche les informations de revenu"""
         return f"""
@@ -199,3 +217,18 @@ class PaymentCheckpointAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         return qs.select_related('partner')
+
+
+@admin.register(DailyPartnerStats)
+class DailyPartnerStatsAdmin(admin.ModelAdmin):
+    list_display = ('day', 'partner', 'code', 'program', 'registrations', 'confirmations', 'commission_earned')
+    list_filter = ('day', 'partner', 'program')
+    search_fields = ('partner__name', 'code')
+    date_hierarchy = 'day'
+    list_select_related = ('partner', 'program')
+    readonly_fields = ('day', 'partner', 'code', 'partnership_code', 'program', 'registrations',
+                       'confirmations', 'commission_earned', 'refreshed_at')
+
+    def has_add_permission(self, request):
+        # Table calculée par la commande refresh_daily_stats
+        return False
@@ -0,0 +1,161 @@
+"""
+Écriture différée et groupée des logs d'audit (AuditLog).
+
+Les classmethods log_* d'AuditLog ne font plus d'INSERT : les entrées sont
+confiées à record(), qui les garde jusqu'au commit de la transaction en
+cours (elles disparaissent avec un rollback). Après le commit :
+  - pendant une requête, elles s'accumulent et sont écrites en un seul
+    bulk_create à la fin de la vue (AuditLogMiddleware) ;
+  - hors requête (commandes, workers), elles sont écrites tout de suite, un
+    bulk_create par appel de record().
+
+Si AUDIT_SPOOL_DIR est configuré, les entrées validées sont d'abord ajoutées
+à un fichier JSON Lines propre au process/thread, vidé après chaque écriture
+réussie. Après un crash, la commande `flush_audit_spool` rejoue les fichiers
+restants (les ids sont des UUID : rejouer deux fois est sans effet).
+"""
+import glob
+import logging
+import os
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.core import serializers
+from django.core.serializers.base import DeserializationError
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+SPOOL_PATTERN = 'audit-*.jsonl'
+
+_state = threading.local()
+
+
+def record(*entries):
+    """Enregistre des AuditLog (non sauvegardés) après le commit de la transaction en cours"""
+    if entries:
+        # Callback abandonné par Django si la transaction (ou le savepoint) est annulée
+        transaction.on_commit(partial(_enqueue, entries))
+    return entries
+
+
+def flush():
+    """Écrit les entrées en attente ; retourne leur nombre"""
+    entries, _state.buffer = _buffer(), []
+    if not entries:
+        return 0
+    try:
+        type(entries[0]).objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    except Exception:
+        # Gardées pour le prochain flush (et dans le spool si le process s'arrête)
+        logger.exception("Écriture de %d log(s) d'audit impossible", len(entries))
+        _state.buffer = entries + _state.buffer
+        return 0
+    _truncate_spool()
+    return len(entries)
+
+
+def _buffer():
+    if not hasattr(_state, 'buffer'):
+        _state.buffer = []
+    return _state.buffer
+
+
+def _enqueue(entries):
+    """Entrées validées : spool, puis écriture immédiate ou en fin de requête"""
+    _append_to_spool(entries)
+    _buffer().extend(entries)
+    if not getattr(_state, 'in_request', False):
+        flush()
+
+
+class AuditLogMiddleware:
+    """Regroupe les logs d'audit validés pendant la requête en un seul bulk_create"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.in_request = True
+        try:
+            return self.get_response(request)
+        finally:
+            _state.in_request = False
+            flush()
+
+
+# Spool local (append-only)
+
+def spool_path():
+    """Fichier du process/thread courant, ou None si AUDIT_SPOOL_DIR n'est pas configuré"""
+    if not settings.AUDIT_SPOOL_DIR:
+        return None
+    return os.path.join(settings.AUDIT_SPOOL_DIR, f'audit-{os.getpid()}-{threading.get_ident()}.jsonl')
+
+
+def _append_to_spool(entries):
+    path = spool_path()
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(serializers.serialize('jsonl', entries))
+            f.flush()
+            os.fsync(f.fileno())
+    except OSError:
+        logger.exception("Écriture du spool d'audit %s impossible", path)
+
+
+def _truncate_spool():
+    path = spool_path()
+    if path is not None and os.path.exists(path):
+        try:
+            open(path, 'w').close()
+        except OSError:
+            logger.exception("Vidage du spool d'audit %s impossible", path)
+
+
+def spool_files(include_running=False):
+    """Fichiers du spool à rejouer : par défaut, ceux des process terminés"""
+    paths = sorted(glob.glob(os.path.join(settings.AUDIT_SPOOL_DIR, SPOOL_PATTERN)))
+    if include_running:
+        return paths
+    return [path for path in paths if not _process_running(_spool_pid(path))]
+
+
+def replay_spool_file(path):
+    """Écrit en base les entrées du fichier `path` puis le supprime ; retourne leur nombre"""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, start=1):
+            try:
+                entries.extend(obj.object for obj in serializers.deserialize('jsonl', line, ignorenonexistent=True))
+            except DeserializationError:
+                # Dernière ligne tronquée par un crash
+                logger.warning("Ligne %d illisible dans %s, ignorée", number, path)
+    if entries:
+        type(entries[0]).objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    os.remove(path)
+    return len(entries)
+
+
+def _spool_pid(path):
+    try:
+        return int(os.path.basename(path).split('-')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _process_running(pid):
+    if pid is None or pid == os.getpid():
+        return pid is not None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
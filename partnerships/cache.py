@@ -0,0 +1,90 @@
+"""
+Cache des statistiques des dashboards partenaires.
+
+Les clés sont versionnées par partenaire : une écriture (élève, checkpoint,
+paiement, reçu) incrémente la version après son commit, ce qui invalide
+toutes les entrées du partenaire sans devoir les énumérer. Fonctionne avec n'importe quel
+backend Django (Redis, fichiers, mémoire locale).
+"""
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+HITS_KEY = 'partner-stats:hits'
+MISSES_KEY = 'partner-stats:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'PARTNER_STATS_CACHE_ALIAS', 'default')]
+
+
+def _version_key(partner_id):
+    return f'partner-stats:{partner_id}:version'
+
+
+def _new_version():
+    # Une version perdue (éviction) ne doit jamais retomber sur d'anciennes entrées
+    return int(time.time() * 1000)
+
+
+def _increment(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Clé absente (premier accès ou expirée) : add() évite d'écraser un compteur concurrent
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_partner_stats(partner_id, name, builder):
+    """Retourne les stats `name` du partenaire, calculées par `builder()` en cas de miss"""
+    cache = get_cache()
+    version = cache.get_or_set(_version_key(partner_id), _new_version, timeout=None)
+    key = f'partner-stats:{partner_id}:v{version}:{name}'
+
+    stats = cache.get(key)
+    if stats is not None:
+        _increment(cache, HITS_KEY)
+        return stats
+
+    _increment(cache, MISSES_KEY)
+    stats = builder()
+    cache.set(key, stats, timeout=getattr(settings, 'PARTNER_STATS_CACHE_TIMEOUT', 300))
+    return stats
+
+
+def invalidate_partner_stats(partner_id):
+    """
+    Invalide toutes les stats en cache du partenaire, après le commit de la
+    transaction en cours : invalidées plus tôt, une requête concurrente
+    pourrait recalculer les stats d'avant le commit et les garder en cache
+    sous la nouvelle version.
+    """
+    if not partner_id:
+        return
+    transaction.on_commit(partial(_bump_version, partner_id))
+
+
+def _bump_version(partner_id):
+    cache = get_cache()
+    try:
+        cache.incr(_version_key(partner_id))
+    except ValueError:
+        cache.set(_version_key(partner_id), _new_version(), timeout=None)
+
+
+def cache_counters():
+    """Compteurs de hits / misses du cache des stats partenaires"""
+    cache = get_cache()
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0,
+    }
@@ -0,0 +1,152 @@
+"""
+Exports CSV en flux pour la comptabilité (élèves, paiements, reçus, checkpoints).
+
+Les lignes sont lues avec values_list(...).iterator(chunk_size) et écrites une
+à une : la mémoire reste constante quel que soit le nombre de lignes et les
+premiers octets partent avant la fin de la requête. Partagé par
+ExportCSVView et la commande export_csv.
+"""
+import csv
+import datetime
+from decimal import Decimal
+
+from django.utils import timezone
+
+from students.models import Student
+from .models import Payment, PaymentCheckpoint, PaymentReceipt
+
+CHUNK_SIZE = 2000
+
+# BOM UTF-8 : Excel ouvre alors le fichier avec les accents corrects
+CSV_BOM = '\ufeff'
+
+# Premiers caractères qu'Excel interprète comme une formule (injection CSV)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# model, champ date (filtre et tri), champ partenaire, colonnes (en-tête, champ pour values_list)
+EXPORTS = {
+    'students': {
+        'model': Student,
+        'date_field': 'enrollment_date',
+        'partner_field': 'partner',
+        'columns': (
+            ('id', 'id'),
+            ('nom', 'full_name'),
+            ('email', 'email'),
+            ('telephone', 'phone'),
+            ('partenaire', 'partner__name'),
+            ('code', 'referral_code'),
+            ('programme', 'program__name'),
+            ('statut', 'status'),
+            ('confirme', 'is_confirmed'),
+            ('date_inscription', 'enrollment_date'),
+            ('date_confirmation', 'confirmed_at'),
+        ),
+    },
+    'payments': {
+        'model': Payment,
+        'date_field': 'created_at',
+        'partner_field': 'partner',
+        'columns': (
+            ('id', 'id'),
+            ('partenaire', 'partner__name'),
+            ('montant', 'amount'),
+            ('reste', 'remaining_amount'),
+            ('statut', 'status'),
+            ('reference', 'reference'),
+            ('notes', 'notes'),
+            ('date_creation', 'created_at'),
+            ('date_paiement', 'completed_at'),
+        ),
+    },
+    'receipts': {
+        'model': PaymentReceipt,
+        'date_field': 'created_at',
+        'partner_field': 'payment__partner',
+        'columns': (
+            ('id', 'id'),
+            ('paiement', 'payment_id'),
+            ('partenaire', 'payment__partner__name'),
+            ('montant_paye', 'amount_paid'),
+            ('reference', 'payment__reference'),
+            ('fichier', 'receipt_image'),
+            ('notes', 'notes'),
+            ('date_upload', 'created_at'),
+        ),
+    },
+    'checkpoints': {
+        'model': PaymentCheckpoint,
+        'date_field': 'checkpoint_date',
+        'partner_field': 'partner',
+        'columns': (
+            ('id', 'id'),
+            ('partenaire', 'partner__name'),
+            ('montant_paye', 'amount_paid'),
+            ('date_checkpoint', 'checkpoint_date'),
+            ('notes', 'notes'),
+            ('date_creation', 'created_at'),
+        ),
+    },
+}
+
+
+def export_queryset(name, partner=None, start=None, end=None):
+    """
+    Lignes (tuples) de l'export `name`, triées par date.
+
+    `start` et `end` sont des dates incluses, converties en bornes datetime
+    pour que l'index sur le champ date reste utilisable.
+    """
+    export = EXPORTS[name]
+    date_field = export['date_field']
+    queryset = export['model'].objects.all()
+    if partner is not None:
+        queryset = queryset.filter(**{export['partner_field']: partner})
+    if start is not None:
+        queryset = queryset.filter(**{f'{date_field}__gte': _day_start(start)})
+    if end is not None:
+        queryset = queryset.filter(**{f'{date_field}__lt': _day_start(end + datetime.timedelta(days=1))})
+    fields = [field for _, field in export['columns']]
+    return queryset.order_by(date_field, 'id').values_list(*fields)
+
+
+def iter_csv(name, partner=None, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Génère le CSV ligne par ligne (chaînes), en-tête compris"""
+    writer = csv.writer(_Echo())
+    yield CSV_BOM + writer.writerow([header for header, _ in EXPORTS[name]['columns']])
+    rows = export_queryset(name, partner=partner, start=start, end=end)
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield writer.writerow([_format(value) for value in row])
+
+
+def parse_date(value):
+    """Date AAAA-MM-JJ, ou None si vide ; ValueError si invalide"""
+    if not value:
+        return None
+    return datetime.date.fromisoformat(value)
+
+
+class _Echo:
+    """Pseudo-fichier : csv.writer retourne la ligne au lieu de l'écrire"""
+
+    def write(self, value):
+        return value
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _format(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'oui' if value else 'non'
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, Decimal):
+        return f'{value:.2f}'
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # Texte saisi par un utilisateur (nom, notes, référence) : jamais exécuté comme formule
+        return "'" + value
+    return value
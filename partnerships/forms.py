@@ -3,16 +3,13 @@ from django.contrib.auth.models import User
 from django.core.validators import FileExtensionValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from .models import Partner, Payment, PaymentReceipt, PartnershipRequest
+from .uploads import max_upload_size, too_large_message, validate_image_header
 
 
 def validate_image_size(file):
-    """Valide que la taille de l'image est <= 5MB"""
-    file_size = file.size
-    limit_mb = 5
-    if file_size > limit_mb * 1024 * 1024:
-        raise ValidationError(
-            f"L'image est trop grande. Max {limit_mb}MB, vous avez {file_size / (1024 * 1024):.1f}MB."
-        )
+    """Valide que la taille de l'image est <= RECEIPT_MAX_UPLOAD_SIZE"""
+    if file.size > max_upload_size():
+        raise ValidationError(too_large_message(file.size))
 
 
 class PartnerCreationForm(forms.ModelForm):
@@ -93,7 +90,9 @@ class QuickPaymentForm(forms.Form):
         })
     )
 
-    receipt_image = forms.ImageField(
+    # FileField + validate_image_header : en-tête vérifié sans décoder l'image
+    # (ImageField la décode entièrement avec Pillow)
+    receipt_image = forms.FileField(
         label="Photo du reçu",
         help_text="Max 5 MB - JPG, PNG ou JPEG",
         widget=forms.FileInput(attrs={
@@ -104,7 +103,8 @@ class QuickPaymentForm(forms.Form):
         }),
         validators=[
             FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png']),
-            validate_image_size
+            validate_image_size,
+            validate_image_header,
         ]
     )
 
@@ -118,6 +118,20 @@ class QuickPaymentForm(forms.Form):
         })
     )
 
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Fichiers refusés pendant la réception (ReceiptUploadHandler)
+        self.upload_errors = upload_errors or {}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for field, message in self.upload_errors.items():
+            if field in self.fields:
+                self.errors.pop(field, None)
+                cleaned_data.pop(field, None)
+                self.add_error(field, message)
+        return cleaned_data
+
 
 class PartnershipRequestForm(forms.ModelForm):
     """Formulaire pour les demandes de partenariat depuis la page de contact"""
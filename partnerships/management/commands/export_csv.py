@@ -0,0 +1,60 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from partnerships.exports import CHUNK_SIZE, EXPORTS, iter_csv, parse_date
+from partnerships.models import Partner
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporte en CSV les élèves, paiements, reçus ou checkpoints, en flux '
+        '(mémoire constante), filtrés par partenaire et par période.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORTS), help='Données à exporter')
+        parser.add_argument('--partner', help='ID du partenaire')
+        parser.add_argument('--start', help='Date de début incluse (AAAA-MM-JJ)')
+        parser.add_argument('--end', help='Date de fin incluse (AAAA-MM-JJ)')
+        parser.add_argument('--output', help='Fichier CSV de sortie (défaut: sortie standard)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Lignes lues par requête')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            start = parse_date(options['start'])
+            end = parse_date(options['end'])
+        except ValueError:
+            raise CommandError('Date invalide (format attendu: AAAA-MM-JJ)')
+
+        partner = None
+        if options['partner']:
+            try:
+                partner = Partner.objects.filter(id=options['partner']).first()
+            except ValidationError:
+                partner = None
+            if partner is None:
+                raise CommandError(f"Partenaire introuvable: {options['partner']}")
+
+        lines = iter_csv(
+            options['dataset'], partner=partner, start=start, end=end, chunk_size=options['chunk_size'],
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                rows = self._write(f.write, lines)
+        else:
+            rows = self._write(lambda line: self.stdout.write(line, ending=''), lines)
+
+        # Résumé sur stderr : la sortie standard peut contenir le CSV
+        self.stderr.write(self.style.SUCCESS(
+            f'{rows} ligne(s) exportée(s) en {time.monotonic() - started:.1f}s'
+        ))
+
+    @staticmethod
+    def _write(write, lines):
+        rows = -1  # sans l'en-tête
+        for line in lines:
+            write(line)
+            rows += 1
+        return rows
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from partnerships.audit import replay_spool_file, spool_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Écrit en base les logs d'audit restés dans le spool (AUDIT_SPOOL_DIR) "
+        "après l'arrêt brutal d'un process, puis supprime les fichiers rejoués."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rejouer aussi les fichiers des process encore actifs (serveur arrêté)',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.AUDIT_SPOOL_DIR:
+            raise CommandError("AUDIT_SPOOL_DIR n'est pas configuré")
+
+        total = 0
+        paths = spool_files(include_running=options['all'])
+        for path in paths:
+            count = replay_spool_file(path)
+            total += count
+            if count:
+                self.stdout.write(f'{path}: {count} log(s)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Terminé: {total} log(s) écrit(s) depuis {len(paths)} fichier(s)'
+        ))
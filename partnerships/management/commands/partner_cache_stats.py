@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from partnerships.cache import cache_counters
+
+
+class Command(BaseCommand):
+    help = 'Affiche les compteurs hits / misses du cache des stats partenaires'
+
+    def handle(self, *args, **options):
+        counters = cache_counters()
+        self.stdout.write(
+            f"Hits: {counters['hits']}  Misses: {counters['misses']}  "
+            f"Taux de hit: {counters['hit_rate']:.1%}"
+        )
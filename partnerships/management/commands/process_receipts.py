@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from partnerships.receipts import process_pending_receipts
+
+
+class Command(BaseCommand):
+    help = (
+        "Traite les photos de reçus en attente : orientation EXIF, réduction, "
+        "recompression et miniature. Avec --loop, tourne en continu comme worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help='Reçus traités par lot')
+        parser.add_argument('--loop', action='store_true', help='Tourner en continu')
+        parser.add_argument('--interval', type=float, default=10, help='Pause (secondes) quand la file est vide')
+
+    def handle(self, *args, **options):
+        total_processed = total_failed = 0
+
+        while True:
+            processed, failed = process_pending_receipts(options['batch_size'])
+            total_processed += processed
+            total_failed += failed
+            if processed or failed:
+                self.stdout.write(f'{processed} reçu(s) traité(s), {failed} échec(s)')
+
+            # Lot complet : il reste probablement des reçus, on enchaîne
+            if processed + failed >= options['batch_size']:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Terminé: {total_processed} reçu(s) traité(s), {total_failed} échec(s)'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from partnerships.models import Partner, PartnerBalance
+
+
+class Command(BaseCommand):
+    help = 'Recalcule le solde dénormalisé (PartnerBalance) de tous les partenaires'
+
+    def handle(self, *args, **options):
+        count = 0
+        for partner_id in Partner.objects.values_list('id', flat=True).iterator():
+            PartnerBalance.refresh(partner_id)
+            count += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'{count} solde(s) partenaire recalculé(s)')
+        )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from partnerships.models import DailyPartnerStats
+
+
+class Command(BaseCommand):
+    help = (
+        'Met à jour les statistiques journalières (DailyPartnerStats). '
+        'Par défaut, seuls les jours touchés depuis le dernier calcul sont recalculés.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Reconstruit toute la table (backfill, changement de commission)',
+        )
+
+    def handle(self, *args, **options):
+        started_at = timezone.now()
+        last_refresh = DailyPartnerStats.last_refresh()
+
+        if options['full'] or last_refresh is None:
+            count = DailyPartnerStats.refresh_days(refreshed_at=started_at)
+            DailyPartnerStats.set_last_refresh(started_at)
+            self.stdout.write(
+                self.style.SUCCESS(f'Reconstruction complète: {count} ligne(s) écrite(s)')
+            )
+            return
+
+        days = DailyPartnerStats.touched_days(last_refresh)
+        if not days:
+            DailyPartnerStats.set_last_refresh(started_at)
+            self.stdout.write('Aucun jour à recalculer')
+            return
+
+        count = DailyPartnerStats.refresh_days(days, refreshed_at=started_at)
+        DailyPartnerStats.set_last_refresh(started_at)
+        self.stdout.write(
+            self.style.SUCCESS(f'{len(days)} jour(s) recalculé(s): {count} ligne(s) écrite(s)')
+        )
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partnerships', '0006_alter_paymentcheckpoint_checkpoint_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartnerBalance',
+            fields=[
+                ('partner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='partnerships.partner', verbose_name='Partenaire')),
+                ('students_pending', models.PositiveIntegerField(default=0, verbose_name='Élèves en attente')),
+                ('students_confirmed', models.PositiveIntegerField(default=0, verbose_name='Élèves confirmés (total)')),
+                ('students_confirmed_since_checkpoint', models.PositiveIntegerField(default=0, verbose_name='Élèves confirmés depuis le dernier checkpoint')),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total payé via checkpoints (DA)')),
+                ('total_payments_completed', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total des paiements complétés (DA)')),
+                ('last_checkpoint_date', models.DateTimeField(blank=True, null=True, verbose_name='Date du dernier checkpoint')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Date de mise à jour')),
+            ],
+            options={
+                'verbose_name': 'Solde partenaire',
+                'verbose_name_plural': 'Soldes partenaires',
+            },
+        ),
+    ]
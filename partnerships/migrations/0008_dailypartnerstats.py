@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:59
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partnerships', '0007_partnerbalance'),
+        ('students', '0004_remove_student_birth_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPartnerStats',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('day', models.DateField(verbose_name='Jour')),
+                ('code', models.CharField(blank=True, max_length=100, verbose_name='Code de parrainage')),
+                ('registrations', models.PositiveIntegerField(default=0, verbose_name='Inscriptions')),
+                ('confirmations', models.PositiveIntegerField(default=0, verbose_name='Confirmations')),
+                ('commission_earned', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Commission acquise (DA)')),
+                ('refreshed_at', models.DateTimeField(verbose_name='Date de calcul')),
+                ('partner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='partnerships.partner', verbose_name='Partenaire')),
+                ('partnership_code', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_stats', to='partnerships.partnershipcode', verbose_name='Code partenaire')),
+                ('program', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_stats', to='students.program', verbose_name='Programme')),
+            ],
+            options={
+                'verbose_name': 'Statistique journalière',
+                'verbose_name_plural': 'Statistiques journalières',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day'], name='partnership_day_698e4e_idx'), models.Index(fields=['partner', 'day'], name='partnership_partner_0bd777_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:00
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partnerships', '0008_dailypartnerstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLog',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('action', models.CharField(choices=[('student_registered', 'Étudiant inscrit'), ('student_confirmed', 'Étudiant confirmé'), ('student_rejected', 'Étudiant rejeté'), ('payment_created', 'Paiement créé'), ('payment_updated', 'Paiement mis à jour'), ('payment_completed', 'Paiement validé'), ('receipt_uploaded', 'Reçu uploadé'), ('partner_created', 'Partenaire créé'), ('partner_updated', 'Partenaire mis à jour'), ('code_generated', 'Code partenaire généré')], max_length=50)),
+                ('description', models.TextField(help_text="Description détaillée de l'action")),
+                ('actor_email', models.EmailField(blank=True, help_text="Email de l'acteur (si pas de user)", max_length=254)),
+                ('student_id', models.UUIDField(blank=True, help_text="ID de l'étudiant impliqué", null=True)),
+                ('student_name', models.CharField(blank=True, max_length=255)),
+                ('student_email', models.EmailField(blank=True, max_length=254)),
+                ('partner_id', models.UUIDField(blank=True, help_text='ID du partenaire impliqué', null=True)),
+                ('partner_name', models.CharField(blank=True, max_length=255)),
+                ('payment_id', models.UUIDField(blank=True, help_text='ID du paiement impliqué', null=True)),
+                ('payment_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('old_values', models.JSONField(blank=True, help_text='État précédent (pour modifications)', null=True)),
+                ('new_values', models.JSONField(blank=True, help_text='Nouvel état', null=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('user_agent', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, help_text="Utilisateur ayant effectué l'action", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audit_logs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Audit Log',
+                'verbose_name_plural': 'Audit Logs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['action', '-created_at'], name='partnership_action_f4151e_idx'), models.Index(fields=['student_id'], name='partnership_student_30da10_idx'), models.Index(fields=['partner_id'], name='partnership_partner_291d89_idx'), models.Index(fields=['payment_id'], name='partnership_payment_1465c7_idx'), models.Index(fields=['created_at'], name='partnership_created_e6df41_idx')],
+            },
+        ),
+    ]
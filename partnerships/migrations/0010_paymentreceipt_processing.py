@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partnerships', '0009_auditlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentreceipt',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Date de traitement de l'image"),
+        ),
+        migrations.AddField(
+            model_name='paymentreceipt',
+            name='processing_error',
+            field=models.TextField(blank=True, verbose_name='Erreur de traitement'),
+        ),
+        migrations.AddField(
+            model_name='paymentreceipt',
+            name='receipt_original',
+            field=models.ImageField(blank=True, upload_to='receipts/originals/%Y/%m/%d/', verbose_name='Photo originale (si RECEIPT_KEEP_ORIGINAL)'),
+        ),
+        migrations.AddField(
+            model_name='paymentreceipt',
+            name='receipt_thumbnail',
+            field=models.ImageField(blank=True, upload_to='receipts/thumbs/%Y/%m/%d/', verbose_name='Miniature du reçu'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentreceipt',
+            index=models.Index(fields=['processed_at', 'created_at'], name='partnership_process_25b37f_idx'),
+        ),
+    ]
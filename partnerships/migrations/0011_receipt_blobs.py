@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partnerships', '0010_paymentreceipt_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256')),
+                ('file', models.FileField(db_index=True, max_length=255, upload_to='receipts/blobs/', verbose_name='Fichier')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='Taille (octets)')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Références')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+            ],
+            options={
+                'verbose_name': 'Fichier de reçu',
+                'verbose_name_plural': 'Fichiers de reçus',
+            },
+        ),
+        migrations.AddField(
+            model_name='paymentreceipt',
+            name='image_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='SHA-256 de la photo'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:01
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_watermark(apps, schema_editor):
+    """Reprend la date du dernier calcul des lignes existantes"""
+    DailyPartnerStats = apps.get_model('partnerships', 'DailyPartnerStats')
+    DailyStatsWatermark = apps.get_model('partnerships', 'DailyStatsWatermark')
+    last = DailyPartnerStats.objects.aggregate(last=Max('refreshed_at'))['last']
+    if last is not None:
+        DailyStatsWatermark.objects.create(pk=1, refreshed_at=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partnerships', '0012_auditlog_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStatsDirtyDay',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False, verbose_name='Jour')),
+            ],
+            options={
+                'verbose_name': 'Jour à recalculer',
+                'verbose_name_plural': 'Jours à recalculer',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStatsWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('refreshed_at', models.DateTimeField(verbose_name='Date du dernier calcul')),
+            ],
+            options={
+                'verbose_name': 'Dernier calcul des statistiques',
+                'verbose_name_plural': 'Dernier calcul des statistiques',
+            },
+        ),
+        migrations.RunPython(seed_watermark, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partnerships', '0013_daily_stats_dirty_days_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentreceipt',
+            name='processing_claimed_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Réservé pour traitement jusqu'au"),
+        ),
+    ]
@@ -1,10 +1,70 @@
-from django.db import models
-from django.db.models import Sum
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone
 from django.contrib.auth.models import User
+from datetime import datetime, timedelta
+import tempfile
 import uuid
 
 
+class PartnerQuerySet(models.QuerySet):
+    """QuerySet des partenaires avec statistiques agrégées"""
+
+    def with_stats(self):
+        """
+        Annote chaque partenaire avec ses statistiques en une seule requête :
+        pending_count, confirmed_count, confirmed_since_checkpoint_count,
+        last_checkpoint_date, paid_total et outstanding_total.
+        Les élèves sont comptés quel que soit leur statut, comme PartnerBalance.
+        Les variantes active_pending_count, active_confirmed_count et
+        active_outstanding_total ne comptent que les élèves actifs, comme les
+        listes d'élèves affichées sur les tableaux de bord.
+
+        outstanding_total est calculé depuis le début (commission de tous les
+        confirmés moins la somme des checkpoints), à la différence de
+        Partner.remaining_balance qui ne porte que sur la période depuis le
+        dernier checkpoint.
+        """
+        checkpoints = PaymentCheckpoint.objects.filter(partner=OuterRef('pk'))
+        last_checkpoint_date = checkpoints.order_by('-checkpoint_date').values('checkpoint_date')[:1]
+        paid_total = checkpoints.order_by().values('partner').annotate(
+            total=Sum('amount_paid')
+        ).values('total')
+
+        confirmed = Q(students__is_confirmed=True)
+        active = Q(students__status='active')
+        return self.annotate(
+            last_checkpoint_date=Subquery(last_checkpoint_date),
+            paid_total=Coalesce(
+                Subquery(paid_total, output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Value(0, output_field=DecimalField(max_digits=12, decimal_places=2)),
+            ),
+            pending_count=Count('students', filter=Q(students__is_confirmed=False)),
+            confirmed_count=Count('students', filter=confirmed),
+            active_pending_count=Count('students', filter=active & Q(students__is_confirmed=False)),
+            active_confirmed_count=Count('students', filter=active & confirmed),
+            confirmed_since_checkpoint_count=Count(
+                'students',
+                filter=confirmed & (
+                    Q(last_checkpoint_date__isnull=True)
+                    | Q(students__confirmed_at__gt=F('last_checkpoint_date'))
+                ),
+            ),
+        ).annotate(
+            outstanding_total=ExpressionWrapper(
+                F('commission_per_student') * F('confirmed_count') - F('paid_total'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            active_outstanding_total=ExpressionWrapper(
+                F('commission_per_student') * F('active_confirmed_count') - F('paid_total'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+
+
 class Partner(models.Model):
     """Modèle pour les partenaires (librairies, magasins, cafés, etc.)"""
 
@@ -69,6 +129,8 @@ class Partner(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
 
+    objects = PartnerQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Partenaire"
         verbose_name_plural = "Partenaires"
@@ -89,6 +151,16 @@ class Partner(models.Model):
         """Récupère le dernier checkpoint (point de contrôle)"""
         return self.payment_checkpoints.first()
 
+    @property
+    def ledger(self):
+        """Solde dénormalisé du partenaire (créé à la première lecture si absent)"""
+        try:
+            return self.balance
+        except PartnerBalance.DoesNotExist:
+            ledger = PartnerBalance.refresh(self.pk)
+            PartnerBalance.partner.field.remote_field.set_cached_value(self, ledger)
+            return ledger
+
     @property
     def total_paid_at_checkpoint(self):
         """Montant total payé jusqu'au dernier checkpoint"""
@@ -100,25 +172,17 @@ class Partner(models.Model):
     @property
     def total_students(self):
         """Nombre total d'élèves en attente de confirmation"""
-        return self.students.filter(is_confirmed=False).count()
+        return self.ledger.students_pending
 
     @property
     def total_students_confirmed(self):
         """Nombre d'élèves confirmés depuis le dernier checkpoint"""
-        checkpoint = self.get_last_checkpoint
-        if checkpoint:
-            # Compte les étudiants confirmés APRÈS le checkpoint (basé sur updated_at)
-            return self.students.filter(
-                is_confirmed=True,
-                updated_at__gt=checkpoint.checkpoint_date
-            ).count()
-        # Si pas de checkpoint, compte tous les confirmés
-        return self.students.filter(is_confirmed=True).count()
+        return self.ledger.students_confirmed_since_checkpoint
 
     @property
     def total_students_confirmed_all_time(self):
         """Nombre TOTAL d'élèves confirmés (depuis le début)"""
-        return self.students.filter(is_confirmed=True).count()
+        return self.ledger.students_confirmed
 
     @property
     def total_earned(self):
@@ -133,9 +197,7 @@ class Partner(models.Model):
     @property
     def total_paid(self):
         """Montant total déjà payé (sum des checkpoints)"""
-        return self.payment_checkpoints.aggregate(
-            total=Sum('amount_paid')
-        )['total'] or 0
+        return self.ledger.total_paid
 
     @property
     def revenue_estimated(self):
@@ -155,9 +217,14 @@ class Partner(models.Model):
     @property
     def payment_status(self):
         """Statut: En attente, Payé en partie, ou Payé"""
-        if self.revenue_real == 0:
+        return self.get_payment_status(self.revenue_real, self.remaining_balance)
+
+    @staticmethod
+    def get_payment_status(revenue, remaining):
+        """Statut de paiement à partir d'un revenu et d'un solde déjà calculés"""
+        if revenue == 0:
             return "Aucun gain"
-        if self.remaining_balance == 0:
+        if remaining == 0:
             return "Payé"
         return "En attente"
 
@@ -174,6 +241,18 @@ class Partner(models.Model):
         return False
 
 
+class PartnershipCodeQuerySet(models.QuerySet):
+    """QuerySet des codes de partenariat"""
+
+    def with_counts(self):
+        """Annote les étudiants actifs en attente (pending_total) et confirmés (confirmed_total)"""
+        active = Q(students__status='active')
+        return self.annotate(
+            pending_total=Count('students', filter=active & Q(students__is_confirmed=False)),
+            confirmed_total=Count('students', filter=active & Q(students__is_confirmed=True)),
+        )
+
+
 class PartnershipCode(models.Model):
     """Modèle pour tracker les codes de partenariat"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -191,6 +270,8 @@ class PartnershipCode(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     is_active = models.BooleanField(default=True, verbose_name="Actif")
 
+    objects = PartnershipCodeQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Code de partenariat"
         verbose_name_plural = "Codes de partenariat"
@@ -202,14 +283,16 @@ class PartnershipCode(models.Model):
     @property
     def students_count(self):
         """Nombre d'étudiants inscrits avec ce code (en attente)"""
-        from students.models import Student
-        return Student.objects.filter(referral_code=self.code, status='active', is_confirmed=False).count()
+        if hasattr(self, 'pending_total'):
+            return self.pending_total
+        return self.students.filter(status='active', is_confirmed=False).count()
 
     @property
     def confirmed_count(self):
         """Nombre d'étudiants confirmés avec ce code"""
-        from students.models import Student
-        return Student.objects.filter(referral_code=self.code, status='active', is_confirmed=True).count()
+        if hasattr(self, 'confirmed_total'):
+            return self.confirmed_total
+        return self.students.filter(status='active', is_confirmed=True).count()
 
     @property
     def total_earned(self):
@@ -317,6 +400,104 @@ class Payment(models.Model):
         self.save()
 
 
+class ReceiptBlob(models.Model):
+    """
+    Fichier de reçu adressé par contenu (SHA-256), partagé entre les reçus.
+
+    Une même photo envoyée plusieurs fois n'est stockée qu'une fois :
+    ref_count compte les champs de PaymentReceipt qui pointent sur le fichier,
+    le fichier est supprimé quand il n'est plus référencé.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True, verbose_name="SHA-256")
+    file = models.FileField(upload_to='receipts/blobs/', max_length=255, db_index=True, verbose_name="Fichier")
+    size = models.PositiveIntegerField(default=0, verbose_name="Taille (octets)")
+    ref_count = models.PositiveIntegerField(default=0, verbose_name="Références")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+
+    class Meta:
+        verbose_name = "Fichier de reçu"
+        verbose_name_plural = "Fichiers de reçus"
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} réf.)"
+
+    @classmethod
+    def storage(cls):
+        return cls._meta.get_field('file').storage
+
+    @staticmethod
+    def path_for(sha256, extension=''):
+        """receipts/blobs/ab/cd/abcd….jpg : répertoires courts même avec beaucoup de fichiers"""
+        suffix = f'.{extension.lower()}' if extension else ''
+        return f'receipts/blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}{suffix}'
+
+    @classmethod
+    def store(cls, content, sha256, extension=''):
+        """
+        Ajoute une référence au fichier de contenu `sha256` ; retourne son nom.
+
+        Le fichier n'est écrit que s'il n'existe pas encore dans le store, et
+        seulement après le commit de la transaction : un rollback ne laisse
+        pas de fichier orphelin sur le disque.
+        """
+        if cls.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1):
+            return cls.objects.filter(sha256=sha256).values_list('file', flat=True).get()
+
+        name = cls.path_for(sha256, extension)
+        try:
+            with transaction.atomic():
+                cls.objects.create(sha256=sha256, file=name, size=content.size, ref_count=1)
+        except IntegrityError:
+            # Même contenu enregistré en parallèle : garder le sien
+            cls.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+            return cls.objects.filter(sha256=sha256).values_list('file', flat=True).get()
+
+        # Copie gardée par le callback : `content` peut être fermé d'ici le commit
+        copy = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        for chunk in content.chunks():
+            copy.write(chunk)
+        transaction.on_commit(lambda: cls._write(name, copy))
+        return name
+
+    @classmethod
+    def _write(cls, name, copy):
+        storage = cls.storage()
+        try:
+            # Nom adressé par contenu : un fichier déjà présent a le même contenu
+            if not storage.exists(name):
+                copy.seek(0)
+                storage.save(name, File(copy))
+        finally:
+            copy.close()
+
+    @classmethod
+    def sha256_for(cls, name):
+        """SHA-256 du fichier `name` s'il est dans le store, sinon None"""
+        return cls.objects.filter(file=name).values_list('sha256', flat=True).first()
+
+    @classmethod
+    def release(cls, name):
+        """
+        Retire une référence au fichier `name` et le supprime s'il n'est plus utilisé.
+
+        Un fichier hors du store (reçus enregistrés avant lui) est supprimé
+        directement. La suppression a lieu après le commit de la transaction.
+        """
+        if not name:
+            return
+        storage = cls.storage()
+        blobs = cls.objects.filter(file=name)
+        with transaction.atomic():
+            if blobs.exists():
+                # ref_count__gt=0 : une double libération ne descend pas sous zéro
+                blobs.filter(ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+                unused = blobs.select_for_update().filter(ref_count=0)
+                if not unused.exists():
+                    return
+                unused.delete()
+        transaction.on_commit(lambda: storage.delete(name))
+
+
 class PaymentReceipt(models.Model):
     """Modèle pour gérer les reçus de paiement (photos, documents)"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -334,6 +515,25 @@ class PaymentReceipt(models.Model):
         help_text="Prenez une photo du reçu de paiement"
     )
 
+    # Versions produites par process_receipts (partnerships/receipts.py)
+    receipt_thumbnail = models.ImageField(
+        upload_to='receipts/thumbs/%Y/%m/%d/',
+        blank=True,
+        verbose_name="Miniature du reçu"
+    )
+    receipt_original = models.ImageField(
+        upload_to='receipts/originals/%Y/%m/%d/',
+        blank=True,
+        verbose_name="Photo originale (si RECEIPT_KEEP_ORIGINAL)"
+    )
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Date de traitement de l'image")
+    processing_error = models.TextField(blank=True, verbose_name="Erreur de traitement")
+    # Bail du worker qui traite l'image : repris par un autre à son expiration
+    processing_claimed_until = models.DateTimeField(null=True, blank=True, verbose_name="Réservé pour traitement jusqu'au")
+
+    # SHA-256 de la photo envoyée (conservé après traitement) : détection des doublons
+    image_sha256 = models.CharField(max_length=64, blank=True, db_index=True, verbose_name="SHA-256 de la photo")
+
     # Montant saisi lors de l'upload
     amount_paid = models.DecimalField(
         max_digits=12,
@@ -355,10 +555,65 @@ class PaymentReceipt(models.Model):
         verbose_name = "Reçu de paiement"
         verbose_name_plural = "Reçus de paiement"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['processed_at', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Reçu {self.amount_paid} DA - {self.payment.partner.name} ({self.created_at.strftime('%d/%m/%Y')})"
 
+    @property
+    def preview(self):
+        """Image pour les listes : la miniature, ou l'image tant qu'elle n'est pas traitée"""
+        return self.receipt_thumbnail or self.receipt_image
+
+    @classmethod
+    def pending_processing(cls, limit=20):
+        """
+        Reçus dont l'image n'est pas encore traitée ni réservée par un worker
+        (ou dont le bail a expiré), verrouillés pour les workers concurrents
+        """
+        return cls.objects.select_for_update(skip_locked=True).filter(
+            Q(processing_claimed_until__isnull=True) | Q(processing_claimed_until__lte=timezone.now()),
+            processed_at__isnull=True,
+        ).order_by('created_at')[:limit]
+
+    @classmethod
+    def claim_processing(cls, limit=20, lease=None):
+        """
+        Réserve jusqu'à `limit` reçus à traiter, dans une transaction courte
+        (bail de `lease` secondes, RECEIPT_PROCESSING_LEASE). Le traitement
+        des images se fait ensuite hors transaction.
+        """
+        lease = settings.RECEIPT_PROCESSING_LEASE if lease is None else lease
+        claimed_until = timezone.now() + timedelta(seconds=lease)
+        with transaction.atomic():
+            receipts = list(cls.pending_processing(limit))
+            cls.objects.filter(pk__in=[receipt.pk for receipt in receipts]).update(
+                processing_claimed_until=claimed_until,
+            )
+        for receipt in receipts:
+            receipt.processing_claimed_until = claimed_until
+        return receipts
+
+    @classmethod
+    def find_duplicate(cls, partner, amount_paid, image_sha256, window=None):
+        """
+        Reçu récent du partenaire avec le même montant et la même photo, ou None.
+
+        Cas typique : double clic ou nouvel envoi après une erreur de validation.
+        """
+        if not image_sha256:
+            return None
+        if window is None:
+            window = timedelta(hours=settings.RECEIPT_DUPLICATE_WINDOW_HOURS)
+        return cls.objects.filter(
+            payment__partner=partner,
+            amount_paid=amount_paid,
+            image_sha256=image_sha256,
+            created_at__gte=timezone.now() - window,
+        ).select_related('payment').order_by('-created_at').first()
+
 
 class PaymentCheckpoint(models.Model):
     """Modèle pour tracker les points de contrôle des paiements"""
@@ -406,6 +661,271 @@ class PaymentCheckpoint(models.Model):
         return f"{self.partner.name} - {self.amount_paid} DA ({date_str})"
 
 
+class PartnerBalance(models.Model):
+    """
+    Solde dénormalisé d'un partenaire.
+    Tenu à jour par les signaux (élèves, checkpoints, paiements) pour que
+    la lecture de l'état financier d'un partenaire soit une simple ligne.
+    """
+    partner = models.OneToOneField(
+        Partner,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='balance',
+        verbose_name="Partenaire"
+    )
+    students_pending = models.PositiveIntegerField(default=0, verbose_name="Élèves en attente")
+    students_confirmed = models.PositiveIntegerField(default=0, verbose_name="Élèves confirmés (total)")
+    students_confirmed_since_checkpoint = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Élèves confirmés depuis le dernier checkpoint"
+    )
+    total_paid = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Total payé via checkpoints (DA)"
+    )
+    total_payments_completed = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Total des paiements complétés (DA)"
+    )
+    last_checkpoint_date = models.DateTimeField(null=True, blank=True, verbose_name="Date du dernier checkpoint")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
+
+    class Meta:
+        verbose_name = "Solde partenaire"
+        verbose_name_plural = "Soldes partenaires"
+
+    def __str__(self):
+        return f"Solde {self.partner_id} - {self.students_confirmed_since_checkpoint} confirmé(s)"
+
+    @classmethod
+    def refresh(cls, partner_id):
+        """Recalcule le solde d'un partenaire et l'enregistre (3 agrégats + 1 écriture)"""
+        from students.models import Student
+
+        checkpoints = PaymentCheckpoint.objects.filter(partner_id=partner_id).aggregate(
+            total=Sum('amount_paid'),
+            last_date=Max('checkpoint_date'),
+        )
+        last_date = checkpoints['last_date']
+
+        confirmed_since = Q(is_confirmed=True)
+        if last_date:
+            confirmed_since &= Q(confirmed_at__gt=last_date)
+        students = Student.objects.filter(partner_id=partner_id).aggregate(
+            pending=Count('id', filter=Q(is_confirmed=False)),
+            confirmed=Count('id', filter=Q(is_confirmed=True)),
+            confirmed_since=Count('id', filter=confirmed_since),
+        )
+
+        payments = Payment.objects.filter(
+            partner_id=partner_id, status=Payment.COMPLETED
+        ).aggregate(total=Sum('amount'))
+
+        ledger, _ = cls.objects.update_or_create(
+            partner_id=partner_id,
+            defaults={
+                'students_pending': students['pending'],
+                'students_confirmed': students['confirmed'],
+                'students_confirmed_since_checkpoint': students['confirmed_since'],
+                'total_paid': checkpoints['total'] or 0,
+                'total_payments_completed': payments['total'] or 0,
+                'last_checkpoint_date': last_date,
+            }
+        )
+        return ledger
+
+
+class DailyPartnerStats(models.Model):
+    """
+    Agrégat journalier des inscriptions et confirmations par partenaire, code et programme.
+    Rempli par la commande refresh_daily_stats ; les rapports lisent cette table
+    plutôt que de parcourir tous les étudiants.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    day = models.DateField(verbose_name="Jour")
+    partner = models.ForeignKey(
+        Partner,
+        on_delete=models.CASCADE,
+        related_name='daily_stats',
+        verbose_name="Partenaire"
+    )
+    code = models.CharField(max_length=100, blank=True, verbose_name="Code de parrainage")
+    partnership_code = models.ForeignKey(
+        PartnershipCode,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='daily_stats',
+        verbose_name="Code partenaire"
+    )
+    program = models.ForeignKey(
+        'students.Program',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='daily_stats',
+        verbose_name="Programme"
+    )
+    registrations = models.PositiveIntegerField(default=0, verbose_name="Inscriptions")
+    confirmations = models.PositiveIntegerField(default=0, verbose_name="Confirmations")
+    commission_earned = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Commission acquise (DA)"
+    )
+    refreshed_at = models.DateTimeField(verbose_name="Date de calcul")
+
+    class Meta:
+        verbose_name = "Statistique journalière"
+        verbose_name_plural = "Statistiques journalières"
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['day']),
+            models.Index(fields=['partner', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.partner_id} ({self.code})"
+
+    @classmethod
+    def last_refresh(cls):
+        """Date du dernier calcul (None si la table n'a jamais été calculée)"""
+        return DailyStatsWatermark.objects.values_list('refreshed_at', flat=True).first()
+
+    @classmethod
+    def set_last_refresh(cls, refreshed_at):
+        DailyStatsWatermark.objects.update_or_create(pk=1, defaults={'refreshed_at': refreshed_at})
+
+    @classmethod
+    def mark_dirty(cls, *values):
+        """Note les jours (dates ou datetimes) que des élèves viennent de quitter"""
+        days = {
+            timezone.localdate(value) if isinstance(value, datetime) else value
+            for value in values if value is not None
+        }
+        DailyStatsDirtyDay.objects.bulk_create(
+            [DailyStatsDirtyDay(day=day) for day in days], ignore_conflicts=True,
+        )
+
+    @classmethod
+    def touched_days(cls, since):
+        """
+        Jours à recalculer : jours d'inscription ou de confirmation des
+        étudiants modifiés depuis `since`, plus les jours notés par mark_dirty
+        (déconfirmation, suppression, changement de date).
+        """
+        from students.models import Student
+
+        touched = Student.objects.filter(updated_at__gt=since, partner__isnull=False)
+        days = set(DailyStatsDirtyDay.objects.values_list('day', flat=True))
+        for field in ('enrollment_date', 'confirmed_at'):
+            days.update(
+                touched.filter(**{f'{field}__isnull': False}).annotate(
+                    day=TruncDate(field)
+                ).order_by().values_list('day', flat=True).distinct()
+            )
+        return days
+
+    @classmethod
+    def refresh_days(cls, days=None, refreshed_at=None):
+        """
+        Recalcule les lignes des jours donnés (tous les jours si `days` est None).
+        Les confirmations sont datées par `confirmed_at` de l'étudiant.
+        Retourne le nombre de lignes écrites.
+        """
+        from students.models import Student
+
+        refreshed_at = refreshed_at or timezone.now()
+        students = Student.objects.filter(partner__isnull=False)
+        registrations = students.annotate(day=TruncDate('enrollment_date'))
+        confirmations = students.filter(is_confirmed=True).annotate(day=TruncDate('confirmed_at'))
+        existing = cls.objects.all()
+        if days is not None:
+            days = list(days)
+            registrations = registrations.filter(day__in=days)
+            confirmations = confirmations.filter(day__in=days)
+            existing = existing.filter(day__in=days)
+
+        group = ('day', 'partner_id', 'partnership_code_id', 'program_id')
+        rows = {}
+        for queryset, counter in ((registrations, 'registrations'), (confirmations, 'confirmations')):
+            grouped = queryset.values(*group, 'partner__commission_per_student').annotate(
+                total=Count('id')
+            ).order_by()
+            for row in grouped:
+                key = tuple(row[field] for field in group)
+                entry = rows.setdefault(key, {
+                    'registrations': 0,
+                    'confirmations': 0,
+                    'commission': row['partner__commission_per_student'],
+                })
+                entry[counter] = row['total']
+
+        codes = dict(
+            PartnershipCode.objects.filter(
+                pk__in={key[2] for key in rows if key[2]}
+            ).values_list('id', 'code')
+        )
+
+        stats = [
+            cls(
+                day=day,
+                partner_id=partner_id,
+                code=codes.get(partnership_code_id, ''),
+                partnership_code_id=partnership_code_id,
+                program_id=program_id,
+                registrations=entry['registrations'],
+                confirmations=entry['confirmations'],
+                commission_earned=entry['commission'] * entry['confirmations'],
+                refreshed_at=refreshed_at,
+            )
+            for (day, partner_id, partnership_code_id, program_id), entry in rows.items()
+        ]
+
+        with transaction.atomic():
+            existing.delete()
+            cls.objects.bulk_create(stats, batch_size=500)
+            dirty = DailyStatsDirtyDay.objects.all()
+            if days is not None:
+                dirty = dirty.filter(day__in=days)
+            dirty.delete()
+        return len(stats)
+
+
+class DailyStatsDirtyDay(models.Model):
+    """
+    Jour de DailyPartnerStats à recalculer, noté par les signaux quand un élève
+    quitte ce jour : déconfirmation, suppression ou changement de date. Ces
+    élèves n'y sont plus rattachés par leurs dates actuelles.
+    """
+    day = models.DateField(primary_key=True, verbose_name="Jour")
+
+    class Meta:
+        verbose_name = "Jour à recalculer"
+        verbose_name_plural = "Jours à recalculer"
+
+    def __str__(self):
+        return str(self.day)
+
+
+class DailyStatsWatermark(models.Model):
+    """Date du dernier calcul de DailyPartnerStats (une seule ligne, même si la table est vide)"""
+    refreshed_at = models.DateTimeField(verbose_name="Date du dernier calcul")
+
+    class Meta:
+        verbose_name = "Dernier calcul des statistiques"
+        verbose_name_plural = "Dernier calcul des statistiques"
+
+    def __str__(self):
+        return str(self.refreshed_at)
+
+
 class PartnershipRequest(models.Model):
     """Modèle pour les demandes de partenariat depuis la page de contact"""
 
@@ -447,3 +967,6 @@ class PartnershipRequest(models.Model):
 
 # Alias pour compatibilité backwards - Library est maintenant Partner
 Library = Partner
+
+# Enregistrer le modèle d'audit dans l'app partnerships
+from .models_audit import AuditLog  # noqa: E402,F401
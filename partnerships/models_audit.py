@@ -1,11 +1,16 @@
 """
 Modèles d'audit pour tracker les actions importantes du système.
 Essentiels pour traçabilité et compliance.
+
+Les logs sont écrits après le commit, en bulk_create (voir partnerships/audit.py).
 """
 import uuid
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from . import audit
 
 
 class AuditLog(models.Model):
@@ -58,7 +63,8 @@ class AuditLog(models.Model):
     # Métadonnées
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
-    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # default plutôt qu'auto_now_add : date de l'action, pas de l'écriture différée
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
         ordering = ['-created_at']
@@ -75,10 +81,17 @@ class AuditLog(models.Model):
     def __str__(self):
         return f"{self.get_action_display()} - {self.created_at}"
 
+    @classmethod
+    def _record(cls, **fields):
+        """Log écrit après le commit de la transaction en cours ; retourne l'entrée (non encore en base)"""
+        entry = cls(**fields)
+        audit.record(entry)
+        return entry
+
     @classmethod
     def log_student_confirmation(cls, student, user=None):
         """Log quand un étudiant est confirmé"""
-        return cls.objects.create(
+        return cls._record(
             action='student_confirmed',
             description=f"Étudiant {student.full_name} confirmé par {user}",
             user=user,
@@ -86,14 +99,35 @@ class AuditLog(models.Model):
             student_name=student.full_name,
             student_email=student.email,
             partner_id=student.partner_id,
-            partner_name=student.partner.name if student.partner else None,
-            new_values={'is_confirmed': True, 'confirmed_at': str(__import__('django.utils.timezone', fromlist=['now']).now())}
+            partner_name=student.partner.name if student.partner else '',
+            new_values={'is_confirmed': True, 'confirmed_at': str(student.confirmed_at)}
         )
 
+    @classmethod
+    def log_student_confirmations(cls, students, confirmed_at, user=None):
+        """
+        Log d'une confirmation groupée, écrite en un bulk_create après le commit.
+        `students` : dicts avec id, full_name, email, partner_id et partner__name.
+        """
+        return audit.record(*[
+            cls(
+                action='student_confirmed',
+                description=f"Étudiant {student['full_name']} confirmé par {user}",
+                user=user,
+                student_id=student['id'],
+                student_name=student['full_name'] or '',
+                student_email=student['email'],
+                partner_id=student['partner_id'],
+                partner_name=student['partner__name'] or '',
+                new_values={'is_confirmed': True, 'confirmed_at': str(confirmed_at)},
+            )
+            for student in students
+        ])
+
     @classmethod
     def log_payment_creation(cls, payment, user=None):
         """Log quand un paiement est créé"""
-        return cls.objects.create(
+        return cls._record(
             action='payment_created',
             description=f"Paiement de {payment.amount} DA créé pour {payment.partner.name}",
             user=user,
@@ -107,7 +141,7 @@ class AuditLog(models.Model):
     @classmethod
     def log_payment_completion(cls, payment, user=None):
         """Log quand un paiement est marqué comme complété"""
-        return cls.objects.create(
+        return cls._record(
             action='payment_completed',
             description=f"Paiement {payment.id} validé pour {payment.partner.name}",
             user=user,
@@ -116,13 +150,13 @@ class AuditLog(models.Model):
             payment_id=payment.id,
             payment_amount=payment.amount,
             old_values={'status': 'pending'},
-            new_values={'status': 'completed', 'completed_at': str(__import__('django.utils.timezone', fromlist=['now']).now())}
+            new_values={'status': 'completed', 'completed_at': str(payment.completed_at or timezone.now())}
         )
 
     @classmethod
     def log_receipt_upload(cls, receipt, user=None):
         """Log quand un reçu est uploadé"""
-        return cls.objects.create(
+        return cls._record(
             action='receipt_uploaded',
             description=f"Reçu uploadé pour paiement {receipt.payment_id}",
             user=user,
@@ -0,0 +1,53 @@
+"""
+Pagination par curseur (keyset) des listes d'élèves.
+
+Les élèves sont triés par (enrollment_date, id) décroissants. Le curseur encode
+la position du dernier élève affiché : la page suivante filtre sur cette
+position au lieu d'un OFFSET, son coût reste constant quelle que soit la
+profondeur de l'historique.
+"""
+import base64
+import binascii
+import uuid
+from datetime import datetime
+
+from django.core.exceptions import BadRequest
+from django.db.models import Q
+
+STUDENTS_PAGE_SIZE = 50
+STUDENTS_ORDERING = ('-enrollment_date', '-id')
+
+
+def encode_cursor(student):
+    """Curseur opaque pointant juste après `student`"""
+    position = f'{student.enrollment_date.isoformat()}|{student.id}'
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Retourne (enrollment_date, id) ou lève BadRequest si le curseur est invalide"""
+    try:
+        enrollment_date, student_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(enrollment_date), uuid.UUID(student_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise BadRequest('Curseur de pagination invalide')
+
+
+def split_page(students, page_size=STUDENTS_PAGE_SIZE):
+    """Découpe `page_size + 1` élèves en (page, curseur suivant ou None)"""
+    students = list(students)
+    if len(students) > page_size:
+        return students[:page_size], encode_cursor(students[page_size - 1])
+    return students, None
+
+
+def paginate_students(queryset, cursor=None, page_size=STUDENTS_PAGE_SIZE):
+    """Une page d'élèves après `cursor` : retourne (élèves, curseur suivant ou None)"""
+    queryset = queryset.order_by(*STUDENTS_ORDERING)
+    if cursor:
+        enrollment_date, student_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(enrollment_date__lt=enrollment_date) | Q(enrollment_date=enrollment_date, id__lt=student_id)
+        )
+    # Un élève de plus pour savoir s'il reste une page
+    return split_page(queryset[:page_size + 1], page_size)
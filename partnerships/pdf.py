@@ -0,0 +1,169 @@
+"""
+Rendu des PDF des codes partenaires (affiche A4 : logo, code, QR code).
+
+Partagé par GenerateCodePDFView, GenerateCodesPDFView (toutes les affiches
+d'un partenaire dans un seul document) et les commandes generate_qrcodes et
+generate_codes_sheet. Le rendu se fait entièrement en mémoire : le logo est
+décodé une fois par processus et les PDF terminés sont mis en cache par
+empreinte (pdf_key).
+"""
+import hashlib
+import io
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import reverse
+
+from .qrcodes import ERROR_CORRECT_M, get_qr_png, qr_key
+
+LOGO_PATH = os.path.join(settings.BASE_DIR, 'logo_torii.png')
+
+# Paramètres du QR code imprimé sur le PDF
+PDF_QR_PARAMS = {'error_correction': ERROR_CORRECT_M, 'box_size': 10, 'border': 2, 'version': 2}
+
+# À incrémenter à chaque changement de mise en page ou de logo : invalide les PDF déjà générés
+PDF_TEMPLATE_VERSION = 1
+
+
+def registration_url(base_url, code):
+    """URL d'inscription avec le code pré-rempli (contenu du QR code)"""
+    return f"{base_url.rstrip('/')}{reverse('student-register')}?code={code}"
+
+
+def pdf_key(code, partner_name, url):
+    """Empreinte de tout ce qui change le contenu du PDF"""
+    params = f'{code}\0{partner_name}\0{qr_key(url, **PDF_QR_PARAMS)}\0{PDF_TEMPLATE_VERSION}'
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+def code_pdf_key(code, partner_name, base_url):
+    """Clé (et ETag) du PDF d'un code, calculée sans rendre ni lire le cache"""
+    return pdf_key(code, partner_name, registration_url(base_url, code))
+
+
+def codes_pdf_key(codes, base_url):
+    """Clé du PDF multi-pages : combine les pdf_key de chaque page, dans l'ordre"""
+    digest = hashlib.sha256()
+    for code, partner_name in codes:
+        digest.update(code_pdf_key(code, partner_name, base_url).encode())
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=1)
+def logo_reader():
+    """Logo décodé une seule fois par processus (None si le fichier est absent)"""
+    from reportlab.lib.utils import ImageReader
+
+    if not os.path.exists(LOGO_PATH):
+        return None
+    with open(LOGO_PATH, 'rb') as f:
+        reader = ImageReader(io.BytesIO(f.read()))
+    # Décoder maintenant : les rendus suivants réutilisent les pixels
+    reader.getRGBData()
+    return reader
+
+
+def _draw_code_page(c, logo, code, partner_name, qr_png):
+    """Dessine l'affiche d'un code sur la page courante du canvas"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.lib.utils import ImageReader
+
+    width, height = A4
+
+    # Logo en haut à gauche (très gros)
+    if logo is not None:
+        logo_size_pdf = 5 * cm
+        c.drawImage(logo, 0.5*cm, height - 5.5*cm, width=logo_size_pdf, height=logo_size_pdf)
+
+    # Titre
+    c.setFont("Helvetica-Bold", 24)
+    c.drawCentredString(width/2, height - 6*cm, "CODE PARTENAIRE")
+
+    # Sous-titre avec Institut Torii
+    c.setFont("Helvetica", 14)
+    c.drawCentredString(width/2, height - 7*cm, "Institut Torii")
+
+    # Code (gros)
+    c.setFont("Helvetica-Bold", 48)
+    c.drawCentredString(width/2, height - 10.5*cm, code)
+
+    # QR Code
+    qr_size = 7*cm
+    qr_x = (width - qr_size) / 2
+    qr_y = height - 14*cm
+    c.drawImage(ImageReader(io.BytesIO(qr_png)), qr_x, qr_y, width=qr_size, height=qr_size)
+
+    # Description
+    c.setFont("Helvetica", 12)
+    c.drawCentredString(width/2, qr_y - 1*cm, f"Partenaire: {partner_name}")
+    c.drawCentredString(width/2, qr_y - 1.5*cm, "Scannez le code QR pour vous inscrire")
+
+
+def render_codes_pdf(pages):
+    """
+    Rend un PDF d'une page par code ; `pages` est une suite de
+    (code, nom du partenaire, png du QR). Retourne les octets du PDF.
+
+    reportlab identifie les images par leur contenu : le logo, dessiné sur
+    chaque page, n'est embarqué qu'une fois dans le document.
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+
+    pdf_buffer = io.BytesIO()
+    c = canvas.Canvas(pdf_buffer, pagesize=A4)
+    logo = logo_reader()
+    for code, partner_name, qr_png in pages:
+        _draw_code_page(c, logo, code, partner_name, qr_png)
+        c.showPage()
+    c.save()
+    return pdf_buffer.getvalue()
+
+
+def render_code_pdf(code, partner_name, qr_png):
+    """Rend le PDF d'un code partenaire ; retourne les octets du PDF"""
+    return render_codes_pdf([(code, partner_name, qr_png)])
+
+
+def get_code_pdf(code, partner_name, base_url):
+    """
+    PDF d'un code partenaire, rendu seulement au premier appel.
+
+    Le cache est indexé par pdf_key (code, partenaire, URL d'inscription, version
+    du modèle). Retourne (clé, pdf).
+    """
+    url = registration_url(base_url, code)
+    key = code_pdf_key(code, partner_name, base_url)
+    cache = caches[getattr(settings, 'QR_CACHE_ALIAS', 'default')]
+
+    pdf = cache.get(f'code-pdf:{key}')
+    if pdf is None:
+        _, qr_png, _ = get_qr_png(url, **PDF_QR_PARAMS)
+        pdf = render_code_pdf(code, partner_name, qr_png)
+        cache.set(f'code-pdf:{key}', pdf, timeout=getattr(settings, 'QR_CACHE_TIMEOUT', None))
+    return key, pdf
+
+
+def get_codes_pdf(codes, base_url):
+    """
+    PDF multi-pages de plusieurs codes (une page par code, dans l'ordre donné).
+
+    `codes` est une suite de (code, nom du partenaire). La clé combine les
+    pdf_key de chaque page : le document n'est rendu à nouveau que si l'un des
+    codes change. Retourne (clé, pdf).
+    """
+    codes = list(codes)
+    key = codes_pdf_key(codes, base_url)
+    cache = caches[getattr(settings, 'QR_CACHE_ALIAS', 'default')]
+
+    pdf = cache.get(f'codes-pdf:{key}')
+    if pdf is None:
+        pdf = render_codes_pdf(
+            (code, partner_name, get_qr_png(registration_url(base_url, code), **PDF_QR_PARAMS)[1])
+            for code, partner_name in codes
+        )
+        cache.set(f'codes-pdf:{key}', pdf, timeout=getattr(settings, 'QR_CACHE_TIMEOUT', None))
+    return key, pdf
@@ -0,0 +1,121 @@
+"""
+Cache des images QR code, adressé par contenu.
+
+La clé est le sha256 de (URL encodée, correction d'erreur, taille des modules,
+marge, version) : un même QR n'est rendu qu'une fois. Les octets PNG sont
+gardés dans le cache Django (QR_CACHE_BACKEND = "cache") ou dans le stockage
+média (QR_CACHE_BACKEND = "storage", fichiers qrcodes/<clé>.png). La clé sert
+aussi d'ETag : une requête conditionnelle répond 304 sans rendre l'image.
+"""
+import hashlib
+import io
+import time
+
+import qrcode
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+ERROR_CORRECT_L = qrcode.constants.ERROR_CORRECT_L
+ERROR_CORRECT_M = qrcode.constants.ERROR_CORRECT_M
+ERROR_CORRECT_Q = qrcode.constants.ERROR_CORRECT_Q
+ERROR_CORRECT_H = qrcode.constants.ERROR_CORRECT_H
+
+
+def qr_key(payload, error_correction=ERROR_CORRECT_L, box_size=10, border=4, version=1):
+    """Clé (et ETag) du QR code : hash de tout ce qui change les pixels"""
+    params = f'{payload}\0{error_correction}\0{box_size}\0{border}\0{version}'
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+def render_qr_png(payload, error_correction=ERROR_CORRECT_L, box_size=10, border=4, version=1):
+    """Rend le QR code en PNG (sans cache)"""
+    qr = qrcode.QRCode(
+        version=version,
+        error_correction=error_correction,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _use_storage():
+    return getattr(settings, 'QR_CACHE_BACKEND', 'cache') == 'storage'
+
+
+def _cache():
+    return caches[getattr(settings, 'QR_CACHE_ALIAS', 'default')]
+
+
+def _storage_path(key):
+    return f'qrcodes/{key}.png'
+
+
+def _load(key):
+    """(png, date de création) depuis le cache ou le stockage, ou None"""
+    if _use_storage():
+        path = _storage_path(key)
+        if not default_storage.exists(path):
+            return None
+        with default_storage.open(path, 'rb') as f:
+            png = f.read()
+        return png, default_storage.get_modified_time(path).timestamp()
+    return _cache().get(f'qrcode:{key}')
+
+
+def _store(key, png):
+    created_at = time.time()
+    if _use_storage():
+        default_storage.save(_storage_path(key), ContentFile(png))
+    else:
+        _cache().set(f'qrcode:{key}', (png, created_at), timeout=getattr(settings, 'QR_CACHE_TIMEOUT', None))
+    return png, created_at
+
+
+def get_qr_png(payload, **params):
+    """
+    PNG du QR code, rendu seulement au premier appel.
+
+    Retourne (clé, png, date de création en timestamp).
+    """
+    key = qr_key(payload, **params)
+    cached = _load(key)
+    if cached is None:
+        cached = _store(key, render_qr_png(payload, **params))
+    png, created_at = cached
+    return key, png, created_at
+
+
+def qr_response(request, payload, filename=None, **params):
+    """
+    Réponse HTTP du QR code avec ETag / Last-Modified.
+
+    Un If-None-Match correspondant répond 304 sans lire ni rendre l'image.
+    """
+    key = qr_key(payload, **params)
+    etag = quote_etag(key)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        key, png, created_at = get_qr_png(payload, **params)
+        response = get_conditional_response(request, etag=etag, last_modified=int(created_at))
+    if response is None:
+        response = HttpResponse(png, content_type='image/png')
+        response['Last-Modified'] = http_date(created_at)
+        if filename:
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+
+    response['ETag'] = etag
+    # Le contenu d'une URL ne change que si le lien d'inscription change : revalider chaque heure
+    patch_cache_control(response, private=True, max_age=3600)
+    return response
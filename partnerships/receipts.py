@@ -0,0 +1,138 @@
+"""
+Traitement des photos de reçus, hors du cycle requête/réponse.
+
+PaymentReceiptUploadView enregistre la photo telle quelle ; la commande
+`process_receipts` la redresse (orientation EXIF), la réduit à
+RECEIPT_MAX_SIZE, la recompresse (RECEIPT_FORMAT / RECEIPT_QUALITY) et produit
+une miniature pour les listes. L'original n'est gardé que si
+RECEIPT_KEEP_ORIGINAL est activé.
+
+Tous les fichiers passent par le store adressé par contenu (ReceiptBlob) :
+une même photo, ou une même version traitée, n'est stockée qu'une fois.
+"""
+import hashlib
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import PaymentReceipt, ReceiptBlob
+from .uploads import file_sha256
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def output_format():
+    """Format de sortie : WebP si Pillow le supporte, sinon JPEG"""
+    fmt = settings.RECEIPT_FORMAT.upper()
+    if fmt == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return fmt if fmt in EXTENSIONS else 'JPEG'
+
+
+def render_image(image, max_size, fmt, quality):
+    """Copie de `image` réduite à max_size (plus grand côté), encodée en `fmt`"""
+    image = image.copy()
+    image.thumbnail((max_size, max_size), Image.LANCZOS, reducing_gap=3.0)
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, quality=quality, optimize=fmt == 'JPEG')
+    return buffer.getvalue()
+
+
+def process_image(f, max_size, thumbnail_size, fmt, quality):
+    """Redresse, réduit et recompresse la photo `f` ; retourne (image, miniature) en octets"""
+    with Image.open(f) as image:
+        # JPEG : décodage directement à une résolution réduite (1/2, 1/4, 1/8)
+        image.draft('RGB', (max_size, max_size))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        main = render_image(image, max_size, fmt, quality)
+        thumbnail = render_image(image, thumbnail_size, fmt, quality)
+    return main, thumbnail
+
+
+def store_receipt_image(f, sha256=None):
+    """Enregistre la photo `f` dans le store ; retourne (nom du fichier, SHA-256)"""
+    sha256 = sha256 or file_sha256(f)
+    extension = os.path.splitext(f.name or '')[1].lstrip('.')
+    return ReceiptBlob.store(f, sha256, extension), sha256
+
+
+def _store_bytes(data, extension):
+    return ReceiptBlob.store(ContentFile(data), hashlib.sha256(data).hexdigest(), extension)
+
+
+def process_receipt(receipt):
+    """Traite l'image d'un reçu et enregistre les nouvelles versions"""
+    fmt = output_format()
+    extension = EXTENSIONS[fmt]
+    original = receipt.receipt_image
+    original_name = original.name
+
+    with original.open('rb') as f:
+        if not receipt.image_sha256:
+            receipt.image_sha256 = file_sha256(f)
+        main, thumbnail = process_image(
+            f,
+            max_size=settings.RECEIPT_MAX_SIZE,
+            thumbnail_size=settings.RECEIPT_THUMBNAIL_SIZE,
+            fmt=fmt,
+            quality=settings.RECEIPT_QUALITY,
+        )
+
+    # Écritures du reçu dans leur propre transaction : en cas d'échec (stockage ou
+    # enregistrement), les références prises sont annulées avec elle et les
+    # fichiers, écrits après le commit, ne le sont jamais
+    previous = (receipt.receipt_image.name, receipt.receipt_thumbnail.name, receipt.receipt_original.name)
+    try:
+        with transaction.atomic():
+            main_name = _store_bytes(main, extension)
+            thumbnail_name = _store_bytes(thumbnail, extension)
+            receipt.receipt_image.name, receipt.receipt_thumbnail.name = main_name, thumbnail_name
+            if settings.RECEIPT_KEEP_ORIGINAL:
+                # La référence passe de receipt_image à receipt_original
+                receipt.receipt_original.name = original_name
+            receipt.processed_at = timezone.now()
+            receipt.processing_claimed_until = None
+            receipt.save()
+            if not settings.RECEIPT_KEEP_ORIGINAL:
+                ReceiptBlob.release(original_name)
+    except Exception:
+        receipt.receipt_image.name, receipt.receipt_thumbnail.name, receipt.receipt_original.name = previous
+        receipt.processed_at = None
+        raise
+
+
+def process_pending_receipts(limit=20):
+    """
+    Traite un lot de reçus en attente ; retourne (traités, échecs).
+
+    Le lot est réservé dans une transaction courte (claim_processing) ; les
+    images sont décodées et encodées hors transaction, et les écritures de
+    chaque reçu ont leur propre transaction.
+
+    Une image illisible est marquée en erreur (processing_error) et garde sa
+    photo d'origine : elle n'est pas retentée.
+    """
+    processed = failed = 0
+    for receipt in PaymentReceipt.claim_processing(limit):
+        try:
+            process_receipt(receipt)
+        except Exception as e:
+            logger.exception("Traitement du reçu %s impossible", receipt.pk)
+            receipt.processing_error = str(e) or e.__class__.__name__
+            receipt.processed_at = timezone.now()
+            receipt.processing_claimed_until = None
+            receipt.save(update_fields=['processing_error', 'processed_at', 'processing_claimed_until'])
+            failed += 1
+        else:
+            processed += 1
+    return processed, failed
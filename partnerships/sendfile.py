@@ -0,0 +1,124 @@
+"""
+Envoi de fichiers privés (reçus) après contrôle d'accès.
+
+Selon RECEIPT_SENDFILE_BACKEND, le fichier est confié au serveur frontal :
+  - "x-sendfile"       : en-tête X-Sendfile avec le chemin disque (Apache mod_xsendfile)
+  - "x-accel-redirect" : en-tête X-Accel-Redirect vers RECEIPT_SENDFILE_PREFIX (nginx, location internal)
+Sinon, ou si le stockage n'a pas de chemin disque, Django envoie le fichier
+lui-même (FileResponse) en gérant les requêtes Range.
+
+Le serveur frontal gère Range pour les deux en-têtes ; ETag (fort, fourni
+par l'appelant) et If-None-Match sont traités ici dans tous les cas.
+"""
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import content_disposition_header, parse_etags
+
+SENDFILE_HEADERS = {
+    'x-sendfile': 'X-Sendfile',
+    'x-accel-redirect': 'X-Accel-Redirect',
+}
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    (début, fin incluse) d'une requête Range à un seul intervalle, None pour
+    envoyer tout le fichier, ou False si l'intervalle est hors du fichier.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        # Absente, mal formée ou à plusieurs intervalles : fichier complet
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N : les N derniers octets
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _sendfile_target(storage, name, backend):
+    """Chemin disque (X-Sendfile) ou URL interne (X-Accel-Redirect) du fichier, ou None"""
+    if backend == 'x-sendfile':
+        try:
+            return storage.path(name)
+        except NotImplementedError:
+            return None
+    prefix = settings.RECEIPT_SENDFILE_PREFIX.rstrip('/')
+    # URI encodée : nginx décode le chemin (espaces, accents des anciens reçus)
+    return f'{prefix}/{quote(name)}'
+
+
+def _read_range(f, start, length, chunk_size=64 * 1024):
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def serve_file(request, storage, name, etag, filename=None):
+    """Réponse pour le fichier `name` de `storage`, identifié par l'ETag fort `etag`"""
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    backend = settings.RECEIPT_SENDFILE_BACKEND.lower()
+    target = _sendfile_target(storage, name, backend) if backend in SENDFILE_HEADERS else None
+
+    if target is not None:
+        response = HttpResponse(content_type=content_type)
+        response[SENDFILE_HEADERS[backend]] = target
+    else:
+        size = storage.size(name)
+        byte_range = None
+        # If-Range : l'intervalle n'est valable que pour cette version du fichier
+        if request.headers.get('If-Range', etag) == etag:
+            byte_range = parse_range(request.headers.get('Range'), size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        f = storage.open(name, 'rb')
+        if byte_range is None:
+            response = FileResponse(f, content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _read_range(f, start, end - start + 1), status=206, content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    if filename:
+        response['Content-Disposition'] = content_disposition_header(False, filename)
+    # Privé : jamais dans un cache partagé, revalidé par ETag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,96 @@
+"""
+Signaux qui maintiennent le solde dénormalisé des partenaires (PartnerBalance),
+invalident le cache des stats des dashboards partenaires et notent les jours
+de DailyPartnerStats qu'un élève quitte.
+"""
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_partner_stats
+from .models import DailyPartnerStats, Partner, PartnerBalance, Payment, PaymentCheckpoint, PaymentReceipt, ReceiptBlob
+
+
+def refresh_partner_balance(partner_id, instance=None):
+    """Recalcule le solde et met à jour le partenaire déjà chargé sur l'instance"""
+    if not partner_id:
+        return None
+
+    invalidate_partner_stats(partner_id)
+    ledger = PartnerBalance.refresh(partner_id)
+
+    # Éviter qu'un partenaire en mémoire garde un ancien solde en cache
+    if instance is not None:
+        partner_field = instance._meta.get_field('partner')
+        if partner_field.is_cached(instance) and instance.partner is not None:
+            PartnerBalance.partner.field.remote_field.set_cached_value(instance.partner, ledger)
+    return ledger
+
+
+# Champs qui placent un élève dans une ligne de DailyPartnerStats
+DAILY_STATS_FIELDS = ('partner_id', 'partnership_code_id', 'program_id', 'enrollment_date', 'confirmed_at')
+
+
+@receiver(post_init, sender='students.Student')
+def remember_student_partner(sender, instance, **kwargs):
+    """Mémorise le partenaire et les dates d'origine pour détecter leurs changements"""
+    instance._original_partner_id = instance.__dict__.get('partner_id')
+    instance._original_daily_stats = {field: instance.__dict__.get(field) for field in DAILY_STATS_FIELDS}
+
+
+@receiver(post_save, sender='students.Student')
+def student_saved(sender, instance, created, **kwargs):
+    """Inscription, confirmation ou changement de statut d'un élève"""
+    original_partner_id = getattr(instance, '_original_partner_id', None)
+    if original_partner_id and original_partner_id != instance.partner_id:
+        refresh_partner_balance(original_partner_id)
+    refresh_partner_balance(instance.partner_id, instance)
+    instance._original_partner_id = instance.partner_id
+
+    # Déconfirmation, changement de partenaire ou de date : les anciens jours
+    # ne se retrouvent plus par les dates actuelles de l'élève
+    # (__dict__ : ne pas charger les champs différés)
+    original = getattr(instance, '_original_daily_stats', {})
+    current = {field: instance.__dict__.get(field) for field in DAILY_STATS_FIELDS}
+    if not created and original != current:
+        DailyPartnerStats.mark_dirty(original.get('enrollment_date'), original.get('confirmed_at'))
+    instance._original_daily_stats = current
+
+
+@receiver(post_delete, sender='students.Student')
+def student_deleted(sender, instance, **kwargs):
+    refresh_partner_balance(instance.partner_id, instance)
+    DailyPartnerStats.mark_dirty(instance.enrollment_date, instance.confirmed_at)
+
+
+@receiver(post_save, sender=PaymentCheckpoint)
+@receiver(post_delete, sender=PaymentCheckpoint)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def payment_changed(sender, instance, **kwargs):
+    """Nouveau checkpoint ou paiement : le solde du partenaire change"""
+    # Suppression en cascade du partenaire : son solde part avec lui
+    if isinstance(kwargs.get('origin'), Partner):
+        return
+    refresh_partner_balance(instance.partner_id, instance)
+
+
+@receiver(post_save, sender=PaymentReceipt)
+@receiver(post_delete, sender=PaymentReceipt)
+def receipt_changed(sender, instance, **kwargs):
+    """Les reçus apparaissent dans l'historique des paiements du partenaire"""
+    partner_id = Payment.objects.filter(pk=instance.payment_id).values_list('partner_id', flat=True).first()
+    invalidate_partner_stats(partner_id)
+
+
+@receiver(post_delete, sender=PaymentReceipt)
+def receipt_deleted(sender, instance, **kwargs):
+    """Libère les fichiers du reçu dans le store adressé par contenu"""
+    for field in (instance.receipt_image, instance.receipt_thumbnail, instance.receipt_original):
+        ReceiptBlob.release(field.name)
+
+
+@receiver(post_save, sender=Partner)
+def partner_saved(sender, instance, created, **kwargs):
+    """Une commission modifiée change tous les montants affichés"""
+    if not created:
+        invalidate_partner_stats(instance.pk)
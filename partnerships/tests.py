@@ -1,7 +1,50 @@
-from django.test import TestCase
-from partnerships.models import Partner, PartnershipCode, Payment
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import SkipFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import DatabaseError, connection, transaction
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from partnerships.models import (
+    AuditLog, DailyPartnerStats, DailyStatsDirtyDay, Partner, PartnerBalance, PartnershipCode, Payment,
+    PaymentCheckpoint, PaymentReceipt, ReceiptBlob,
+)
 from students.models import Student, Program
+from partnerships import audit
+from partnerships.audit import AuditLogMiddleware
+from partnerships.cache import cache_counters, get_cache
+from partnerships.pagination import STUDENTS_PAGE_SIZE, paginate_students
+from partnerships.qrcodes import ERROR_CORRECT_H, get_qr_png, qr_key, render_qr_png
+from partnerships.receipts import _store_bytes
+from partnerships.sendfile import _sendfile_target
+from partnerships.uploads import ReceiptUploadHandler
+from partnerships.views import (
+    AdminDashboardView, AdminPartnersManagementView, AdminStatsView, AdminStudentConfirmationView,
+    PaymentsDashboardView,
+)
+from PIL import Image
+from datetime import timedelta
 from decimal import Decimal
+from io import BytesIO, StringIO
+import csv
+import hashlib
+from unittest import skipUnless
+from unittest.mock import patch
+import importlib.util
+import os
+import tempfile
+import uuid
+
+# Les templates utilisent {% static %} : pas de manifest collectstatic pendant les tests
+TEST_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
 
 
 def create_completed_payment(partner, amount):
@@ -156,3 +199,1388 @@ class PaymentModelTests(TestCase):
         payment.refresh_from_db()
         self.assertEqual(payment.status, 'completed')
 
+
+class PartnerBalanceTests(TestCase):
+    """Tests du solde dénormalisé des partenaires"""
+
+    def setUp(self):
+        self.program = Program.objects.create(name="Ledger Program")
+        self.partner = Partner.objects.create(
+            name="Ledger Library",
+            email="ledger@lib.com",
+            commission_per_student=Decimal('1000.00'),
+            status='active'
+        )
+
+    def test_ledger_follows_confirmations(self):
+        """Test que le solde suit les inscriptions et confirmations"""
+        student = Student.objects.create(
+            full_name="Pending",
+            email="pending@test.com",
+            partner=self.partner,
+            program=self.program,
+        )
+        balance = PartnerBalance.objects.get(partner=self.partner)
+        self.assertEqual(balance.students_pending, 1)
+        self.assertEqual(balance.students_confirmed, 0)
+
+        student.is_confirmed = True
+        student.save()
+        balance.refresh_from_db()
+        self.assertEqual(balance.students_pending, 0)
+        self.assertEqual(balance.students_confirmed, 1)
+        self.assertEqual(balance.students_confirmed_since_checkpoint, 1)
+
+    def test_checkpoint_resets_window(self):
+        """Test qu'un checkpoint remet à zéro les confirmés depuis le checkpoint"""
+        Student.objects.create(
+            full_name="Confirmed",
+            email="confirmed@test.com",
+            partner=self.partner,
+            program=self.program,
+            is_confirmed=True
+        )
+        PaymentCheckpoint.objects.create(partner=self.partner, amount_paid=Decimal('1000.00'))
+
+        partner = Partner.objects.get(pk=self.partner.pk)
+        self.assertEqual(partner.total_students_confirmed, 0)
+        self.assertEqual(partner.total_students_confirmed_all_time, 1)
+        self.assertEqual(partner.total_paid, Decimal('1000.00'))
+
+    def test_edit_after_checkpoint_keeps_payment_window(self):
+        """Test qu'une modification après un checkpoint ne déplace pas l'élève dans la fenêtre"""
+        student = Student.objects.create(
+            full_name="Confirmed",
+            email="window@test.com",
+            partner=self.partner,
+            program=self.program,
+            is_confirmed=True
+        )
+        PaymentCheckpoint.objects.create(partner=self.partner, amount_paid=Decimal('1000.00'))
+        student.phone = "0550000000"
+        student.save()
+
+        partner = Partner.objects.get(pk=self.partner.pk)
+        self.assertEqual(partner.total_students_confirmed, 0)
+        self.assertEqual(Partner.objects.with_stats().get(pk=partner.pk).confirmed_since_checkpoint_count, 0)
+
+    def test_partner_change_refreshes_both_ledgers(self):
+        """Test qu'un changement de partenaire met à jour les deux soldes"""
+        other = Partner.objects.create(name="Other", email="other@lib.com")
+        student = Student.objects.create(
+            full_name="Mover",
+            email="mover@test.com",
+            partner=self.partner,
+            program=self.program,
+        )
+        student = Student.objects.get(pk=student.pk)
+        student.partner = other
+        student.save()
+
+        self.assertEqual(PartnerBalance.objects.get(partner=self.partner).students_pending, 0)
+        self.assertEqual(PartnerBalance.objects.get(partner=other).students_pending, 1)
+
+    def test_financial_state_is_single_lookup(self):
+        """Test que lire tout l'état financier ne coûte qu'une requête"""
+        Student.objects.create(
+            full_name="Confirmed",
+            email="single@test.com",
+            partner=self.partner,
+            program=self.program,
+            is_confirmed=True
+        )
+        partner = Partner.objects.get(pk=self.partner.pk)
+        with self.assertNumQueries(1):
+            partner.total_students_confirmed
+            partner.total_earned
+            partner.total_paid
+            partner.remaining_balance
+            partner.payment_status
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class PartnerStatsQuerySetTests(TestCase):
+    """Tests de Partner.objects.with_stats() et du nombre de requêtes des dashboards"""
+
+    def setUp(self):
+        self.program = Program.objects.create(name="Stats Program")
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'pass')
+        self.factory = RequestFactory()
+
+    def _create_partner(self, index, confirmed=2, pending=1):
+        partner = Partner.objects.create(
+            name=f"Partner {index}",
+            email=f"partner{index}@test.com",
+            commission_per_student=Decimal('1000.00'),
+        )
+        for i in range(confirmed + pending):
+            Student.objects.create(
+                full_name=f"Student {index}-{i}",
+                email=f"student{index}-{i}@test.com",
+                partner=partner,
+                program=self.program,
+                is_confirmed=i < confirmed,
+            )
+        return partner
+
+    def test_with_stats_annotations(self):
+        """Test les valeurs annotées"""
+        partner = self._create_partner(1, confirmed=3, pending=2)
+        PaymentCheckpoint.objects.create(partner=partner, amount_paid=Decimal('1000.00'))
+        Student.objects.create(
+            full_name="After checkpoint",
+            email="after@test.com",
+            partner=partner,
+            program=self.program,
+            is_confirmed=True,
+        )
+
+        annotated = Partner.objects.with_stats().get(pk=partner.pk)
+        self.assertEqual(annotated.pending_count, 2)
+        self.assertEqual(annotated.confirmed_count, 4)
+        self.assertEqual(annotated.confirmed_since_checkpoint_count, 1)
+        self.assertEqual(annotated.paid_total, Decimal('1000.00'))
+        self.assertEqual(annotated.outstanding_total, Decimal('3000.00'))
+        self.assertIsNotNone(annotated.last_checkpoint_date)
+
+    def test_with_stats_matches_ledger(self):
+        """Test que les annotations et le solde dénormalisé comptent les mêmes élèves"""
+        partner = self._create_partner(1, confirmed=2, pending=1)
+        Student.objects.create(
+            full_name="Inactive",
+            email="inactive@test.com",
+            partner=partner,
+            program=self.program,
+            is_confirmed=True,
+            status='inactive',
+        )
+
+        annotated = Partner.objects.with_stats().get(pk=partner.pk)
+        ledger = Partner.objects.get(pk=partner.pk).ledger
+        self.assertEqual(annotated.pending_count, ledger.students_pending)
+        self.assertEqual(annotated.confirmed_count, ledger.students_confirmed)
+        self.assertEqual(annotated.confirmed_count, 3)
+        self.assertEqual(annotated.confirmed_since_checkpoint_count, ledger.students_confirmed_since_checkpoint)
+
+        # Variantes limitées aux élèves actifs, comme les listes des tableaux de bord
+        self.assertEqual(annotated.active_confirmed_count, 2)
+        self.assertEqual(annotated.active_pending_count, 1)
+        self.assertEqual(
+            annotated.active_outstanding_total, partner.commission_per_student * 2 - annotated.paid_total
+        )
+
+    def _count_queries(self, view_class):
+        request = self.factory.get('/')
+        request.user = self.admin
+        with CaptureQueriesContext(connection) as queries:
+            view_class.as_view()(request).render()
+        return len(queries)
+
+    def test_dashboards_count_active_students(self):
+        """Test que les compteurs des tableaux de bord correspondent aux listes (élèves actifs)"""
+        partner = self._create_partner(1, confirmed=2, pending=1)
+        for status in ('inactive', 'suspended'):
+            for confirmed in (True, False):
+                Student.objects.create(
+                    full_name=f"{status} {confirmed}", email=f"{status}-{confirmed}@test.com",
+                    partner=partner, program=self.program, is_confirmed=confirmed, status=status,
+                )
+
+        request = self.factory.get('/')
+        request.user = self.admin
+        data = AdminStudentConfirmationView.as_view()(request).context_data['partners_data'][0]
+        self.assertEqual(data['pending_count'], len(data['pending_students']))
+        self.assertEqual(data['confirmed_count'], len(data['confirmed_students']))
+        self.assertEqual(data['confirmed_amount'], Decimal('2000.00'))
+
+        data = AdminPartnersManagementView.as_view()(request).context_data['partners_data'][0]
+        self.assertEqual(data['pending_count'], 1)
+        self.assertEqual(data['total_confirmed_all_time'], 2)
+        self.assertEqual(data['remaining_payment'], Decimal('2000.00'))
+
+    def test_dashboards_query_count_is_constant(self):
+        """Test que le nombre de requêtes ne dépend pas du nombre de partenaires"""
+        views = [AdminDashboardView, PaymentsDashboardView, AdminStudentConfirmationView, AdminPartnersManagementView]
+        self._create_partner(0)
+        before = {view: self._count_queries(view) for view in views}
+        for index in range(1, 6):
+            self._create_partner(index)
+        for view in views:
+            self.assertEqual(self._count_queries(view), before[view], view.__name__)
+
+    def test_admin_changelist_query_count_is_constant(self):
+        """Test que la liste admin des partenaires a un coût constant"""
+        self.client.force_login(self.admin)
+        url = reverse('admin:partnerships_partner_changelist')
+        self._create_partner(0)
+        with CaptureQueriesContext(connection) as before:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        for index in range(1, 6):
+            self._create_partner(index)
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(url)
+        self.assertEqual(len(after), len(before))
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class AdminStatsViewTests(TestCase):
+    """Tests du dashboard de stats par code"""
+
+    def setUp(self):
+        self.program = Program.objects.create(name="Stats Program")
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'pass')
+        self.factory = RequestFactory()
+
+    def _get(self):
+        request = self.factory.get('/')
+        request.user = self.admin
+        response = AdminStatsView.as_view()(request)
+        response.render()
+        return response
+
+    def test_per_code_breakdown(self):
+        """Test la répartition en attente / confirmés par code"""
+        partner = Partner.objects.create(name="Code Library", email="codes@lib.com")
+        code_a = PartnershipCode.objects.create(partner=partner, code="LIBA01")
+        code_b = PartnershipCode.objects.create(partner=partner, code="LIBB02")
+        for i, (code, confirmed) in enumerate([(code_a, True), (code_a, False), (code_b, True)]):
+            Student.objects.create(
+                full_name=f"Student {i}",
+                email=f"code{i}@test.com",
+                partner=partner,
+                program=self.program,
+                referral_code=code.code,
+                partnership_code=code,
+                is_confirmed=confirmed,
+            )
+
+        data = self._get().context_data['partners_data'][0]
+        codes = {c['code']: c for c in data['codes']}
+        self.assertEqual((codes['LIBA01']['pending'], codes['LIBA01']['confirmed']), (1, 1))
+        self.assertEqual((codes['LIBB02']['pending'], codes['LIBB02']['confirmed']), (0, 1))
+        self.assertEqual(data['total_earned'], Decimal('2000.00'))
+
+    def test_query_count_for_1000_codes(self):
+        """Test que la page se rend en un nombre fixe de requêtes pour 1000 codes"""
+        partners = Partner.objects.bulk_create([
+            Partner(name=f"Partner {i}", email=f"bulk{i}@lib.com") for i in range(100)
+        ])
+        codes = PartnershipCode.objects.bulk_create([
+            PartnershipCode(partner=partner, code=f"C{p}X{c}")
+            for p, partner in enumerate(partners)
+            for c in range(10)
+        ])
+        Student.objects.bulk_create([
+            Student(
+                full_name=f"Student {i}",
+                email=f"bulkstudent{i}@test.com",
+                partner=partners[i % 100],
+                program=self.program,
+                referral_code=codes[i].code,
+                partnership_code=codes[i],
+                is_confirmed=i % 2 == 0,
+            )
+            for i in range(500)
+        ])
+
+        with self.assertNumQueries(2):
+            response = self._get()
+        self.assertEqual(response.context_data['total_partners'], 100)
+        self.assertEqual(response.context_data['total_confirmed'], 250)
+
+
+class DailyPartnerStatsTests(TestCase):
+    """Tests de l'agrégat journalier et de la commande refresh_daily_stats"""
+
+    def setUp(self):
+        self.program = Program.objects.create(name="Daily Program")
+        self.partner = Partner.objects.create(
+            name="Daily Library",
+            email="daily@lib.com",
+            commission_per_student=Decimal('1000.00'),
+        )
+        self.code = PartnershipCode.objects.create(partner=self.partner, code="DAY001")
+
+    def _create_student(self, index, confirmed=False):
+        return Student.objects.create(
+            full_name=f"Student {index}",
+            email=f"daily{index}@test.com",
+            partner=self.partner,
+            program=self.program,
+            referral_code="DAY001",
+            partnership_code=self.code,
+            is_confirmed=confirmed,
+        )
+
+    def test_full_rebuild(self):
+        """Test la reconstruction complète"""
+        self._create_student(1, confirmed=True)
+        self._create_student(2)
+        call_command('refresh_daily_stats', '--full', stdout=StringIO())
+
+        stats = DailyPartnerStats.objects.get()
+        self.assertEqual(stats.day, timezone.localdate())
+        self.assertEqual(stats.partnership_code, self.code)
+        self.assertEqual(stats.registrations, 2)
+        self.assertEqual(stats.confirmations, 1)
+        self.assertEqual(stats.commission_earned, Decimal('1000.00'))
+
+    def test_incremental_refresh_only_touches_changed_days(self):
+        """Test que le rafraîchissement incrémental ne recalcule que les jours touchés"""
+        student = self._create_student(1)
+        call_command('refresh_daily_stats', stdout=StringIO())
+        old_day = timezone.localdate() - timedelta(days=30)
+        DailyPartnerStats.objects.create(
+            day=old_day, partner=self.partner, code="DAY001", registrations=7,
+            refreshed_at=timezone.now() - timedelta(days=30),
+        )
+
+        student.is_confirmed = True
+        student.save()
+        call_command('refresh_daily_stats', stdout=StringIO())
+
+        self.assertEqual(DailyPartnerStats.objects.get(day=old_day).registrations, 7)
+        self.assertEqual(DailyPartnerStats.objects.get(day=timezone.localdate()).confirmations, 1)
+
+    def _refresh_old_day(self, student, old_day):
+        """Place l'élève sur un ancien jour, sans toucher updated_at, et calcule ce jour"""
+        old = timezone.now() - timedelta(days=30)
+        Student.objects.filter(pk=student.pk).update(
+            enrollment_date=old, confirmed_at=old if student.is_confirmed else None,
+        )
+        DailyPartnerStats.refresh_days([old_day])
+        DailyPartnerStats.set_last_refresh(timezone.now())
+        return Student.objects.get(pk=student.pk)
+
+    def test_incremental_refresh_recomputes_left_days(self):
+        """Test que déconfirmation, changement de partenaire et suppression recalculent les anciens jours"""
+        old_day = timezone.localdate() - timedelta(days=30)
+        student = self._refresh_old_day(self._create_student(1, confirmed=True), old_day)
+        self.assertEqual(DailyPartnerStats.objects.get(day=old_day).confirmations, 1)
+
+        student.is_confirmed = False
+        student.save()
+        call_command('refresh_daily_stats', stdout=StringIO())
+        self.assertEqual(DailyPartnerStats.objects.get(day=old_day).confirmations, 0)
+
+        other = Partner.objects.create(name="Other Library", email="other@lib.com")
+        student.partner = other
+        student.partnership_code = None
+        student.save()
+        call_command('refresh_daily_stats', stdout=StringIO())
+        self.assertEqual(
+            list(DailyPartnerStats.objects.filter(day=old_day).values_list('partner', 'registrations')),
+            [(other.pk, 1)],
+        )
+
+        student.delete()
+        call_command('refresh_daily_stats', stdout=StringIO())
+        self.assertFalse(DailyPartnerStats.objects.filter(day=old_day).exists())
+        self.assertFalse(DailyStatsDirtyDay.objects.exists())
+
+    def test_empty_table_is_not_rebuilt_every_run(self):
+        """Test que la date du dernier calcul ne dépend pas du contenu de la table"""
+        call_command('refresh_daily_stats', stdout=StringIO())
+        out = StringIO()
+        with patch.object(DailyPartnerStats, 'refresh_days') as refresh_days:
+            call_command('refresh_daily_stats', stdout=out)
+        refresh_days.assert_not_called()
+        self.assertIn('Aucun jour', out.getvalue())
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class PartnerStatsCacheTests(TestCase):
+    """Tests du cache des stats des dashboards partenaires"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.program = Program.objects.create(name="Cache Program")
+        self.partner = Partner.objects.create(
+            name="Cache Library",
+            email="cache@lib.com",
+            commission_per_student=Decimal('1000.00'),
+        )
+        self.code = PartnershipCode.objects.create(partner=self.partner, code="CACHE1")
+        self.student = Student.objects.create(
+            full_name="Cached",
+            email="cached@test.com",
+            partner=self.partner,
+            program=self.program,
+            partnership_code=self.code,
+        )
+        session = self.client.session
+        session['partner_id'] = str(self.partner.id)
+        session.save()
+
+    def test_hit_after_first_render(self):
+        """Test que le deuxième affichage est servi par le cache"""
+        self.client.get(reverse('partner-dashboard-personal'))
+        self.client.get(reverse('partner-dashboard-personal'))
+        self.assertEqual(cache_counters()['misses'], 1)
+        self.assertEqual(cache_counters()['hits'], 1)
+
+    def test_student_write_invalidates(self):
+        """Test qu'une confirmation invalide les stats du partenaire"""
+        response = self.client.get(reverse('partner-dashboard-personal'))
+        self.assertEqual(response.context['total_all_time_confirmed'], 0)
+
+        # Invalidé au commit seulement : avant, un autre affichage garderait les anciennes stats
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.is_confirmed = True
+            self.student.save()
+            response = self.client.get(reverse('partner-dashboard-personal'))
+            self.assertEqual(response.context['total_all_time_confirmed'], 0)
+
+        response = self.client.get(reverse('partner-dashboard-personal'))
+        self.assertEqual(response.context['total_all_time_confirmed'], 1)
+        self.assertEqual(cache_counters()['misses'], 2)
+
+    def test_personal_dashboard_counts_active_students(self):
+        """Test que le tableau de bord du partenaire ne compte que les élèves actifs"""
+        for status in ('inactive', 'suspended'):
+            Student.objects.create(
+                full_name=status, email=f"{status}@test.com", partner=self.partner,
+                program=self.program, is_confirmed=True, status=status,
+            )
+        response = self.client.get(reverse('partner-dashboard-personal'))
+        self.assertEqual(response.context['pending_count'], 1)
+        self.assertEqual(response.context['total_all_time_confirmed'], 0)
+        self.assertEqual(response.context['total_remaining_payment'], 0)
+        self.assertContains(response, "1 étudiant(s)")
+
+    def test_checkpoint_invalidates_payment_history(self):
+        """Test qu'un checkpoint invalide l'historique des paiements"""
+        self.client.get(reverse('partner-payment-history'))
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentCheckpoint.objects.create(partner=self.partner, amount_paid=Decimal('500.00'))
+
+        response = self.client.get(reverse('partner-payment-history'))
+        self.assertEqual(response.context['partner_paid_amount'], Decimal('500.00'))
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class StudentPaginationTests(TestCase):
+    """Tests de la pagination par curseur des listes d'élèves"""
+
+    def setUp(self):
+        self.program = Program.objects.create(name="Pagination Program")
+        self.partner = Partner.objects.create(name="Big Library", email="big@lib.com")
+        self.code = PartnershipCode.objects.create(partner=self.partner, code="BIG001")
+        Student.objects.bulk_create([
+            Student(
+                full_name=f"Student {i}",
+                email=f"page{i}@test.com",
+                partner=self.partner,
+                program=self.program,
+                is_confirmed=i % 2 == 0,
+            )
+            for i in range(STUDENTS_PAGE_SIZE + 5)
+        ])
+        # Des dates d'inscription identiques : l'id départage
+        Student.objects.filter(email__startswith='page1').update(enrollment_date=timezone.now())
+
+    def test_pages_cover_all_students_once(self):
+        """Test que les pages successives couvrent tous les élèves, sans doublon"""
+        queryset = Student.objects.filter(partner=self.partner)
+        seen = []
+        students, cursor = paginate_students(queryset, page_size=7)
+        seen.extend(students)
+        while cursor:
+            students, cursor = paginate_students(queryset, cursor, page_size=7)
+            seen.extend(students)
+
+        expected = list(queryset.order_by('-enrollment_date', '-id'))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        """Test qu'un curseur invalide est refusé"""
+        session = self.client.session
+        session['partner_id'] = str(self.partner.id)
+        session.save()
+        response = self.client.get(reverse('partner-dashboard-personal'), {'cursor': 'invalide'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_personal_dashboard_load_more(self):
+        """Test la première page puis le partial HTMX "Voir plus" """
+        session = self.client.session
+        session['partner_id'] = str(self.partner.id)
+        session.save()
+        url = reverse('partner-dashboard-personal')
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['students']), STUDENTS_PAGE_SIZE)
+        self.assertContains(response, response.context['next_cursor'])
+
+        response = self.client.get(url, {'cursor': response.context['next_cursor']}, HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response, 'partnerships/partials/partner-student-rows.html')
+        self.assertEqual(len(response.context['students']), 5)
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, 'Voir plus')
+
+    def test_public_dashboard_first_page(self):
+        """Test que le dashboard public n'affiche que la première page"""
+        response = self.client.get(reverse('partner-dashboard', args=['big001']))
+        self.assertEqual(len(response.context['students']), STUDENTS_PAGE_SIZE)
+        self.assertContains(response, 'Voir plus')
+
+    def test_admin_partner_detail_lists(self):
+        """Test la pagination des listes en attente / confirmés du détail admin"""
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@test.com', 'pass'))
+        url = reverse('admin-partner-detail', args=[self.partner.id])
+
+        response = self.client.get(url)
+        self.assertEqual(response.context['pending_count'], 27)
+        self.assertEqual(len(response.context['pending_students']), 27)
+        self.assertIsNone(response.context['pending_next_cursor'])
+
+        students, cursor = paginate_students(self.partner.students.filter(is_confirmed=True), page_size=10)
+        response = self.client.get(url, {'list': 'confirmed', 'cursor': cursor})
+        self.assertTemplateUsed(response, 'partnerships/partials/admin-student-items.html')
+        self.assertEqual(len(response.context['students']), 18)
+        self.assertTrue(all(student.is_confirmed for student in response.context['students']))
+
+        response = self.client.get(url, {'list': 'autre', 'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+
+    def test_partners_management_first_page(self):
+        """Test que la gestion des partenaires ne charge qu'une page d'élèves en attente"""
+        Student.objects.filter(partner=self.partner).update(is_confirmed=False)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@test.com', 'pass'))
+        response = self.client.get(reverse('admin-partners-management'))
+        item = response.context['partners_data'][0]
+        self.assertEqual(len(item['pending_students']), STUDENTS_PAGE_SIZE)
+        self.assertIsNotNone(item['pending_next_cursor'])
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class QRCodeCacheTests(TestCase):
+    """Tests du cache des QR codes adressé par contenu"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.partner = Partner.objects.create(name="QR Library", email="qr@lib.com")
+        self.code = PartnershipCode.objects.create(partner=self.partner, code="QR0001")
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@test.com', 'pass'))
+
+    def test_key_depends_on_all_parameters(self):
+        """Test que la clé change avec l'URL et chaque paramètre de rendu"""
+        base = qr_key('https://example.com/register/?code=QR0001')
+        self.assertEqual(base, qr_key('https://example.com/register/?code=QR0001'))
+        self.assertNotEqual(base, qr_key('https://example.com/register/?code=QR0002'))
+        self.assertNotEqual(base, qr_key('https://example.com/register/?code=QR0001', border=2))
+        self.assertNotEqual(base, qr_key('https://example.com/register/?code=QR0001', error_correction=ERROR_CORRECT_H))
+
+    def test_rendered_once(self):
+        """Test que le QR n'est rendu qu'au premier appel"""
+        with patch('partnerships.qrcodes.render_qr_png', wraps=render_qr_png) as render:
+            first = get_qr_png('https://example.com/register/?code=QR0001')
+            second = get_qr_png('https://example.com/register/?code=QR0001')
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertTrue(first[1].startswith(b'\x89PNG'))
+
+    @override_settings(QR_CACHE_BACKEND='storage')
+    def test_storage_backend(self):
+        """Test le cache sur le stockage média"""
+        key, png, _ = get_qr_png('https://example.com/register/?code=QR0001')
+        with patch('partnerships.qrcodes.render_qr_png') as render:
+            self.assertEqual(get_qr_png('https://example.com/register/?code=QR0001')[1], png)
+        render.assert_not_called()
+
+    def test_conditional_requests(self):
+        """Test ETag / Last-Modified et réponses 304"""
+        url = reverse('generate-qr-code', args=['qr0001'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with patch('partnerships.qrcodes.get_qr_png') as get_png:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        get_png.assert_not_called()
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"autre"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_page_uses_lazy_images(self):
+        """Test que la liste des QR codes n'embarque plus les images et se pagine"""
+        for i in range(30):
+            PartnershipCode.objects.create(partner=self.partner, code=f"LST{i:03d}")
+
+        with patch('partnerships.qrcodes.render_qr_png') as render:
+            response = self.client.get(reverse('qr-code-list'))
+        render.assert_not_called()
+        self.assertNotContains(response, 'data:image/png;base64')
+        self.assertContains(response, 'loading="lazy"', count=24)
+        self.assertEqual(response.context['paginator'].count, 31)
+
+        response = self.client.get(reverse('qr-code-list'), {'q': 'lst02'})
+        self.assertEqual([code.code for code in response.context['codes']], [f"LST02{i}" for i in range(10)])
+
+    def test_error_correction_parameter(self):
+        """Test que ?ec= change l'image (et l'ETag) servie"""
+        url = reverse('generate-qr-code', args=['qr0001'])
+        self.assertNotEqual(self.client.get(url)['ETag'], self.client.get(url, {'ec': 'h'})['ETag'])
+
+    def test_code_pdf_is_cached(self):
+        """Test que le PDF d'un code n'est rendu qu'une fois et supporte If-None-Match"""
+        url = reverse('generate-code-pdf', args=[self.code.id])
+        with patch('partnerships.pdf.render_code_pdf', return_value=b'%PDF-1.4 test') as render:
+            response = self.client.get(url)
+            self.assertEqual(response.content, b'%PDF-1.4 test')
+            self.assertEqual(self.client.get(url).content, b'%PDF-1.4 test')
+            self.assertEqual(render.call_count, 1)
+
+            # 304 sans lire le cache ni rendre le PDF
+            with patch('partnerships.views.get_code_pdf') as get_code_pdf:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            get_code_pdf.assert_not_called()
+
+            # Un autre nom de partenaire change le PDF
+            self.partner.name = "QR Library 2"
+            self.partner.save()
+            self.client.get(url)
+            self.assertEqual(render.call_count, 2)
+
+    @skipUnless(importlib.util.find_spec('reportlab'), "reportlab n'est pas installé")
+    def test_code_pdf_rendering(self):
+        """Test le rendu réel du PDF, logo compris"""
+        from partnerships.pdf import logo_reader, render_code_pdf
+        pdf = render_code_pdf("QR0001", "QR Library", render_qr_png('https://example.com/register/?code=QR0001'))
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertIs(logo_reader(), logo_reader())
+
+    def test_codes_pdf_sheet(self):
+        """Test le PDF multi-pages : codes du partenaire, de tous les partenaires, cache et accès"""
+        PartnershipCode.objects.create(partner=self.partner, code="QR0002")
+        other = Partner.objects.create(name="Autre Library", email="autre@lib.com")
+        PartnershipCode.objects.create(partner=other, code="AUT001")
+        pages = []
+
+        def render(entries):
+            pages.append([(code, partner_name) for code, partner_name, _ in entries])
+            return b'%PDF-1.4 sheet'
+
+        with patch('partnerships.pdf.render_codes_pdf', side_effect=render):
+            url = reverse('generate-partner-codes-pdf', args=[self.partner.id])
+            response = self.client.get(url)
+            self.assertEqual(response.content, b'%PDF-1.4 sheet')
+            self.assertIn('Codes_qr-library.pdf', response['Content-Disposition'])
+            self.assertEqual(pages, [[("QR0001", "QR Library"), ("QR0002", "QR Library")]])
+
+            # Rendu une seule fois, puis 304 avec l'ETag
+            self.client.get(url)
+            self.assertEqual(len(pages), 1)
+            with patch('partnerships.views.get_codes_pdf') as get_codes_pdf:
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+            get_codes_pdf.assert_not_called()
+
+            # Tous les partenaires dans un seul document
+            self.client.get(reverse('generate-codes-pdf'))
+            self.assertEqual(pages[-1], [("AUT001", "Autre Library"), ("QR0001", "QR Library"), ("QR0002", "QR Library")])
+
+        # Un partenaire ne télécharge que ses propres codes
+        self.client.logout()
+        session = self.client.session
+        session['partner_id'] = str(other.id)
+        session.save()
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    @skipUnless(importlib.util.find_spec('reportlab'), "reportlab n'est pas installé")
+    def test_codes_pdf_embeds_logo_once(self):
+        """Test que le logo n'est embarqué qu'une fois dans le PDF multi-pages"""
+        from partnerships.pdf import render_codes_pdf
+        pdf = render_codes_pdf([
+            (code, "QR Library", render_qr_png(f'https://example.com/register/?code={code}'))
+            for code in ("QR0001", "QR0002")
+        ])
+        self.assertEqual(pdf.count(b'/Type /Page\n'), 2)
+        # Logo + un QR code par page
+        self.assertEqual(pdf.count(b'/Subtype /Image'), 3)
+
+
+class CSVExportTests(TestCase):
+    """Tests des exports CSV en flux"""
+
+    def setUp(self):
+        self.partner = Partner.objects.create(name="Export Library", email="export@lib.com")
+        self.other = Partner.objects.create(name="Other Library", email="other@lib.com")
+        for i, partner in enumerate([self.partner, self.partner, self.other]):
+            Student.objects.create(full_name=f"Élève {i}", email=f"e{i}@test.com", partner=partner, is_confirmed=True)
+        # Un élève inscrit le mois dernier
+        Student.objects.filter(email="e1@test.com").update(enrollment_date=timezone.now() - timedelta(days=40))
+        create_completed_payment(self.partner, Decimal('1500.00'))
+        PaymentCheckpoint.objects.create(partner=self.other, amount_paid=Decimal('200.00'))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@test.com', 'pass'))
+
+    def export(self, dataset, **params):
+        response = self.client.get(reverse('admin-export', args=[dataset]), params)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.reader(StringIO(content)))
+
+    def test_students_export(self):
+        """Test l'export des élèves, filtré par partenaire et par période"""
+        rows = self.export('students')
+        self.assertEqual(rows[0][:3], ['id', 'nom', 'email'])
+        # Trié par date d'inscription
+        self.assertEqual([row[1] for row in rows[1:]], ["Élève 1", "Élève 0", "Élève 2"])
+        self.assertEqual(rows[1][8], 'oui')
+
+        rows = self.export('students', partner=self.partner.id)
+        self.assertEqual({row[4] for row in rows[1:]}, {"Export Library"})
+
+        today = timezone.localdate().isoformat()
+        rows = self.export('students', partner=self.partner.id, start=today, end=today)
+        self.assertEqual([row[1] for row in rows[1:]], ["Élève 0"])
+
+    def test_payments_and_checkpoints_export(self):
+        """Test l'export des paiements et des checkpoints"""
+        rows = self.export('payments')
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][1:3], ["Export Library", "1500.00"])
+
+        self.assertEqual(len(self.export('checkpoints', partner=self.partner.id)), 1)
+        self.assertEqual(self.export('checkpoints', partner=self.other.id)[1][2], "200.00")
+        self.assertEqual(self.export('receipts')[0][0], 'id')
+
+    def test_formulas_are_neutralised(self):
+        """Test qu'un texte commençant comme une formule n'est pas exécuté par Excel"""
+        Student.objects.filter(email="e0@test.com").update(full_name='=HYPERLINK("http://evil")')
+        Payment.objects.update(reference='@SUM(A1)', notes='-2+3')
+        rows = self.export('students', partner=self.partner.id)
+        self.assertIn('\'=HYPERLINK("http://evil")', [row[1] for row in rows])
+        row = self.export('payments')[1]
+        self.assertEqual(row[5:7], ["'@SUM(A1)", "'-2+3"])
+        # Montants non concernés
+        self.assertEqual(row[2], "1500.00")
+
+    def test_invalid_requests(self):
+        """Test les paramètres invalides et l'accès non superuser"""
+        self.assertEqual(self.client.get(reverse('admin-export', args=['unknown'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('admin-export', args=['students']), {'start': '2024-13-01'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('admin-export', args=['students']), {'partner': 'abc'}).status_code, 400)
+
+        self.client.force_login(User.objects.create_user('staff', 'staff@test.com', 'pass'))
+        self.assertEqual(self.client.get(reverse('admin-export', args=['students'])).status_code, 403)
+
+    def test_export_command(self):
+        """Test la commande export_csv"""
+        out = StringIO()
+        call_command('export_csv', 'students', '--partner', str(self.other.id), '--chunk-size', '1', stdout=out, stderr=StringIO())
+        rows = list(csv.reader(StringIO(out.getvalue().lstrip('\ufeff'))))
+        self.assertEqual([row[1] for row in rows[1:]], ["Élève 2"])
+
+
+class BulkConfirmStudentsTests(TestCase):
+    """Tests de la confirmation groupée des étudiants"""
+
+    def setUp(self):
+        self.partner = Partner.objects.create(name="Bulk Library", email="bulk@lib.com", status='active')
+        self.other = Partner.objects.create(name="Other Library", email="other@lib.com", status='active')
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'pass')
+
+    def create_students(self, partner, count, prefix):
+        return [
+            Student.objects.create(full_name=f"{prefix} {i}", email=f"{prefix}{i}@test.com", partner=partner)
+            for i in range(count)
+        ]
+
+    def test_bulk_confirm(self):
+        """Test une seule mise à jour, les logs d'audit et le solde recalculé"""
+        students = self.create_students(self.partner, 3, 'a')
+        self.create_students(self.other, 1, 'b')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            confirmed, balances = Student.bulk_confirm(self.partner.students.all(), user=self.admin)
+        self.assertEqual(confirmed, 3)
+        self.assertEqual(list(balances), [self.partner.id])
+        self.assertEqual(balances[self.partner.id].students_confirmed, 3)
+        self.assertEqual(PartnerBalance.objects.get(partner=self.partner).students_pending, 0)
+        self.assertEqual(PartnerBalance.objects.get(partner=self.other).students_pending, 1)
+
+        student = Student.objects.get(pk=students[0].pk)
+        self.assertTrue(student.is_confirmed)
+        self.assertIsNotNone(student.confirmed_at)
+        self.assertEqual(
+            set(AuditLog.objects.filter(action='student_confirmed').values_list('student_id', flat=True)),
+            {s.id for s in students},
+        )
+
+        # Déjà confirmés : rien à faire
+        self.assertEqual(Student.bulk_confirm(self.partner.students.all()), (0, {}))
+
+    def test_admin_action_skips_inactive_students(self):
+        """Test que l'action admin ne confirme que les étudiants actifs"""
+        active, inactive, suspended = self.create_students(self.partner, 3, 'a')
+        Student.objects.filter(pk=inactive.pk).update(status='inactive')
+        Student.objects.filter(pk=suspended.pk).update(status='suspended')
+
+        self.client.force_login(self.admin)
+        self.client.post(reverse('admin:students_student_changelist'), {
+            'action': 'confirm_selected',
+            '_selected_action': [str(s.pk) for s in (active, inactive, suspended)],
+        })
+        self.assertEqual(
+            list(Student.objects.filter(is_confirmed=True).values_list('pk', flat=True)), [active.pk]
+        )
+
+    def test_query_count_is_constant(self):
+        """Test que le nombre de requêtes ne dépend pas du nombre d'étudiants"""
+        self.create_students(self.partner, 2, 'a')
+        self.create_students(self.other, 20, 'b')
+        with CaptureQueriesContext(connection) as small:
+            Student.bulk_confirm(self.partner.students.all())
+        with CaptureQueriesContext(connection) as large:
+            Student.bulk_confirm(self.other.students.all())
+        self.assertEqual(len(small), len(large))
+
+    def test_bulk_confirm_view(self):
+        """Test l'endpoint : liste d'ids en JSON, partenaire via formulaire, erreurs"""
+        students = self.create_students(self.partner, 3, 'a')
+        others = self.create_students(self.other, 2, 'b')
+        url = reverse('admin-bulk-confirm-students')
+        self.client.force_login(self.admin)
+
+        response = self.client.post(
+            url, {'student_ids': [str(students[0].id), str(students[1].id)]}, content_type='application/json',
+        )
+        data = response.json()
+        self.assertEqual(data['confirmed'], 2)
+        self.assertEqual(data['partners'][0]['students_pending'], 1)
+
+        response = self.client.post(url, {'partner_id': self.other.id, 'next': '/dashboard/confirmations/'})
+        self.assertRedirects(response, '/dashboard/confirmations/', fetch_redirect_response=False)
+        self.assertEqual(Student.objects.filter(id__in=[s.id for s in others], is_confirmed=True).count(), 2)
+
+        # Un étudiant inactif n'est pas confirmé, même désigné par son id
+        inactive = Student.objects.create(
+            full_name="Inactif", email="inactif@test.com", partner=self.partner, status='inactive',
+        )
+        response = self.client.post(url, {'student_ids': [str(inactive.id)]}, content_type='application/json')
+        self.assertEqual(response.json()['confirmed'], 0)
+        inactive.refresh_from_db()
+        self.assertFalse(inactive.is_confirmed)
+
+        self.assertEqual(self.client.post(url, {}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'student_ids': ['abc']}).status_code, 400)
+        self.assertEqual(self.client.post(url, [str(students[2].id)], content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(url, '"abc"', content_type='application/json').status_code, 400)
+
+        self.client.force_login(User.objects.create_user('staff', 'staff@test.com', 'pass'))
+        self.assertEqual(self.client.post(url, {'partner_id': self.partner.id}).status_code, 403)
+
+
+def make_photo(width, height, orientation=None, format='JPEG'):
+    """Helper: photo de test, avec une orientation EXIF éventuelle"""
+    image = Image.new('RGB', (width, height), 'white')
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, format=format, exif=exif)
+    return buffer.getvalue()
+
+
+@override_settings(
+    STORAGES=TEST_STORAGES, RECEIPT_MAX_SIZE=600, RECEIPT_THUMBNAIL_SIZE=100,
+    RECEIPT_FORMAT='WEBP', RECEIPT_QUALITY=80, RECEIPT_KEEP_ORIGINAL=False,
+)
+class ReceiptProcessingTests(TestCase):
+    """Tests du traitement des photos de reçus (commande process_receipts)"""
+
+    def setUp(self):
+        self.partner = Partner.objects.create(name="Receipt Library", email="receipt@lib.com")
+
+    def create_receipt(self, content, name='photo.jpg'):
+        payment = create_completed_payment(self.partner, Decimal('500.00'))
+        return PaymentReceipt.objects.create(
+            payment=payment, amount_paid=Decimal('500.00'), receipt_image=SimpleUploadedFile(name, content),
+        )
+
+    def test_process_receipts(self):
+        """Test l'orientation, la réduction, le format et la miniature"""
+        # Orientation 6 : photo prise en portrait, stockée couchée
+        receipt = self.create_receipt(make_photo(1200, 800, orientation=6))
+        original_name = receipt.receipt_image.name
+        self.assertIsNone(receipt.processed_at)
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_receipts', stdout=out)
+        self.assertIn('1 reçu(s) traité(s), 0 échec(s)', out.getvalue())
+
+        receipt.refresh_from_db()
+        self.assertIsNotNone(receipt.processed_at)
+        self.assertTrue(receipt.receipt_image.name.endswith('.webp'))
+        with Image.open(receipt.receipt_image) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (400, 600)))
+        with Image.open(receipt.receipt_thumbnail) as image:
+            self.assertEqual(max(image.size), 100)
+        self.assertEqual(receipt.preview, receipt.receipt_thumbnail)
+        self.assertFalse(receipt.receipt_image.storage.exists(original_name))
+
+        # Déjà traité : rien à refaire
+        out = StringIO()
+        call_command('process_receipts', stdout=out)
+        self.assertIn('Terminé: 0 reçu(s) traité(s)', out.getvalue())
+
+    @override_settings(RECEIPT_KEEP_ORIGINAL=True, RECEIPT_FORMAT='JPEG')
+    def test_keep_original(self):
+        """Test que l'original est gardé si RECEIPT_KEEP_ORIGINAL"""
+        receipt = self.create_receipt(make_photo(300, 200, format='PNG'), name='photo.png')
+        original_name = receipt.receipt_image.name
+        call_command('process_receipts', stdout=StringIO())
+
+        receipt.refresh_from_db()
+        self.assertEqual(receipt.receipt_original.name, original_name)
+        self.assertTrue(receipt.receipt_original.storage.exists(original_name))
+        self.assertTrue(receipt.receipt_image.name.endswith('.jpg'))
+
+    def test_thumbnail_failure_releases_main_image(self):
+        """Test qu'un échec sur la miniature rend la référence prise pour l'image principale"""
+        receipt = self.create_receipt(make_photo(300, 200))
+        original_name = receipt.receipt_image.name
+        stored = []
+
+        def store_bytes(data, extension):
+            # Image principale stockée, miniature en échec
+            if stored:
+                raise OSError('disque plein')
+            stored.append(_store_bytes(data, extension))
+            return stored[0]
+
+        with patch('partnerships.receipts._store_bytes', side_effect=store_bytes), \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command('process_receipts', stdout=StringIO())
+
+        receipt.refresh_from_db()
+        self.assertEqual(receipt.receipt_image.name, original_name)
+        self.assertEqual(receipt.processing_error, 'disque plein')
+        self.assertFalse(ReceiptBlob.objects.exists())
+
+    def test_save_failure_keeps_rest_of_batch(self):
+        """Test qu'un échec d'enregistrement n'annule que le reçu concerné"""
+        failing = self.create_receipt(make_photo(300, 200))
+        other = self.create_receipt(make_photo(200, 300))
+        save = PaymentReceipt.save
+
+        def save_or_fail(receipt, *args, **kwargs):
+            if receipt.pk == failing.pk and not kwargs.get('update_fields'):
+                raise DatabaseError('base indisponible')
+            return save(receipt, *args, **kwargs)
+
+        with patch.object(PaymentReceipt, 'save', autospec=True, side_effect=save_or_fail), \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command('process_receipts', stdout=StringIO())
+
+        failing.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(failing.processing_error, 'base indisponible')
+        self.assertTrue(failing.receipt_image.storage.exists(failing.receipt_image.name))
+        self.assertEqual(other.processing_error, '')
+        self.assertTrue(other.receipt_thumbnail)
+        # Seules les versions du reçu traité sont dans le store
+        self.assertEqual(
+            set(ReceiptBlob.objects.values_list('file', flat=True)),
+            {other.receipt_image.name, other.receipt_thumbnail.name},
+        )
+
+    def test_claimed_receipts_are_skipped_until_lease_expires(self):
+        """Test qu'un reçu réservé par un worker n'est repris qu'à l'expiration du bail"""
+        receipt = self.create_receipt(make_photo(300, 200))
+        self.assertEqual(PaymentReceipt.claim_processing(lease=60), [receipt])
+        self.assertEqual(PaymentReceipt.claim_processing(), [])
+
+        PaymentReceipt.objects.update(processing_claimed_until=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_receipts', stdout=StringIO())
+        receipt.refresh_from_db()
+        self.assertIsNotNone(receipt.processed_at)
+        self.assertIsNone(receipt.processing_claimed_until)
+
+    def test_unreadable_image(self):
+        """Test qu'une image illisible est marquée en erreur et garde son fichier"""
+        receipt = self.create_receipt(b'not an image')
+        out = StringIO()
+        call_command('process_receipts', stdout=out)
+        self.assertIn('0 reçu(s) traité(s), 1 échec(s)', out.getvalue())
+
+        receipt.refresh_from_db()
+        self.assertIsNotNone(receipt.processed_at)
+        self.assertNotEqual(receipt.processing_error, '')
+        self.assertEqual(receipt.preview, receipt.receipt_image)
+
+
+@override_settings(STORAGES=TEST_STORAGES, RECEIPT_MAX_UPLOAD_SIZE=50 * 1024)
+class ReceiptUploadTests(TestCase):
+    """Tests de la réception en flux des photos de reçus"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'pass')
+        self.partner = Partner.objects.create(name="Upload Library", email="upload@lib.com")
+        self.url = reverse('payment-receipt-upload', args=[self.partner.id])
+        self.client.force_login(self.admin)
+
+    def upload(self, content, name='recu.jpg', client=None):
+        # Le fichier est écrit dans le store après le commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return (client or self.client).post(self.url, {
+                'amount_paid': '500.00',
+                'receipt_image': SimpleUploadedFile(name, content),
+            })
+
+    def test_valid_upload(self):
+        """Test qu'une photo valide est enregistrée avec son SHA-256 calculé en flux"""
+        content = make_photo(300, 200)
+        response = self.upload(content)
+        self.assertRedirects(response, reverse('payment-history', args=[self.partner.id]), fetch_redirect_response=False)
+        receipt = PaymentReceipt.objects.get(payment__partner=self.partner)
+        self.assertEqual(receipt.image_sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(receipt.receipt_image.read(), content)
+
+    def test_oversized_upload(self):
+        """Test qu'un fichier trop gros est refusé pendant la réception"""
+        content = make_photo(10, 10) + b'\0' * 60 * 1024
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 400)
+        self.assertContains(response, "trop grande", status_code=400)
+        self.assertFalse(Payment.objects.filter(partner=self.partner).exists())
+
+    def test_content_length_rejected_early(self):
+        """Test qu'un Content-Length annoncé trop grand est refusé sans lire le corps"""
+        response = self.client.generic(
+            'POST', self.url, b'', content_type='multipart/form-data; boundary=x',
+            CONTENT_LENGTH=str(10 * 1024 * 1024),
+        )
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Payment.objects.filter(partner=self.partner).exists())
+
+    def test_not_an_image(self):
+        """Test qu'un fichier qui n'est pas une image est refusé malgré son extension"""
+        response = self.upload(b'%PDF-1.4 pas une image', name='recu.jpg')
+        self.assertContains(response, "pas une image JPG ou PNG", status_code=400)
+
+        # Signature JPEG mais en-tête illisible
+        response = self.upload(b'\xff\xd8\xff' + b'\0' * 100, name='recu.jpg')
+        self.assertContains(response, "pas une image JPG ou PNG", status_code=400)
+        self.assertFalse(Payment.objects.filter(partner=self.partner).exists())
+
+    def test_csrf_still_enforced(self):
+        """Test que la vérification CSRF est toujours faite dans la vue"""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.admin)
+        response = self.upload(make_photo(300, 200), client=client)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Payment.objects.filter(partner=self.partner).exists())
+
+    def test_rejected_file_keeps_previous_upload(self):
+        """Test qu'un second fichier refusé ne ferme pas le fichier déjà reçu"""
+        content = make_photo(10, 10)
+        handler = ReceiptUploadHandler()
+        handler.new_file('receipt_image', 'recu.jpg', 'image/jpeg', len(content))
+        handler.receive_data_chunk(content, 0)
+        uploaded = handler.file_complete(len(content))
+
+        with self.assertRaises(SkipFile):
+            handler.new_file('other_image', 'gros.jpg', 'image/jpeg', 10 * 1024 * 1024)
+        self.assertFalse(uploaded.file.closed)
+        self.assertEqual(uploaded.read(), content)
+        self.assertIn('other_image', handler.errors)
+
+    def test_duplicate_upload(self):
+        """Test qu'un même reçu renvoyé ne crée pas de second paiement"""
+        content = make_photo(300, 200)
+        self.upload(content)
+        response = self.upload(content)
+        self.assertRedirects(response, reverse('payment-history', args=[self.partner.id]), fetch_redirect_response=False)
+        self.assertEqual(Payment.objects.filter(partner=self.partner).count(), 1)
+        self.assertEqual(ReceiptBlob.objects.get().ref_count, 1)
+
+        # Montant différent : autre paiement, même fichier partagé
+        self.client.post(self.url, {
+            'amount_paid': '700.00', 'receipt_image': SimpleUploadedFile('recu.jpg', content),
+        })
+        self.assertEqual(Payment.objects.filter(partner=self.partner).count(), 2)
+        blob = ReceiptBlob.objects.get()
+        self.assertEqual(blob.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(
+            set(PaymentReceipt.objects.values_list('receipt_image', flat=True)), {blob.file.name}
+        )
+
+    def test_duplicate_outside_window(self):
+        """Test qu'un même reçu au-delà de la fenêtre n'est plus un doublon"""
+        content = make_photo(300, 200)
+        self.upload(content)
+        PaymentReceipt.objects.update(created_at=timezone.now() - timedelta(days=30))
+        self.upload(content)
+        self.assertEqual(Payment.objects.filter(partner=self.partner).count(), 2)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ReceiptBlobTests(TestCase):
+    """Tests du store des reçus adressé par contenu"""
+
+    def setUp(self):
+        self.partner = Partner.objects.create(name="Blob Library", email="blob@lib.com")
+
+    def create_receipt(self, content, amount='500.00'):
+        payment = create_completed_payment(self.partner, Decimal(amount))
+        with self.captureOnCommitCallbacks(execute=True):
+            name = ReceiptBlob.store(
+                SimpleUploadedFile('recu.png', content), hashlib.sha256(content).hexdigest(), 'png',
+            )
+        return PaymentReceipt.objects.create(payment=payment, amount_paid=Decimal(amount), receipt_image=name)
+
+    def test_reference_counting(self):
+        """Test qu'un fichier partagé n'est supprimé qu'avec sa dernière référence"""
+        content = make_photo(50, 50, format='PNG')
+        first = self.create_receipt(content)
+        second = self.create_receipt(content, amount='600.00')
+        name = first.receipt_image.name
+        self.assertEqual(second.receipt_image.name, name)
+        self.assertTrue(name.startswith('receipts/blobs/'))
+        self.assertTrue(name.endswith('.png'))
+        storage = ReceiptBlob.storage()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.payment.delete()
+        self.assertEqual(ReceiptBlob.objects.get().ref_count, 1)
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(ReceiptBlob.objects.exists())
+        self.assertFalse(storage.exists(name))
+
+    def test_rollback_leaves_no_file(self):
+        """Test qu'un rollback n'écrit pas le fichier du store"""
+        content = make_photo(50, 50, format='PNG')
+        sha256 = hashlib.sha256(content).hexdigest()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                ReceiptBlob.store(SimpleUploadedFile('recu.png', content), sha256, 'png')
+                raise RuntimeError
+        self.assertFalse(ReceiptBlob.objects.exists())
+        self.assertFalse(ReceiptBlob.storage().exists(ReceiptBlob.path_for(sha256, 'png')))
+
+    def test_double_release(self):
+        """Test qu'une double libération ne fait pas passer le compteur sous zéro"""
+        ReceiptBlob.objects.create(sha256='0' * 64, file='receipts/blobs/x.png', ref_count=0)
+        ReceiptBlob.release('receipts/blobs/x.png')
+        self.assertFalse(ReceiptBlob.objects.filter(ref_count__lt=0).exists())
+
+    def test_processed_versions_are_shared(self):
+        """Test que le traitement stocke aussi ses versions par contenu"""
+        content = make_photo(800, 600)
+        first = self.create_receipt(content)
+        second = self.create_receipt(content, amount='600.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_receipts', stdout=StringIO())
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.receipt_image.name, second.receipt_image.name)
+        self.assertEqual(first.receipt_thumbnail.name, second.receipt_thumbnail.name)
+        self.assertEqual(first.image_sha256, hashlib.sha256(content).hexdigest())
+        # Original libéré par les deux reçus, versions traitées référencées deux fois
+        self.assertEqual(
+            sorted(ReceiptBlob.objects.values_list('ref_count', flat=True)), [2, 2]
+        )
+
+
+@override_settings(STORAGES=TEST_STORAGES, RECEIPT_SENDFILE_BACKEND='')
+class ReceiptFileTests(TestCase):
+    """Tests de l'envoi protégé des photos de reçus"""
+
+    def setUp(self):
+        self.partner = Partner.objects.create(name="File Library", email="file@lib.com")
+        self.content = make_photo(120, 80)
+        payment = create_completed_payment(self.partner, Decimal('500.00'))
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.receipt = PaymentReceipt.objects.create(
+                payment=payment, amount_paid=Decimal('500.00'), image_sha256=self.sha256,
+                receipt_image=ReceiptBlob.store(SimpleUploadedFile('recu.jpg', self.content), self.sha256, 'jpg'),
+            )
+        self.url = reverse('receipt-file', args=[self.receipt.id, 'image'])
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'pass')
+
+    def login_partner(self, partner):
+        session = self.client.session
+        session['partner_id'] = str(partner.id)
+        session.save()
+
+    def test_access(self):
+        """Test que seuls l'admin et le partenaire propriétaire ont accès au reçu"""
+        response = self.client.get(self.url)
+        self.assertRedirects(response, reverse('partner-login'), fetch_redirect_response=False)
+
+        other = Partner.objects.create(name="Other Library", email="other@lib.com")
+        self.login_partner(other)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        self.login_partner(self.partner)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_etag_and_range(self):
+        """Test l'ETag fort (hash du contenu) et les requêtes Range"""
+        self.client.force_login(self.admin)
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], f'"{self.sha256}"')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('private', response['Cache-Control'])
+
+        response = self.client.get(self.url, headers={'If-None-Match': f'"{self.sha256}"'})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=0-9'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[:10])
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=-5'})
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        # If-Range d'une autre version : fichier complet
+        response = self.client.get(self.url, headers={'Range': 'bytes=0-9', 'If-Range': '"old"'})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(self.url, headers={'Range': f'bytes={len(self.content)}-'})
+        self.assertEqual(response.status_code, 416)
+
+    @override_settings(RECEIPT_SENDFILE_BACKEND='x-accel-redirect', RECEIPT_SENDFILE_PREFIX='/protected/')
+    def test_x_accel_redirect(self):
+        """Test que le fichier est confié au serveur frontal"""
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('receipt-file', args=[self.receipt.id, 'thumbnail']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.receipt.receipt_image.name}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], f'"{self.sha256}"')
+
+        # Ancien reçu (avant le store) : nom avec espaces et accents
+        name = self.receipt.receipt_image.storage.save('receipts/2024/01/02/reçu été.jpg', ContentFile(self.content))
+        PaymentReceipt.objects.filter(pk=self.receipt.pk).update(receipt_image=name)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/receipts/2024/01/02/re%C3%A7u%20%C3%A9t%C3%A9.jpg')
+        self.assertEqual(
+            response['Content-Disposition'], "inline; filename*=utf-8''re%C3%A7u%20%C3%A9t%C3%A9.jpg"
+        )
+
+    @override_settings(RECEIPT_SENDFILE_BACKEND='x-sendfile')
+    def test_x_sendfile(self):
+        """Test X-Sendfile, et le repli sur FileResponse quand le stockage n'a pas de chemin disque"""
+        self.client.force_login(self.admin)
+        storage = ReceiptBlob.storage()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], storage.path(self.receipt.receipt_image.name))
+
+        # Stockage sans chemin disque (S3...) : Django envoie le fichier lui-même
+        with patch('partnerships.sendfile._sendfile_target', return_value=None):
+            response = self.client.get(self.url)
+        self.assertNotIn('X-Sendfile', response)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertIsNone(_sendfile_target(Storage(), 'recu.jpg', 'x-sendfile'))
+
+
+class AuditWriterTests(TestCase):
+    """Tests de l'écriture différée et groupée des logs d'audit"""
+
+    def setUp(self):
+        self.partner = Partner.objects.create(name="Audit Library", email="audit@lib.com")
+
+    def log_payments(self, count):
+        for _ in range(count):
+            AuditLog.log_payment_creation(Payment(partner=self.partner, amount=Decimal('100.00')))
+
+    def test_written_after_commit(self):
+        """Test que les logs ne sont écrits qu'après le commit, en un INSERT par appel"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            AuditLog.log_student_confirmations([
+                {'id': uuid.uuid4(), 'full_name': f'S{i}', 'email': f's{i}@test.com',
+                 'partner_id': self.partner.id, 'partner__name': self.partner.name}
+                for i in range(3)
+            ], confirmed_at=timezone.now())
+        self.assertFalse(AuditLog.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(AuditLog.objects.filter(action='student_confirmed').count(), 3)
+
+    def test_rollback_discards_logs(self):
+        """Test qu'un rollback (transaction ou savepoint) annule aussi les logs"""
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.log_payments(1)
+                raise RuntimeError
+        self.assertFalse(AuditLog.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.log_payments(1)
+                with self.assertRaises(RuntimeError), transaction.atomic():
+                    self.log_payments(2)
+                    raise RuntimeError
+        self.assertEqual(AuditLog.objects.count(), 1)
+
+    def test_grouped_per_request(self):
+        """Test que pendant une requête les logs validés sont écrits ensemble à la fin"""
+        def view(request):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.log_payments(2)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.log_payments(1)
+            self.assertFalse(AuditLog.objects.exists())
+            return HttpResponse()
+
+        with CaptureQueriesContext(connection) as queries:
+            AuditLogMiddleware(view)(RequestFactory().get('/'))
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(AuditLog.objects.count(), 3)
+
+    def test_completion_date(self):
+        """Test la date de validation enregistrée dans le log"""
+        payment = create_completed_payment(self.partner, Decimal('200.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            AuditLog.log_payment_completion(payment)
+        log = AuditLog.objects.get(action='payment_completed')
+        self.assertEqual(log.new_values['completed_at'], str(payment.completed_at))
+
+    def test_spool_replay(self):
+        """Test que le spool d'un process arrêté est rejoué par flush_audit_spool"""
+        with tempfile.TemporaryDirectory() as spool_dir, override_settings(AUDIT_SPOOL_DIR=spool_dir):
+            # Écriture en base impossible : les logs restent dans le spool
+            with patch.object(AuditLog.objects, 'bulk_create', side_effect=DatabaseError), \
+                    self.captureOnCommitCallbacks(execute=True):
+                self.log_payments(2)
+            self.assertFalse(AuditLog.objects.exists())
+            audit._state.buffer = []
+
+            # Process arrêté (pid inexistant) ; dernière ligne tronquée par le crash
+            crashed = os.path.join(spool_dir, 'audit-999999999-1.jsonl')
+            os.rename(audit.spool_path(), crashed)
+            with open(crashed, 'a', encoding='utf-8') as f:
+                f.write('{"model": "partnerships.auditlog", "pk"')
+
+            out = StringIO()
+            call_command('flush_audit_spool', stdout=out)
+            self.assertIn('2 log(s) écrit(s) depuis 1 fichier(s)', out.getvalue())
+            self.assertEqual(AuditLog.objects.filter(action='payment_created').count(), 2)
+            self.assertFalse(os.path.exists(crashed))
+
+            # Écriture réussie : le spool du process est vidé
+            with self.captureOnCommitCallbacks(execute=True):
+                self.log_payments(1)
+            self.assertEqual(os.path.getsize(audit.spool_path()), 0)
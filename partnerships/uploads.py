@@ -0,0 +1,162 @@
+"""
+Réception des photos de reçus en flux.
+
+ReceiptUploadHandler remplace les handlers Django pour les endpoints des
+reçus : la limite RECEIPT_MAX_UPLOAD_SIZE est appliquée pendant la réception
+(le reste d'un fichier trop gros est lu et jeté, jamais gardé), la signature
+JPEG/PNG est contrôlée dès le premier morceau et le SHA-256 du contenu est
+calculé au fil de l'eau (attribut `sha256` du fichier reçu). Le fichier est
+gardé en mémoire jusqu'à FILE_UPLOAD_MAX_MEMORY_SIZE, puis sur disque.
+"""
+import hashlib
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from PIL import Image
+
+# Formats acceptés et leur signature (premiers octets du fichier)
+IMAGE_SIGNATURES = {
+    'JPEG': b'\xff\xd8\xff',
+    'PNG': b'\x89PNG\r\n\x1a\n',
+}
+SIGNATURE_SIZE = max(len(signature) for signature in IMAGE_SIGNATURES.values())
+
+# Marge pour les autres champs du formulaire (montant, notes, jeton CSRF)
+FORM_OVERHEAD = 64 * 1024
+
+
+def max_upload_size():
+    return settings.RECEIPT_MAX_UPLOAD_SIZE
+
+
+def too_large_message(size=None):
+    limit_mb = max_upload_size() / (1024 * 1024)
+    if size is None:
+        return f"L'image est trop grande. Max {limit_mb:.0f}MB."
+    return f"L'image est trop grande. Max {limit_mb:.0f}MB, vous avez {size / (1024 * 1024):.1f}MB."
+
+
+def request_too_large(request):
+    """Content-Length annoncé déjà au-dessus de la limite : refuser sans lire le corps"""
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return False
+    return content_length > max_upload_size() + FORM_OVERHEAD
+
+
+def image_format(header):
+    """Format ('JPEG', 'PNG') d'après les premiers octets, ou None"""
+    for fmt, signature in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return fmt
+    return None
+
+
+def file_sha256(f):
+    """SHA-256 du fichier : calculé à la réception par ReceiptUploadHandler, sinon par morceaux"""
+    digest = getattr(f, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    f.seek(0)
+    for chunk in f.chunks():
+        sha256.update(chunk)
+    f.seek(0)
+    return sha256.hexdigest()
+
+
+def validate_image_header(f):
+    """
+    Valide la signature et l'en-tête de l'image sans décoder les pixels.
+
+    Image.open ne lit que l'en-tête : format et dimensions sont contrôlés
+    (bombe de décompression comprise) sans charger le bitmap.
+    """
+    f.seek(0)
+    fmt = image_format(f.read(SIGNATURE_SIZE))
+    f.seek(0)
+    if fmt is None:
+        raise ValidationError("Le fichier n'est pas une image JPG ou PNG valide.")
+
+    try:
+        with Image.open(f) as image:
+            width, height = image.size
+            if image.format != fmt:
+                raise ValidationError("Le fichier n'est pas une image JPG ou PNG valide.")
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError("Le fichier n'est pas une image JPG ou PNG valide.")
+    finally:
+        f.seek(0)
+
+    if width * height > Image.MAX_IMAGE_PIXELS:
+        raise ValidationError("L'image a trop de pixels.")
+
+
+class ReceiptUploadHandler(FileUploadHandler):
+    """Handler d'upload des reçus : limite de taille, signature et SHA-256 en flux"""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_size = max_upload_size()
+        # Erreurs par champ, reprises par QuickPaymentForm (upload_errors)
+        self.errors = {}
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        # Remplacer le fichier précédent avant tout refus : il appartient déjà à
+        # son UploadedFile et _reject ne doit fermer que celui du champ courant.
+        # (Pas de None : MultiPartParser._close_files ferme handler.file s'il existe.)
+        self.file = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+            dir=settings.FILE_UPLOAD_TEMP_DIR,
+        )
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.header = b''
+
+        if self.content_length is not None and self.content_length > self.max_size:
+            self._reject(too_large_message(self.content_length))
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            self._reject(too_large_message())
+
+        if len(self.header) < SIGNATURE_SIZE:
+            self.header += raw_data[:SIGNATURE_SIZE - len(self.header)]
+            if len(self.header) >= SIGNATURE_SIZE:
+                self._check_signature()
+
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if len(self.header) < SIGNATURE_SIZE:
+            self._check_signature()
+
+        self.file.seek(0)
+        uploaded = UploadedFile(
+            file=self.file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
+        uploaded.sha256 = self.sha256.hexdigest()
+        return uploaded
+
+    def _check_signature(self):
+        if image_format(self.header) is None:
+            self._reject("Le fichier n'est pas une image JPG ou PNG valide.")
+
+    def _reject(self, message):
+        """Abandonne le fichier du champ courant : Django lit et jette le reste sans le garder"""
+        self.errors[self.field_name] = message
+        self.file.close()
+        raise SkipFile()
@@ -21,6 +21,7 @@ urlpatterns = [
     path('admin/', user_passes_test(is_superuser)(views.AdminDashboardView.as_view()), name='admin-dashboard'),
     path('stats/', user_passes_test(is_superuser)(views.AdminStatsView.as_view()), name='admin-stats'),
     path('payments/', user_passes_test(is_superuser)(views.PaymentsDashboardView.as_view()), name='payments-dashboard'),
+    path('export/<slug:dataset>/', views.ExportCSVView.as_view(), name='admin-export'),
     path('create-partner/', user_passes_test(is_superuser)(views.AdminPartnerCreationView.as_view()), name='create-partner'),
     path('confirmations/', user_passes_test(is_superuser)(views.AdminStudentConfirmationView.as_view()), name='admin-confirmations'),
     path('confirm-student/<uuid:student_id>/', user_passes_test(is_superuser)(views.ConfirmStudentHTMXView.as_view()), name='confirm-student-htmx'),
@@ -30,6 +31,9 @@ urlpatterns = [
     path('payment-upload/<uuid:partner_id>/', user_passes_test(is_superuser)(views.PaymentReceiptUploadView.as_view()), name='payment-receipt-upload'),
     path('payment-history/<uuid:partner_id>/', user_passes_test(is_superuser)(views.PaymentReceiptListView.as_view()), name='payment-history'),
 
+    # Photos des reçus - Admin ou partenaire propriétaire
+    path('receipts/<uuid:receipt_id>/<slug:variant>/', views.ReceiptFileView.as_view(), name='receipt-file'),
+
     # Partner dashboard - Public (accessible via code)
     path('partner/<str:code>/', views.PartnerDashboardPublicView.as_view(), name='partner-dashboard'),
 
@@ -53,7 +57,10 @@ urlpatterns = [
     path('admin/partners/<uuid:partner_id>/codes/', views.AdminPartnerCodesView.as_view(), name='admin-partner-codes'),
     path('admin/checkpoint/<uuid:partner_id>/', views.AdminCheckpointCreateView.as_view(), name='admin-checkpoint-create'),
     path('admin/confirm-student/<uuid:student_id>/', views.AdminConfirmStudentView.as_view(), name='admin-confirm-student'),
+    path('admin/confirm-students/', views.AdminBulkConfirmStudentsView.as_view(), name='admin-bulk-confirm-students'),
 
     # Code PDF generation
     path('code/<uuid:code_id>/pdf/', views.GenerateCodePDFView.as_view(), name='generate-code-pdf'),
+    path('codes/pdf/', views.GenerateCodesPDFView.as_view(), name='generate-codes-pdf'),
+    path('codes/pdf/<uuid:partner_id>/', views.GenerateCodesPDFView.as_view(), name='generate-partner-codes-pdf'),
 ]
@@ -3,19 +3,35 @@ from django.views.generic import TemplateView, DetailView, View, CreateView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Sum, Q, F, DecimalField
+from django.db import transaction
+from django.db.models import Count, Sum, Q, F, DecimalField, Prefetch
 from django.db.models.functions import Coalesce
-from django.http import HttpResponseForbidden, HttpResponse, FileResponse
+from django.http import Http404, HttpResponseForbidden, HttpResponse, HttpResponseNotModified, FileResponse, StreamingHttpResponse
 from django.contrib import messages
+from django.core.exceptions import BadRequest, ValidationError
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.utils.decorators import method_decorator
+from django.utils.text import slugify
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.urls import reverse_lazy
-from .models import Partner, Payment, PartnershipCode, PaymentReceipt, PartnershipRequest, PaymentCheckpoint
+from .models import Partner, Payment, PartnershipCode, PaymentReceipt, PartnershipRequest, PaymentCheckpoint, AuditLog, ReceiptBlob
 from .forms import PartnerCreationForm, QuickPaymentForm, PartnershipRequestForm
-from students.models import Student
+from .cache import get_partner_stats
+from .exports import EXPORTS, iter_csv, parse_date
+from .pagination import STUDENTS_ORDERING, STUDENTS_PAGE_SIZE, paginate_students, split_page
+from .pdf import code_pdf_key, codes_pdf_key, get_code_pdf, get_codes_pdf
+from .qrcodes import ERROR_CORRECT_L, get_qr_png
+from .receipts import store_receipt_image
+from .sendfile import serve_file
+from .uploads import ReceiptUploadHandler, file_sha256, request_too_large, too_large_message
+from students.models import EmailOutbox, Student
 from datetime import datetime, timedelta
-import qrcode
+import hashlib
 import io
+import json
+import os
 import base64
 
 
@@ -60,11 +76,13 @@ class AdminDashboardView(LoginRequiredMixin, TemplateView):
             total=Sum('amount')
         )['total'] or 0
 
-        # Calculer les montants via les propriétés des partenaires
-        partners = Partner.objects.filter(status='active')
-        total_earned = sum(p.total_earned for p in partners)  # Basé sur confirmés
-        total_earned_real = sum(p.total_earned_real for p in partners)  # Basé sur confirmés
-        remaining_balance = sum(p.remaining_balance for p in partners)  # Basé sur confirmés
+        # Statistiques de tous les partenaires en une seule requête annotée
+        partners = list(
+            Partner.objects.filter(status='active').with_stats().order_by('-confirmed_since_checkpoint_count')
+        )
+        total_earned = sum(p.commission_per_student * p.confirmed_since_checkpoint_count for p in partners)  # Basé sur confirmés
+        total_earned_real = total_earned  # Basé sur confirmés
+        remaining_balance = total_earned  # Basé sur confirmés
 
         context['total_partners'] = total_partners
         context['total_students_pending'] = total_students_pending
@@ -74,9 +92,8 @@ class AdminDashboardView(LoginRequiredMixin, TemplateView):
         context['total_paid'] = total_paid
         context['remaining_balance'] = remaining_balance
 
-        # Partenaires avec leurs statistiques (réutiliser les objets déjà chargés)
-        partners_for_display = sorted(partners, key=lambda x: x.total_students_confirmed, reverse=True)
-        context['partners'] = partners_for_display
+        # Partenaires triés par nombre de confirmés depuis le dernier checkpoint
+        context['partners'] = partners
 
         # Paiements récents
         context['recent_payments'] = Payment.objects.select_related('partner').order_by('-created_at')[:10]
@@ -105,17 +122,22 @@ class AdminStatsView(UserPassesTestMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
+        # Codes actifs avec leur répartition en attente / confirmés (une requête GROUP BY)
+        codes_by_partner = {}
+        codes = PartnershipCode.objects.filter(
+            partner__status='active', is_active=True
+        ).with_counts()
+        for code in codes:
+            codes_by_partner.setdefault(code.partner_id, []).append(code)
+
         # Récupérer tous les partenaires avec stats
         partners_data = []
         for partner in Partner.objects.filter(status='active'):
-            # Codes du partenaire
-            codes = PartnershipCode.objects.filter(partner=partner, is_active=True)
-
             # Stats par code
             codes_stats = []
-            for code in codes:
-                pending_count = Student.objects.filter(referral_code=code.code, status='active', is_confirmed=False).count()
-                confirmed_count = Student.objects.filter(referral_code=code.code, status='active', is_confirmed=True).count()
+            for code in codes_by_partner.get(partner.id, []):
+                pending_count = code.pending_total
+                confirmed_count = code.confirmed_total
                 earned = partner.commission_per_student * confirmed_count
 
                 codes_stats.append({
@@ -159,17 +181,30 @@ class PartnerDashboardPublicView(DetailView):
         partnership_code = get_object_or_404(PartnershipCode, code=code.upper())
         return partnership_code.partner
 
+    def get_template_names(self):
+        # "Voir plus" (HTMX) : uniquement les lignes de la page suivante
+        if self.request.GET.get('cursor'):
+            return ['partnerships/partials/public-student-rows.html']
+        return super().get_template_names()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        partner = self.get_object()
+        partner = self.object
 
-        context['students'] = partner.students.filter(status='active').order_by('-enrollment_date')
-        context['total_students'] = partner.total_students
-        context['total_earned'] = partner.total_earned
-        context['total_paid'] = partner.total_paid
-        context['remaining_balance'] = partner.remaining_balance
-        context['payment_status'] = partner.payment_status
-        context['partnership_codes'] = partner.partnership_codes.filter(is_active=True)
+        context['students'], context['next_cursor'] = paginate_students(
+            partner.students.filter(status='active'), self.request.GET.get('cursor')
+        )
+        if self.request.GET.get('cursor'):
+            return context
+
+        context.update(get_partner_stats(partner.id, 'public', lambda: {
+            'total_students': partner.total_students,
+            'total_earned': partner.total_earned,
+            'total_paid': partner.total_paid,
+            'remaining_balance': partner.remaining_balance,
+            'payment_status': partner.payment_status,
+        }))
+        context['partnership_codes'] = partner.partnership_codes.filter(is_active=True).with_counts()
 
         return context
 
@@ -190,15 +225,14 @@ class PaymentsDashboardView(UserPassesTestMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # Récupérer tous les partenaires actifs
-        partners = Partner.objects.filter(status='active')
+        # Récupérer tous les partenaires actifs avec leurs statistiques (une requête)
+        partners = Partner.objects.filter(status='active').with_stats()
 
         # Calculer les montants pour chaque partenaire
         payment_data = []
         for p in partners:
-            # Calculer directement depuis les propriétés
-            total_earned = p.total_earned
-            total_paid = p.total_paid
+            total_earned = p.commission_per_student * p.confirmed_since_checkpoint_count
+            total_paid = p.paid_total
             remaining = max(total_earned - total_paid, 0)
 
             payment_data.append({
@@ -206,8 +240,8 @@ class PaymentsDashboardView(UserPassesTestMixin, TemplateView):
                 'total_earned': total_earned or 0,
                 'total_paid': total_paid or 0,
                 'remaining': remaining or 0,
-                'status': p.payment_status,
-                'student_count': p.total_students or 0
+                'status': Partner.get_payment_status(total_earned, total_earned),
+                'student_count': p.pending_count or 0
             })
 
         # Trier par montant restant décroissant
@@ -223,6 +257,44 @@ class PaymentsDashboardView(UserPassesTestMixin, TemplateView):
         return context
 
 
+class ExportCSVView(UserPassesTestMixin, View):
+    """
+    Export CSV en flux (élèves, paiements, reçus, checkpoints) - Superuser only
+
+    Filtres GET : partner (UUID), start et end (AAAA-MM-JJ, inclus).
+    """
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def handle_no_permission(self):
+        return HttpResponseForbidden("Accès refusé. Vous devez être superuser.")
+
+    def get(self, request, dataset):
+        if dataset not in EXPORTS:
+            raise Http404("Export inconnu")
+
+        try:
+            start = parse_date(request.GET.get('start'))
+            end = parse_date(request.GET.get('end'))
+        except ValueError:
+            raise BadRequest("Date invalide (format attendu: AAAA-MM-JJ)")
+
+        partner = None
+        if request.GET.get('partner'):
+            try:
+                partner = get_object_or_404(Partner, id=request.GET['partner'])
+            except ValidationError:
+                raise BadRequest("Partenaire invalide")
+
+        response = StreamingHttpResponse(
+            iter_csv(dataset, partner=partner, start=start, end=end),
+            content_type='text/csv; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{dataset}_{timezone.localdate():%Y%m%d}.csv"'
+        return response
+
+
 class PartnerLoginView(TemplateView):
     """Page de login pour les partenaires avec protection contre les tentatives brutes"""
     template_name = 'partnerships/partner-login.html'
@@ -327,44 +399,53 @@ class PartnerDashboardPersonalView(TemplateView):
 
         partner = get_object_or_404(Partner, id=partner_id)
 
-        # ====== DEPUIS LE DÉBUT ======
-        total_all_time_confirmed = partner.students.filter(
-            status='active', is_confirmed=True
-        ).count()
+        cursor = request.GET.get('cursor')
+        students, next_cursor = paginate_students(
+            partner.students.filter(status='active').select_related('program'), cursor
+        )
+        if cursor:
+            # "Voir plus" (HTMX) : uniquement les lignes de la page suivante
+            return render(request, 'partnerships/partials/partner-student-rows.html', {
+                'students': students,
+                'next_cursor': next_cursor,
+            })
+
+        context = {
+            'partner': partner,
+            **get_partner_stats(partner.id, 'personal', lambda: self._build_stats(partner)),
+            # Autres données
+            'students': students,
+            'next_cursor': next_cursor,
+            'checkpoints': partner.payment_checkpoints.all(),
+            'partnership_codes': partner.partnership_codes.filter(is_active=True).with_counts()
+        }
+
+        return render(request, self.template_name, context)
+
+    def _build_stats(self, partner):
+        """Statistiques du partenaire (une requête annotée)"""
+        stats = Partner.objects.with_stats().get(pk=partner.pk)
+
+        # ====== DEPUIS LE DÉBUT (élèves actifs) ======
+        total_all_time_confirmed = stats.active_confirmed_count
         total_revenue_all_time = partner.commission_per_student * total_all_time_confirmed
-        total_paid_all_checkpoints = partner.payment_checkpoints.aggregate(
-            total=Sum('amount_paid')
-        )['total'] or 0
-        total_remaining_payment = total_revenue_all_time - total_paid_all_checkpoints
 
         # ====== DEPUIS DERNIER CHECKPOINT ======
-        students_since_checkpoint = partner.total_students_confirmed
+        students_since_checkpoint = stats.confirmed_since_checkpoint_count
         revenue_since_checkpoint = partner.commission_per_student * students_since_checkpoint
 
-        # ====== EN ATTENTE ======
-        pending_students = partner.students.filter(
-            status='active', is_confirmed=False
-        ).count()
-
-        context = {
-            'partner': partner,
+        return {
             # Depuis checkpoint
-            'pending_count': pending_students,
+            'pending_count': stats.active_pending_count,
             'students_since_checkpoint': students_since_checkpoint,
             'revenue_since_checkpoint': revenue_since_checkpoint,
             # Total depuis le début
             'total_all_time_confirmed': total_all_time_confirmed,
             'total_revenue_all_time': total_revenue_all_time,
-            'total_paid_all_checkpoints': total_paid_all_checkpoints,
-            'total_remaining_payment': total_remaining_payment,
-            # Autres données
-            'students': partner.students.filter(status='active').order_by('-enrollment_date'),
-            'checkpoints': partner.payment_checkpoints.all(),
-            'partnership_codes': partner.partnership_codes.filter(is_active=True)
+            'total_paid_all_checkpoints': stats.paid_total,
+            'total_remaining_payment': stats.active_outstanding_total,
         }
 
-        return render(request, self.template_name, context)
-
 
 def partner_logout_view(request):
     """Déconnexion du partenaire"""
@@ -402,23 +483,26 @@ class PartnerPaymentHistoryView(TemplateView):
             payment__partner=partner
         ).select_related('payment').order_by('-created_at')
 
-        # Récupérer les montants du partenaire
-        partner_paid_amount = partner.total_paid
-        partner_confirmed_count = partner.total_students_confirmed
-        partner_confirmed_amount = partner.commission_per_student * partner_confirmed_count
-        partner_solde = partner_confirmed_amount - partner_paid_amount
-
         context = {
             'partner': partner,
             'receipts': receipts,
             'last_receipt': receipts.first() if receipts.exists() else None,
-            'partner_paid_amount': partner_paid_amount,
-            'partner_confirmed_amount': partner_confirmed_amount,
-            'partner_solde': partner_solde,
+            **get_partner_stats(partner.id, 'payment-history', lambda: self._build_stats(partner)),
         }
 
         return render(request, self.template_name, context)
 
+    def _build_stats(self, partner):
+        """Montants du partenaire"""
+        partner_paid_amount = partner.total_paid
+        partner_confirmed_count = partner.total_students_confirmed
+        partner_confirmed_amount = partner.commission_per_student * partner_confirmed_count
+        return {
+            'partner_paid_amount': partner_paid_amount,
+            'partner_confirmed_amount': partner_confirmed_amount,
+            'partner_solde': partner_confirmed_amount - partner_paid_amount,
+        }
+
 
 class AdminPartnerCreationView(UserPassesTestMixin, TemplateView):
     """Vue pour créer rapidement un partenaire et générer un QR code"""
@@ -466,24 +550,9 @@ class AdminPartnerCreationView(UserPassesTestMixin, TemplateView):
         # Construire l'URL d'inscription avec le code comme paramètre
         registration_url = request.build_absolute_uri(f'/register/?code={code}')
 
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(registration_url)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white")
-
-        # Convertir l'image en base64 pour l'afficher dans le template
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-
-        return img_str
+        # Image en cache, convertie en base64 pour l'afficher dans le template
+        _, png, _ = get_qr_png(registration_url, error_correction=ERROR_CORRECT_L)
+        return base64.b64encode(png).decode()
 
 
 class AdminStudentConfirmationView(UserPassesTestMixin, TemplateView):
@@ -496,21 +565,27 @@ class AdminStudentConfirmationView(UserPassesTestMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # Récupérer tous les partenaires actifs avec leurs étudiants
-        partners = Partner.objects.filter(status='active').prefetch_related('students')
+        # Récupérer tous les partenaires actifs avec leurs statistiques et leurs étudiants
+        partners = Partner.objects.filter(status='active').with_stats().prefetch_related(
+            Prefetch(
+                'students',
+                queryset=Student.objects.filter(status='active').select_related('program').order_by('-enrollment_date'),
+                to_attr='active_students',
+            )
+        )
 
         partners_data = []
         for partner in partners:
-            # Étudiants en attente de confirmation
-            pending_students = partner.students.filter(status='active', is_confirmed=False)
-            # Étudiants confirmés
-            confirmed_students = partner.students.filter(status='active', is_confirmed=True)
+            # Étudiants en attente de confirmation / confirmés
+            pending_students = [s for s in partner.active_students if not s.is_confirmed]
+            confirmed_students = [s for s in partner.active_students if s.is_confirmed]
 
-            pending_count = pending_students.count()
-            confirmed_count = confirmed_students.count()
+            # Élèves actifs seulement, comme les listes ci-dessus
+            pending_count = partner.active_pending_count
+            confirmed_count = partner.active_confirmed_count
             pending_amount = partner.commission_per_student * pending_count
             confirmed_amount = partner.commission_per_student * confirmed_count
-            paid_amount = partner.total_paid
+            paid_amount = partner.paid_total
             solde = confirmed_amount - paid_amount
 
             partners_data.append({
@@ -543,8 +618,10 @@ class ConfirmStudentHTMXView(UserPassesTestMixin, View):
         """Confirme l'inscription d'un étudiant"""
         student = get_object_or_404(Student, id=student_id)
         partner = student.partner
-        student.is_confirmed = True
-        student.save()
+        if not student.is_confirmed:
+            student.is_confirmed = True
+            student.save()
+            AuditLog.log_student_confirmation(student, user=request.user)
 
         # Calculer les montants
         partner_pending_count = partner.students.filter(status='active', is_confirmed=False).count()
@@ -584,40 +661,76 @@ class PaymentReceiptFormView(UserPassesTestMixin, View):
         })
 
 
+@method_decorator(csrf_exempt, name='dispatch')
 class PaymentReceiptUploadView(UserPassesTestMixin, View):
-    """Traite l'upload du reçu et met à jour les paiements"""
+    """
+    Traite l'upload du reçu et met à jour les paiements.
+
+    Le corps est lu par ReceiptUploadHandler (limite de taille en flux,
+    signature, SHA-256) : le middleware CSRF lirait request.POST avant la vue
+    avec les handlers par défaut, la vérification CSRF est donc faite dans post.
+    """
 
     def test_func(self):
         return self.request.user.is_superuser
 
     def post(self, request, partner_id):
-        """Traite l'upload et crée/met à jour le paiement"""
         partner = get_object_or_404(Partner, id=partner_id)
-        form = QuickPaymentForm(request.POST, request.FILES)
+        if request_too_large(request):
+            # Refusé sur le Content-Length annoncé, sans lire le corps
+            return render(request, 'partnerships/partials/payment-receipt-form.html', {
+                'form': QuickPaymentForm(),
+                'partner': partner,
+                'errors': {'receipt_image': [too_large_message()]},
+            }, status=413)
+
+        handler = ReceiptUploadHandler(request)
+        request.upload_handlers = [handler]
+        return self._post(request, partner, handler.errors)
+
+    @method_decorator(csrf_protect)
+    def _post(self, request, partner, upload_errors):
+        """Traite l'upload et crée/met à jour le paiement"""
+        form = QuickPaymentForm(request.POST, request.FILES, upload_errors=upload_errors)
 
         if form.is_valid():
             amount_paid = form.cleaned_data['amount_paid']
             receipt_image = form.cleaned_data['receipt_image']
             notes = form.cleaned_data.get('notes', '')
-
-            # Créer un paiement
-            payment = Payment.objects.create(
-                partner=partner,
-                amount=amount_paid,
-                status=Payment.COMPLETED,
-                completed_at=timezone.now(),
-                notes=notes
-            )
-            payment.remaining_amount = 0
-            payment.save()
-
-            # Créer le reçu associé
-            receipt = PaymentReceipt.objects.create(
-                payment=payment,
-                receipt_image=receipt_image,
-                amount_paid=amount_paid,
-                notes=notes
-            )
+            image_sha256 = file_sha256(receipt_image)
+
+            with transaction.atomic():
+                # Verrou du partenaire : deux envois simultanés (double clic) passent l'un après l'autre
+                Partner.objects.select_for_update().filter(pk=partner.pk).exists()
+
+                duplicate = PaymentReceipt.find_duplicate(partner, amount_paid, image_sha256)
+                if duplicate is not None:
+                    messages.warning(request, (
+                        f"Ce reçu de {amount_paid} DA a déjà été enregistré le "
+                        f"{timezone.localtime(duplicate.created_at):%d/%m/%Y à %H:%M} : aucun nouveau paiement créé."
+                    ))
+                    return redirect('payment-history', partner_id=partner.id)
+
+                # Créer un paiement
+                payment = Payment.objects.create(
+                    partner=partner,
+                    amount=amount_paid,
+                    status=Payment.COMPLETED,
+                    completed_at=timezone.now(),
+                    notes=notes
+                )
+                payment.remaining_amount = 0
+                payment.save()
+
+                # Créer le reçu associé (photo stockée une seule fois par contenu)
+                image_name, image_sha256 = store_receipt_image(receipt_image, image_sha256)
+                receipt = PaymentReceipt.objects.create(
+                    payment=payment,
+                    receipt_image=image_name,
+                    image_sha256=image_sha256,
+                    amount_paid=amount_paid,
+                    notes=notes
+                )
 
             # Rediriger vers la page d'historique
             return redirect('payment-history', partner_id=partner.id)
@@ -629,6 +742,41 @@ class PaymentReceiptUploadView(UserPassesTestMixin, View):
             }, status=400)
 
 
+class ReceiptFileView(View):
+    """
+    Photo d'un reçu (image, miniature ou original), pour l'admin ou le
+    partenaire connecté propriétaire. Envoyée par le serveur frontal si
+    RECEIPT_SENDFILE_BACKEND est configuré (partnerships/sendfile.py).
+    """
+    VARIANTS = {
+        'image': 'receipt_image',
+        'thumbnail': 'receipt_thumbnail',
+        'original': 'receipt_original',
+    }
+
+    def get(self, request, receipt_id, variant):
+        session_partner_id = request.session.get('partner_id')
+        is_admin = request.user.is_superuser
+
+        if not session_partner_id and not is_admin:
+            return redirect('partner-login')
+        if variant not in self.VARIANTS:
+            raise Http404("Version inconnue")
+
+        receipt = get_object_or_404(PaymentReceipt.objects.select_related('payment'), id=receipt_id)
+        if not is_admin and str(receipt.payment.partner_id) != session_partner_id:
+            return HttpResponseForbidden("Vous n'avez pas accès à ce reçu")
+
+        f = receipt.preview if variant == 'thumbnail' else getattr(receipt, self.VARIANTS[variant])
+        if not f:
+            raise Http404("Pas d'image")
+
+        # ETag fort : hash du contenu (store), ou du nom pour les fichiers antérieurs,
+        # jamais réécrits sous le même nom
+        key = ReceiptBlob.sha256_for(f.name) or hashlib.sha256(f.name.encode()).hexdigest()
+        return serve_file(request, f.storage, f.name, quote_etag(key), filename=os.path.basename(f.name))
+
+
 class PaymentReceiptListView(UserPassesTestMixin, TemplateView):
     """Affiche la liste des reçus de paiement pour un partenaire"""
     template_name = 'partnerships/partner-payment-history.html'
@@ -678,11 +826,12 @@ class PartnershipRequestView(CreateView):
     success_url = reverse_lazy('partnership-request-success')
 
     def form_valid(self, form):
-        response = super().form_valid(form)
+        with transaction.atomic():
+            response = super().form_valid(form)
 
-        # Envoyer un email au backend avec les informations du partenaire
-        request_obj = form.instance
-        self._send_partnership_email(request_obj)
+            # Envoyer un email au backend avec les informations du partenaire
+            request_obj = form.instance
+            self._send_partnership_email(request_obj)
 
         return response
 
@@ -710,17 +859,13 @@ Date de soumission: {request_obj.created_at.strftime('%d/%m/%Y à %H:%M')}
 ID de demande: {request_obj.id}
         """
 
-        try:
-            send_mail(
-                subject,
-                message,
-                'noreply@affiliation-irl.fr',
-                ['contact@affiliation-irl.fr'],  # À adapter avec votre email
-                fail_silently=False,
-            )
-        except Exception as e:
-            # Log l'erreur mais ne bloque pas la soumission du formulaire
-            print(f"Erreur lors de l'envoi du mail: {e}")
+        # Mis en file dans l'outbox : envoyé par la commande send_queued_emails
+        EmailOutbox.enqueue(
+            subject,
+            message,
+            ['contact@affiliation-irl.fr'],  # À adapter avec votre email
+            from_email='noreply@affiliation-irl.fr',
+        )
 
 
 class PartnershipRequestSuccessView(TemplateView):
@@ -739,36 +884,38 @@ class AdminPartnersManagementView(UserPassesTestMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # Récupérer tous les partenaires avec leurs infos
-        partners = Partner.objects.filter(status='active').prefetch_related(
-            'students', 'payment_checkpoints'
+        # Récupérer tous les partenaires avec leurs statistiques (une requête) et la première page
+        # de leurs étudiants en attente (un élève de plus pour savoir s'il reste une page)
+        partners = Partner.objects.filter(status='active').with_stats().prefetch_related(
+            Prefetch(
+                'students',
+                queryset=Student.objects.filter(
+                    status='active', is_confirmed=False
+                ).order_by(*STUDENTS_ORDERING)[:STUDENTS_PAGE_SIZE + 1],
+                to_attr='pending_students',
+            )
         ).order_by('-created_at')
 
         # Ajouter les stats pour chaque partenaire
         partners_data = []
         for partner in partners:
-            pending_students = partner.students.filter(
-                status='active', is_confirmed=False
-            ).order_by('-enrollment_date')
-
-            # ====== DEPUIS LE DÉBUT ======
-            total_confirmed_all_time = partner.students.filter(
-                status='active', is_confirmed=True
-            ).count()
+            # ====== DEPUIS LE DÉBUT (élèves actifs) ======
+            total_confirmed_all_time = partner.active_confirmed_count
             total_revenue_all_time = partner.commission_per_student * total_confirmed_all_time
-            total_paid_all_checkpoints = partner.payment_checkpoints.aggregate(
-                total=Sum('amount_paid')
-            )['total'] or 0
-            total_remaining_payment = total_revenue_all_time - total_paid_all_checkpoints
+            total_paid_all_checkpoints = partner.paid_total
+            total_remaining_payment = partner.active_outstanding_total
 
             # ====== DEPUIS DERNIER CHECKPOINT ======
-            students_since_checkpoint = partner.total_students_confirmed
+            students_since_checkpoint = partner.confirmed_since_checkpoint_count
             revenue_since_checkpoint = partner.commission_per_student * students_since_checkpoint
 
+            pending_students, pending_next_cursor = split_page(partner.pending_students)
+
             partners_data.append({
                 'partner': partner,
                 'pending_students': pending_students,
-                'pending_count': pending_students.count(),
+                'pending_next_cursor': pending_next_cursor,
+                'pending_count': partner.active_pending_count,
                 # Depuis checkpoint
                 'confirmed_count': students_since_checkpoint,
                 'revenue_since_checkpoint': revenue_since_checkpoint,
@@ -777,7 +924,7 @@ class AdminPartnersManagementView(UserPassesTestMixin, TemplateView):
                 'total_revenue_all_time': total_revenue_all_time,
                 'total_paid_all_checkpoints': total_paid_all_checkpoints,
                 'remaining_payment': total_remaining_payment,
-                'last_checkpoint': partner.get_last_checkpoint,
+                'last_checkpoint_date': partner.last_checkpoint_date,
             })
 
         context['partners_data'] = partners_data
@@ -836,8 +983,10 @@ class AdminConfirmStudentView(UserPassesTestMixin, View):
         from django.http import JsonResponse
 
         student = get_object_or_404(Student, id=student_id)
-        student.is_confirmed = True
-        student.save()
+        if not student.is_confirmed:
+            student.is_confirmed = True
+            student.save()
+            AuditLog.log_student_confirmation(student, user=request.user)
 
         return JsonResponse({
             'success': True,
@@ -845,25 +994,117 @@ class AdminConfirmStudentView(UserPassesTestMixin, View):
         })
 
 
+class AdminBulkConfirmStudentsView(UserPassesTestMixin, View):
+    """
+    Confirme plusieurs étudiants en une fois.
+
+    POST (formulaire ou JSON) : `student_ids` (liste d'UUID) et/ou
+    `partner_id` (tous les étudiants en attente du partenaire). Les
+    étudiants inactifs ne sont jamais confirmés.
+    Répond en JSON avec les soldes recalculés, ou redirige vers `next`.
+    """
+    login_url = '/admin/'
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def post(self, request):
+        from django.http import JsonResponse
+        from django.utils.http import url_has_allowed_host_and_scheme
+
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body)
+            except ValueError:
+                raise BadRequest("JSON invalide")
+            if not isinstance(data, dict):
+                raise BadRequest("Objet JSON attendu")
+            student_ids = data.get('student_ids') or []
+            partner_id = data.get('partner_id')
+        else:
+            student_ids = request.POST.getlist('student_ids')
+            partner_id = request.POST.get('partner_id')
+
+        if not student_ids and not partner_id:
+            raise BadRequest("student_ids ou partner_id requis")
+
+        # Seuls les étudiants actifs sont confirmés (filtré par bulk_confirm)
+        students = Student.objects.all()
+        try:
+            if student_ids:
+                students = students.filter(id__in=student_ids)
+            if partner_id:
+                students = students.filter(partner_id=partner_id)
+            confirmed, balances = Student.bulk_confirm(students, user=request.user)
+        except ValidationError:
+            raise BadRequest("Identifiant invalide")
+
+        next_url = request.POST.get('next')
+        if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+            messages.success(request, f'{confirmed} étudiant(s) confirmé(s)')
+            return redirect(next_url)
+
+        return JsonResponse({
+            'success': True,
+            'confirmed': confirmed,
+            'partners': [
+                {
+                    'id': str(partner_id),
+                    'students_pending': balance.students_pending,
+                    'students_confirmed': balance.students_confirmed,
+                    'students_confirmed_since_checkpoint': balance.students_confirmed_since_checkpoint,
+                    'total_paid': str(balance.total_paid),
+                }
+                for partner_id, balance in balances.items()
+            ],
+        })
+
+
 class AdminPartnerDetailView(UserPassesTestMixin, TemplateView):
     """Vue pour afficher les détails d'un partenaire"""
     template_name = 'partnerships/admin-partner-detail.html'
     login_url = '/admin/'
+    student_lists = {'pending': False, 'confirmed': True}
 
     def test_func(self):
         return self.request.user.is_superuser
 
+    def get_template_names(self):
+        # "Voir plus" (HTMX) : uniquement les élèves de la page suivante
+        if self.request.GET.get('cursor'):
+            return ['partnerships/partials/admin-student-items.html']
+        return super().get_template_names()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         partner_id = kwargs.get('partner_id')
 
         partner = get_object_or_404(Partner, id=partner_id)
 
-        # Récupérer tous les étudiants du partenaire
-        all_students = partner.students.filter(status='active').order_by('-enrollment_date')
+        # Étudiants du partenaire, paginés par curseur
+        all_students = partner.students.filter(status='active')
         pending_students = all_students.filter(is_confirmed=False)
         confirmed_students = all_students.filter(is_confirmed=True)
 
+        cursor = self.request.GET.get('cursor')
+        if cursor:
+            list_name = self.request.GET.get('list')
+            if list_name not in self.student_lists:
+                raise BadRequest('Liste d\'étudiants inconnue')
+            students, next_cursor = paginate_students(
+                all_students.filter(is_confirmed=self.student_lists[list_name]), cursor
+            )
+            context.update({
+                'partner': partner,
+                'students': students,
+                'next_cursor': next_cursor,
+                'list_name': list_name,
+            })
+            return context
+
+        pending_page, pending_next_cursor = paginate_students(pending_students)
+        confirmed_page, confirmed_next_cursor = paginate_students(confirmed_students)
+
         # Récupérer l'historique des checkpoints
         checkpoints = partner.payment_checkpoints.all()
 
@@ -893,9 +1134,10 @@ class AdminPartnerDetailView(UserPassesTestMixin, TemplateView):
 
         context.update({
             'partner': partner,
-            'all_students': all_students,
-            'pending_students': pending_students,
-            'confirmed_students': confirmed_students,
+            'pending_students': pending_page,
+            'pending_next_cursor': pending_next_cursor,
+            'confirmed_students': confirmed_page,
+            'confirmed_next_cursor': confirmed_next_cursor,
             'pending_count': pending_students.count(),
             'confirmed_count': confirmed_students.count(),
             'checkpoints': checkpoints,
@@ -923,7 +1165,7 @@ class PartnerCodesView(TemplateView):
             return redirect('partner-login')
 
         partner = get_object_or_404(Partner, id=partner_id)
-        codes = partner.partnership_codes.filter(is_active=True)
+        codes = partner.partnership_codes.filter(is_active=True).with_counts()
 
         context = {
             'partner': partner,
@@ -950,7 +1192,7 @@ class AdminPartnerCodesView(UserPassesTestMixin, TemplateView):
                 return redirect('admin-home')
             partner = get_object_or_404(Partner, id=partner_id)
 
-        codes = partner.partnership_codes.filter(is_active=True)
+        codes = partner.partnership_codes.filter(is_active=True).with_counts()
 
         context = {
             'partner': partner,
@@ -964,13 +1206,6 @@ class GenerateCodePDFView(View):
     """Génère un PDF avec le code et QR code"""
 
     def get(self, request, code_id):
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.units import cm
-        from PIL import Image
-        import tempfile
-        import os
-
         # Vérifier si c'est un partenaire connecté ou un admin
         partner_id = request.session.get('partner_id')
         is_admin = request.user.is_superuser
@@ -978,70 +1213,69 @@ class GenerateCodePDFView(View):
         if not partner_id and not is_admin:
             return redirect('partner-login')
 
-        code_obj = get_object_or_404(PartnershipCode, id=code_id)
+        code_obj = get_object_or_404(PartnershipCode.objects.select_related('partner'), id=code_id)
 
         # Vérifier les permissions
         if partner_id and str(code_obj.partner.id) != partner_id:
             return HttpResponseForbidden("Vous n'avez pas accès à ce code")
 
-        # Chemin du logo
-        logo_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logo_torii.png')
+        # PDF en cache par (code, partenaire, URL du site, version du modèle) ;
+        # la clé suffit pour répondre 304, sans rendre ni lire le PDF
+        base_url = request.build_absolute_uri('/')
+        etag = quote_etag(code_pdf_key(code_obj.code, code_obj.partner.name, base_url))
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
+
+        _, pdf = get_code_pdf(code_obj.code, code_obj.partner.name, base_url)
+
+        response = HttpResponse(pdf, content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="Code_{code_obj.code}.pdf"'
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
 
-        # Construire l'URL d'inscription avec le code pré-rempli
-        from django.urls import reverse
-        registration_url = request.build_absolute_uri(reverse('student-register'))
-        registration_url_with_code = f"{registration_url}?code={code_obj.code}"
+class GenerateCodesPDFView(View):
+    """
+    Génère un seul PDF (une page par code) avec tous les codes actifs.
 
-        # Générer le QR code avec l'URL complète (pas juste le code)
-        qr = qrcode.QRCode(version=2, box_size=10, border=2)
-        qr.add_data(registration_url_with_code)
-        qr.make(fit=True)
-        qr_img = qr.make_image(fill_color="black", back_color="white")
+    Un partenaire connecté obtient ses propres codes ; un admin ceux du
+    partenaire demandé, ou de tous les partenaires sans partner_id.
+    """
 
-        # Sauvegarder le QR code temporairement
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_qr_file:
-            qr_tmp_path = tmp_qr_file.name
-            qr_img.save(qr_tmp_path, format='PNG')
+    def get(self, request, partner_id=None):
+        session_partner_id = request.session.get('partner_id')
+        is_admin = request.user.is_superuser
 
-        # Créer le PDF
-        pdf_buffer = io.BytesIO()
-        c = canvas.Canvas(pdf_buffer, pagesize=A4)
-        width, height = A4
+        if not session_partner_id and not is_admin:
+            return redirect('partner-login')
 
-        # Logo en haut à gauche (très gros)
-        if os.path.exists(logo_path):
-            logo_size_pdf = 5 * cm
-            c.drawImage(logo_path, 0.5*cm, height - 5.5*cm, width=logo_size_pdf, height=logo_size_pdf)
+        if session_partner_id:
+            if partner_id and str(partner_id) != session_partner_id:
+                return HttpResponseForbidden("Vous n'avez pas accès à ces codes")
+            partner_id = session_partner_id
 
-        # Titre
-        c.setFont("Helvetica-Bold", 24)
-        c.drawCentredString(width/2, height - 6*cm, "CODE PARTENAIRE")
+        codes = PartnershipCode.objects.filter(is_active=True).select_related('partner')
+        if partner_id:
+            partner = get_object_or_404(Partner, id=partner_id)
+            codes = codes.filter(partner=partner)
+            filename = f'Codes_{slugify(partner.name)}.pdf'
+        else:
+            filename = 'Codes_partenaires.pdf'
 
-        # Sous-titre avec Institut Torii
-        c.setFont("Helvetica", 14)
-        c.drawCentredString(width/2, height - 7*cm, "Institut Torii")
+        codes = [(code.code, code.partner.name) for code in codes.order_by('partner__name', 'code')]
+        if not codes:
+            raise Http404("Aucun code actif")
 
-        # Code (gros)
-        c.setFont("Helvetica-Bold", 48)
-        c.drawCentredString(width/2, height - 10.5*cm, code_obj.code)
+        base_url = request.build_absolute_uri('/')
+        etag = quote_etag(codes_pdf_key(codes, base_url))
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
 
-        # QR Code avec logo
-        try:
-            qr_size = 7*cm
-            qr_x = (width - qr_size) / 2
-            qr_y = height - 14*cm
-            c.drawImage(qr_tmp_path, qr_x, qr_y, width=qr_size, height=qr_size)
-        finally:
-            os.unlink(qr_tmp_path)
-
-        # Description
-        c.setFont("Helvetica", 12)
-        c.drawCentredString(width/2, qr_y - 1*cm, f"Partenaire: {code_obj.partner.name}")
-        c.drawCentredString(width/2, qr_y - 1.5*cm, "Scannez le code QR pour vous inscrire")
-
-        c.save()
-        pdf_buffer.seek(0)
-
-        response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="Code_{code_obj.code}.pdf"'
+        _, pdf = get_codes_pdf(codes, base_url)
+
+        response = HttpResponse(pdf, content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
         return response
@@ -1,5 +1,13 @@
+import io
+
 from django.contrib import admin
-from .models import Student, Program
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
+from .forms import StudentImportForm
+from .imports import import_students_csv
+from .models import EmailOutbox, Student, Program
+from partnerships.models import AuditLog
 
 
 @admin.register(Program)
@@ -24,13 +32,15 @@ class StudentAdmin(admin.ModelAdmin):
     list_display = ('full_name', 'email', 'partner', 'program', 'status', 'confirmation_display', 'enrollment_date')
     list_filter = ('status', 'is_confirmed', 'program', 'partner', 'enrollment_date')
     search_fields = ('full_name', 'email', 'referral_code')
-    readonly_fields = ('id', 'enrollment_date', 'created_at', 'updated_at')
+    readonly_fields = ('id', 'enrollment_date', 'confirmed_at', 'created_at', 'updated_at')
+    raw_id_fields = ('partnership_code',)
+    list_select_related = ('partner', 'program')
     fieldsets = (
         ('Informations personnelles', {
             'fields': ('id', 'full_name', 'email', 'phone')
         }),
         ('Inscription et partenariat', {
-            'fields': ('partner', 'referral_code', 'program', 'status', 'is_confirmed')
+            'fields': ('partner', 'referral_code', 'partnership_code', 'program', 'status', 'is_confirmed', 'confirmed_at')
         }),
         ('Métadonnées', {
             'fields': ('enrollment_date', 'created_at', 'updated_at'),
@@ -38,6 +48,14 @@ class StudentAdmin(admin.ModelAdmin):
         }),
     )
 
+    actions = ['confirm_selected']
+    change_list_template = 'admin/students/student/change_list.html'
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if obj.is_confirmed and 'is_confirmed' in form.changed_data:
+            AuditLog.log_student_confirmation(obj, user=request.user)
+
     def confirmation_display(self, obj):
         """Affiche le statut de confirmation avec un emoji"""
         if obj.is_confirmed:
@@ -45,3 +63,54 @@ class StudentAdmin(admin.ModelAdmin):
         else:
             return '⏳ En attente'
     confirmation_display.short_description = 'Confirmation'
+
+    @admin.action(description='Confirmer les étudiants sélectionnés')
+    def confirm_selected(self, request, queryset):
+        confirmed, _ = Student.bulk_confirm(queryset, user=request.user)
+        self.message_user(request, f'{confirmed} étudiant(s) confirmé(s)')
+
+    def get_urls(self):
+        return [
+            path('import-csv/', self.admin_site.admin_view(self.import_csv_view), name='students_student_import_csv'),
+        ] + super().get_urls()
+
+    def import_csv_view(self, request):
+        """Import d'élèves depuis un CSV (voir students/imports.py)"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        report = None
+        form = StudentImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            # Lecture en flux du fichier uploadé ; utf-8-sig accepte les CSV d'Excel
+            f = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                report = import_students_csv(f, send_emails=form.cleaned_data['send_emails'])
+            except UnicodeDecodeError:
+                form.add_error('file', "Le fichier doit être encodé en UTF-8.")
+            else:
+                self.message_user(request, f'{report.created} élève(s) importé(s), {len(report.errors)} ligne(s) rejetée(s)')
+
+        return TemplateResponse(request, 'admin/students/student/import_csv.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Importer des élèves (CSV)',
+            'form': form,
+            'report': report,
+            'errors': report.errors[:500] if report else [],
+        })
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'recipients')
+    readonly_fields = ('created_at', 'sent_at', 'attempts', 'last_error')
+    actions = ['retry_now']
+
+    @admin.action(description='Renvoyer maintenant')
+    def retry_now(self, request, queryset):
+        from django.utils import timezone
+        count = queryset.exclude(status='sent').update(status='pending', next_attempt_at=timezone.now())
+        self.message_user(request, f'{count} email(s) remis en file')
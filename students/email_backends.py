@@ -0,0 +1,205 @@
+"""
+Backend email SMTP avec pool de connexions.
+
+Le backend SMTP de Django ouvre et ferme une session TLS authentifiée à chaque
+envoi. Ce backend garde un pool borné de connexions ouvertes (partagé par
+processus), répartit les messages d'un lot sur ces connexions en parallèle,
+reconnecte une connexion cassée et retient le résultat de chaque message.
+
+    EMAIL_BACKEND = "students.email_backends.PooledSMTPEmailBackend"
+    EMAIL_POOL_SIZE = 4
+"""
+import atexit
+import queue
+import smtplib
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail.backends import smtp
+
+# Erreurs qui indiquent une connexion perdue : on reconnecte et on réessaie une fois.
+# Pas OSError en entier : c'est la classe de base de toutes les SMTPException
+# (destinataire refusé, données refusées...), qui ne justifient pas de renvoyer.
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, socket.timeout)
+
+
+class ConnectionPool:
+    """Pool borné de connexions SMTP (une par backend Django sous-jacent)"""
+
+    def __init__(self, size, factory):
+        self.size = size
+        self.factory = factory
+        self._idle = queue.LifoQueue()
+        # Emplacements libres : None = connexion pas encore ouverte
+        for _ in range(size):
+            self._idle.put(None)
+
+    def acquire(self):
+        backend = self._idle.get()
+        try:
+            if backend is None:
+                backend = self.factory()
+            elif not self._is_alive(backend):
+                backend.close()
+                backend.open()
+        except Exception:
+            # Rendre l'emplacement au pool pour une prochaine tentative
+            self._idle.put(None)
+            raise
+        return backend
+
+    def release(self, backend):
+        self._idle.put(backend)
+
+    def close(self):
+        while True:
+            try:
+                backend = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if backend is not None:
+                backend.close()
+
+    @staticmethod
+    def _is_alive(backend):
+        if backend.connection is None:
+            return False
+        try:
+            return backend.connection.noop()[0] == 250
+        except CONNECTION_ERRORS:
+            return False
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, size, factory):
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(size, factory)
+        return _pools[key]
+
+
+@atexit.register
+def close_pools():
+    """Ferme toutes les connexions du processus"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+class PooledSMTPEmailBackend(smtp.EmailBackend):
+    """
+    Backend SMTP dont les connexions restent ouvertes entre les envois.
+
+    send_messages() garde la sémantique de send_mass_mail (nombre de messages
+    envoyés, exception sauf fail_silently) ; le détail par message est dans
+    `results` ((message, erreur ou None), dans l'ordre) et le débit du dernier
+    lot dans `throughput` (messages par seconde).
+    """
+
+    def __init__(self, pool_size=None, **kwargs):
+        super().__init__(**kwargs)
+        self.pool_size = pool_size or getattr(settings, 'EMAIL_POOL_SIZE', 2)
+        self.results = []
+        self.throughput = 0
+
+    @property
+    def pool(self):
+        key = (self.host, self.port, self.username, self.use_tls, self.use_ssl)
+        return get_pool(key, self.pool_size, self._new_connection)
+
+    def _new_connection(self):
+        backend = smtp.EmailBackend(
+            host=self.host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            use_tls=self.use_tls,
+            use_ssl=self.use_ssl,
+            timeout=self.timeout,
+            ssl_keyfile=self.ssl_keyfile,
+            ssl_certfile=self.ssl_certfile,
+            fail_silently=False,
+        )
+        backend.open()
+        return backend
+
+    def open(self):
+        # Les connexions sont ouvertes à la demande par le pool
+        return False
+
+    def close(self):
+        # Les connexions restent dans le pool pour les prochains envois
+        pass
+
+    def send_messages(self, email_messages):
+        results = self.send_batch(email_messages)
+        errors = [error for _, error in results if error is not None]
+        if errors and not self.fail_silently:
+            raise errors[0]
+        return len(results) - len(errors)
+
+    def send_batch(self, email_messages):
+        """Envoie le lot sur le pool ; retourne [(message, erreur ou None)] dans l'ordre"""
+        email_messages = list(email_messages)
+        if not email_messages:
+            self.results = []
+            return self.results
+
+        started = time.monotonic()
+        workers = min(self.pool_size, len(email_messages))
+        # Un sous-lot par connexion : les messages d'une connexion partent à la suite
+        chunks = [email_messages[i::workers] for i in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunk_results = list(executor.map(self._send_chunk, chunks))
+
+        by_message = {id(message): error for results in chunk_results for message, error in results}
+        self.results = [(message, by_message[id(message)]) for message in email_messages]
+
+        elapsed = time.monotonic() - started
+        self.throughput = len(email_messages) / elapsed if elapsed else 0
+        return self.results
+
+    def _send_chunk(self, email_messages):
+        results = []
+        try:
+            backend = self.pool.acquire()
+        except Exception as e:
+            # Serveur injoignable : tout le sous-lot échoue
+            return [(message, e) for message in email_messages]
+
+        try:
+            for message in email_messages:
+                results.append((message, self._send_one(backend, message)))
+        finally:
+            self.pool.release(backend)
+        return results
+
+    def _send_one(self, backend, message):
+        """Envoie un message ; reconnecte et réessaie une fois si la connexion est perdue"""
+        for attempt in range(2):
+            try:
+                with backend._lock:
+                    if not backend._send(message):
+                        return ValueError("Message sans destinataire")
+                return None
+            except CONNECTION_ERRORS as e:
+                try:
+                    backend.close()
+                except Exception:
+                    # Socket déjà fermée : l'erreur de ce message suffit
+                    pass
+                if attempt:
+                    return e
+                try:
+                    backend.open()
+                except Exception as e:
+                    return e
+            except Exception as e:
+                return e
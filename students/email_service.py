@@ -1,11 +1,25 @@
-"""Service pour envoyer les emails d'inscription - SIMPLIFIÉ"""
-from django.core.mail import send_mail
+"""
+Service des emails d'inscription.
+
+Les emails ne sont pas envoyés pendant la requête : ils sont écrits dans
+l'outbox (EmailOutbox) dans la transaction de l'inscription, puis envoyés
+par la commande `send_queued_emails`.
+
+En mode digest (EMAIL_DIGEST_ENABLED), les notifications partenaire et admin
+sont regroupées par destinataire : un seul email par fenêtre EMAIL_DIGEST_WINDOW.
+"""
+from collections import defaultdict
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
 from django.template.loader import render_to_string
 from django.conf import settings
 
+from .models import EmailDigestEntry, EmailOutbox, Student
 
-def send_student_registration_email(student):
-    """Envoie un email de confirmation à l'étudiant"""
+
+def _student_registration_email(student):
+    """(sujet, message, destinataires) de l'email de confirmation à l'étudiant"""
     subject = "Inscription réussie - École d'Affiliation"
 
     context = {
@@ -13,27 +27,11 @@ def send_student_registration_email(student):
     }
 
     message = render_to_string('emails/student_registration.txt', context)
+    return subject, message, [student.email]
 
-    try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[student.email],
-            fail_silently=False,
-        )
-        print(f"✅ Email envoyé à l'étudiant: {student.email}")
-        return True
-    except Exception as e:
-        print(f"❌ Erreur lors de l'envoi à {student.email}: {str(e)}")
-        return False
-
-
-def send_partner_notification_email(student):
-    """Envoie une notification au partenaire pour une nouvelle inscription"""
-    if not student.partner:
-        return False
 
+def _partner_notification_email(student):
+    """(sujet, message, destinataires) de la notification au partenaire"""
     partner = student.partner
     subject = f"Nouvelle inscription via votre code {student.referral_code}"
 
@@ -43,34 +41,12 @@ def send_partner_notification_email(student):
     }
 
     message = render_to_string('emails/partner_notification.txt', context)
-
-    try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[partner.email],
-            fail_silently=False,
-        )
-        print(f"✅ Notification envoyée au partenaire: {partner.email}")
-        return True
-    except Exception as e:
-        print(f"❌ Erreur lors de l'envoi au partenaire: {str(e)}")
-        return False
+    return subject, message, [partner.email]
 
 
-def send_admin_notification_email(student):
-    """Envoie une notification aux admins"""
-    if not student.partner:
-        return False
-
+def _admin_notification_email(student, admin_emails):
+    """(sujet, message, destinataires) de la notification aux admins"""
     partner = student.partner
-    admin_emails = [admin[1] for admin in settings.ADMINS]
-
-    if not admin_emails:
-        print("⚠️ Aucun email admin configuré")
-        return False
-
     subject = f"Nouvelle inscription: {student.full_name} chez {partner.name}"
 
     context = {
@@ -79,17 +55,216 @@ def send_admin_notification_email(student):
     }
 
     message = render_to_string('emails/admin_notification.txt', context)
+    return subject, message, admin_emails
 
-    try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=admin_emails,
-            fail_silently=False,
+
+def _admin_emails():
+    return [admin[1] for admin in settings.ADMINS]
+
+
+def queue_student_registration_email(student):
+    """Met en file l'email de confirmation à l'étudiant"""
+    return EmailOutbox.enqueue(*_student_registration_email(student))
+
+
+def queue_partner_notification_email(student):
+    """Met en file la notification au partenaire pour une nouvelle inscription"""
+    if not student.partner:
+        return None
+
+    if settings.EMAIL_DIGEST_ENABLED:
+        return EmailDigestEntry.add('partner', [student.partner.email], student)
+
+    return EmailOutbox.enqueue(*_partner_notification_email(student))
+
+
+def queue_admin_notification_email(student):
+    """Met en file la notification aux admins"""
+    if not student.partner:
+        return None
+
+    admin_emails = _admin_emails()
+
+    if not admin_emails:
+        return None
+
+    if settings.EMAIL_DIGEST_ENABLED:
+        return EmailDigestEntry.add('admin', admin_emails, student)
+
+    return EmailOutbox.enqueue(*_admin_notification_email(student, admin_emails))
+
+
+def queue_registration_emails(student):
+    """Met en file les 3 emails d'une inscription"""
+    queue_student_registration_email(student)
+    queue_partner_notification_email(student)
+    queue_admin_notification_email(student)
+
+
+def queue_registration_emails_bulk(students, batch_size=500):
+    """
+    Met en file les emails de plusieurs inscriptions (import CSV) : mêmes
+    emails que queue_registration_emails, écrits en quelques bulk_create.
+
+    Retourne (emails mis en file, entrées de digest).
+    """
+    admin_emails = _admin_emails()
+    emails, entries = [], []
+    for student in students:
+        emails.append(EmailOutbox.build(*_student_registration_email(student)))
+        if not student.partner:
+            continue
+
+        if settings.EMAIL_DIGEST_ENABLED:
+            entries.append(EmailDigestEntry(kind='partner', recipient=student.partner.email, student=student))
+            entries.extend(
+                EmailDigestEntry(kind='admin', recipient=recipient, student=student)
+                for recipient in admin_emails
+            )
+            continue
+
+        emails.append(EmailOutbox.build(*_partner_notification_email(student)))
+        if admin_emails:
+            emails.append(EmailOutbox.build(*_admin_notification_email(student, admin_emails)))
+
+    EmailOutbox.objects.bulk_create(emails, batch_size=batch_size)
+    EmailDigestEntry.objects.bulk_create(entries, batch_size=batch_size)
+    return len(emails), len(entries)
+
+
+def _digest_email(kind, students):
+    """Sujet et message d'un digest, à partir des templates emails/*_digest.txt"""
+    if kind == 'partner':
+        partner = students[0].partner
+        subject = f"{len(students)} nouvelle(s) inscription(s) via vos codes"
+        message = render_to_string('emails/partner_notification_digest.txt', {
+            'students': students,
+            'partner': partner,
+        })
+    else:
+        subject = f"{len(students)} nouvelle(s) inscription(s) à confirmer"
+        message = render_to_string('emails/admin_notification_digest.txt', {
+            'students': students,
+        })
+    return subject, message
+
+
+def flush_email_digests(window=None):
+    """
+    Met en file un email récapitulatif par destinataire dont la fenêtre est écoulée.
+
+    Retourne le nombre de digests mis en file.
+    """
+    window = settings.EMAIL_DIGEST_WINDOW if window is None else window
+    due = EmailDigestEntry.due_recipients(window)
+    if not due:
+        return 0
+
+    with transaction.atomic():
+        entries = EmailDigestEntry.objects.select_for_update().filter(
+            recipient__in={recipient for _, recipient in due}
         )
-        print(f"✅ Notification admin envoyée: {', '.join(admin_emails)}")
-        return True
+
+        groups = defaultdict(list)
+        for entry in entries:
+            if (entry.kind, entry.recipient) in due:
+                groups[(entry.kind, entry.recipient)].append(entry)
+
+        # Élèves chargés à part : le verrou ne porte que sur les entrées du digest
+        students = Student.objects.select_related('program', 'partner').in_bulk(
+            {entry.student_id for group in groups.values() for entry in group}
+        )
+        for (kind, recipient), group in groups.items():
+            subject, message = _digest_email(kind, [students[entry.student_id] for entry in group])
+            EmailOutbox.enqueue(subject, message, [recipient])
+
+        EmailDigestEntry.objects.filter(
+            pk__in=[entry.pk for group in groups.values() for entry in group]
+        ).delete()
+
+    return len(groups)
+
+
+def _reopen(connection):
+    """Rouvre la connexion SMTP après une erreur ; retourne l'erreur éventuelle"""
+    connection.close()
+    try:
+        connection.open()
     except Exception as e:
-        print(f"❌ Erreur lors de l'envoi aux admins: {str(e)}")
-        return False
+        return e
+    return None
+
+
+def _message(email, connection):
+    return EmailMessage(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.recipients,
+        connection=connection,
+    )
+
+
+def send_queued_emails(batch_size=100, max_attempts=5, backoff=60, connection=None):
+    """
+    Envoie un lot d'emails de l'outbox sur une seule connexion SMTP, ou sur le
+    pool de connexions si le backend en a un (PooledSMTPEmailBackend).
+
+    Le lot est réservé dans une transaction courte (EmailOutbox.claim) ; les
+    envois se font hors transaction et chaque email est marqué par sa propre
+    écriture, sans garder de verrou pendant les échanges SMTP.
+
+    Un échec reprogramme l'email avec un délai exponentiel (backoff, 2×backoff, ...)
+    jusqu'à max_attempts tentatives. Retourne (envoyés, échecs).
+    """
+    connection = connection or get_connection(fail_silently=False)
+    sent = failed = 0
+
+    emails = EmailOutbox.claim(batch_size)
+    if not emails:
+        return sent, failed
+
+    # Repris après l'arrêt d'un worker : l'email a peut-être fait tomber les précédents
+    exhausted = [email for email in emails if email.attempts > max_attempts]
+    for email in exhausted:
+        email.mark_failed("Bail expiré : envoi interrompu trop souvent", max_attempts, backoff)
+        failed += 1
+    emails = [email for email in emails if email.attempts <= max_attempts]
+    if not emails:
+        return sent, failed
+
+    if hasattr(connection, 'send_batch'):
+        # Tout le lot réparti sur le pool, avec le résultat de chaque message
+        results = connection.send_batch([_message(email, connection) for email in emails])
+        for email, (_, error) in zip(emails, results):
+            if error is None:
+                email.mark_sent()
+                sent += 1
+            else:
+                email.mark_failed(error, max_attempts, backoff)
+                failed += 1
+        return sent, failed
+
+    error = _reopen(connection)
+    try:
+        for email in emails:
+            if error is not None:
+                # Serveur injoignable : inutile d'essayer le reste du lot
+                email.mark_failed(error, max_attempts, backoff)
+                failed += 1
+                continue
+
+            try:
+                _message(email, connection).send()
+            except Exception as e:
+                email.mark_failed(e, max_attempts, backoff)
+                failed += 1
+                # La connexion est peut-être cassée : repartir d'une connexion neuve
+                error = _reopen(connection)
+            else:
+                email.mark_sent()
+                sent += 1
+    finally:
+        connection.close()
+
+    return sent, failed
@@ -42,9 +42,9 @@ class StudentRegistrationForm(forms.ModelForm):
         if not referral_code:
             raise forms.ValidationError("Le code partenaire est requis.")
 
-        # Vérifier si le code existe et est actif
+        # Vérifier si le code existe et est actif (gardé pour save() : une seule requête)
         try:
-            partnership = PartnershipCode.objects.get(
+            self.partnership_code = PartnershipCode.objects.select_related('partner').get(
                 code=referral_code.strip().upper(),
                 is_active=True,
                 partner__status='active'
@@ -58,14 +58,19 @@ class StudentRegistrationForm(forms.ModelForm):
 
     def save(self, commit=True):
         student = super().save(commit=False)
-        referral_code = self.cleaned_data.get('referral_code')
 
-        # Trouver le partenaire associé au code
-        partnership = PartnershipCode.objects.get(code=referral_code)
+        # Partenaire associé au code, trouvé par clean_referral_code
+        partnership = self.partnership_code
         student.partner = partnership.partner
-        student.referral_code = referral_code
+        student.partnership_code = partnership
+        student.referral_code = self.cleaned_data.get('referral_code')
 
         if commit:
             student.save()
 
         return student
+
+
+class StudentImportForm(forms.Form):
+    file = forms.FileField(label="Fichier CSV", help_text="Colonnes: full_name, email, phone, referral_code, program")
+    send_emails = forms.BooleanField(label="Envoyer les emails d'inscription", required=False, initial=True)
@@ -0,0 +1,203 @@
+"""
+Import d'élèves depuis un fichier CSV (tableurs des partenaires).
+
+Le fichier est lu en flux et traité par paquets : les codes partenaires sont
+résolus avec in_bulk (chaque code n'est cherché qu'une fois pour tout le
+fichier), les emails déjà inscrits en une requête par paquet, puis les
+élèves et leurs emails sont insérés avec bulk_create. Les
+lignes invalides sont écartées et décrites dans le rapport d'erreurs.
+
+Les emails sont comparés sans tenir compte de la casse. Si un paquet se
+heurte malgré tout à la contrainte d'unicité (inscription concurrente), il
+est repris ligne par ligne et seules les lignes en conflit sont rejetées.
+
+Colonnes : full_name (ou nom), email, phone (ou telephone), referral_code
+(ou code), program (ou programme, nom du programme). Seuls email et
+referral_code sont obligatoires ; le format de export_csv students est accepté.
+"""
+import csv
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from partnerships.models import PartnershipCode
+from partnerships.signals import refresh_partner_balance
+from .email_service import queue_registration_emails_bulk
+from .models import Program, Student
+
+CHUNK_SIZE = 1000
+BATCH_SIZE = 500
+
+HEADER_ALIASES = {
+    'nom': 'full_name',
+    'telephone': 'phone',
+    'code': 'referral_code',
+    'programme': 'program',
+}
+
+ERROR_REPORT_HEADER = ['ligne', 'email', 'erreurs']
+
+
+class ImportReport:
+    """Résultat d'un import : lignes lues, élèves créés, erreurs (ligne, email, message)"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+
+    def write_errors(self, f):
+        """Écrit le rapport d'erreurs en CSV dans le fichier texte `f`"""
+        writer = csv.writer(f)
+        writer.writerow(ERROR_REPORT_HEADER)
+        writer.writerows(self.errors)
+
+
+def import_students_csv(f, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, send_emails=True, dry_run=False):
+    """
+    Importe les élèves du fichier texte CSV `f` ; retourne un ImportReport.
+
+    Chaque paquet est inséré dans sa propre transaction avec ses emails
+    (outbox ou digest). Avec dry_run, les lignes sont seulement validées.
+    """
+    reader = csv.DictReader(f)
+    reader.fieldnames = [_column(name) for name in reader.fieldnames or []]
+
+    report = ImportReport()
+    codes, unknown_codes = {}, set()
+    programs = {program.name.lower(): program for program in Program.objects.all()}
+    seen_emails = set()
+    partner_ids = set()
+
+    # Ligne 1 : en-tête
+    rows = enumerate(reader, start=2)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        report.rows += len(chunk)
+
+        # Codes jamais vus dans ce fichier : une requête pour tout le paquet
+        wanted = {_value(row, 'referral_code').upper() for _, row in chunk} - codes.keys() - unknown_codes
+        if wanted:
+            found = PartnershipCode.objects.filter(
+                is_active=True, partner__status='active'
+            ).select_related('partner').in_bulk(wanted, field_name='code')
+            codes.update(found)
+            unknown_codes.update(wanted - found.keys())
+
+        existing = set(Student.objects.annotate(email_lower=Lower('email')).filter(
+            email_lower__in=[_value(row, 'email').lower() for _, row in chunk]
+        ).values_list('email_lower', flat=True))
+
+        students = []
+        for line, row in chunk:
+            student, errors = _build_student(row, codes, programs, (existing, seen_emails))
+            if errors:
+                report.errors.append((line, _value(row, 'email'), ' ; '.join(errors)))
+                continue
+            seen_emails.add(student.email.lower())
+            students.append((line, student))
+
+        if dry_run or not students:
+            continue
+
+        try:
+            created = _insert(students, report, batch_size, send_emails, retry=False)
+        except IntegrityError:
+            # Email inscrit entre la vérification et l'insertion : ligne par ligne
+            created = _insert(students, report, batch_size, send_emails, retry=True)
+        report.created += len(created)
+        partner_ids.update(student.partner_id for student in created)
+
+    # bulk_create ne déclenche pas les signaux : soldes recalculés une fois par partenaire
+    for partner_id in partner_ids:
+        refresh_partner_balance(partner_id)
+
+    return report
+
+
+def _insert(students, report, batch_size, send_emails, retry):
+    """
+    Insère les élèves du paquet ((ligne, élève)) et leurs emails dans une
+    transaction ; retourne les élèves créés. Avec retry, chaque ligne a son
+    savepoint et un conflit d'unicité part dans le rapport d'erreurs.
+    """
+    with transaction.atomic():
+        if not retry:
+            created = [student for _, student in students]
+            Student.objects.bulk_create(created, batch_size=batch_size)
+        else:
+            created = []
+            for line, student in students:
+                try:
+                    with transaction.atomic():
+                        Student.objects.bulk_create([student])
+                except IntegrityError:
+                    report.errors.append((line, student.email, "Email déjà inscrit"))
+                else:
+                    created.append(student)
+        if send_emails and created:
+            queue_registration_emails_bulk(created, batch_size=batch_size)
+    return created
+
+
+def _column(name):
+    name = (name or '').strip().lower()
+    return HEADER_ALIASES.get(name, name)
+
+
+def _value(row, column):
+    return (row.get(column) or '').strip()
+
+
+def _build_student(row, codes, programs, taken_emails):
+    """
+    (élève non enregistré, []) ou (None, erreurs) pour une ligne du CSV.
+    `taken_emails` : ensembles d'emails déjà pris, en minuscules (base, lignes précédentes).
+    """
+    errors = []
+    full_name = _value(row, 'full_name')
+    email = _value(row, 'email')
+    phone = _value(row, 'phone')
+    code = _value(row, 'referral_code').upper()
+    program_name = _value(row, 'program')
+
+    try:
+        validate_email(email)
+    except ValidationError:
+        errors.append("Email invalide")
+    else:
+        if any(email.lower() in emails for emails in taken_emails):
+            errors.append("Email déjà inscrit")
+
+    if len(full_name) > Student._meta.get_field('full_name').max_length:
+        errors.append("Nom trop long")
+    if len(phone) > Student._meta.get_field('phone').max_length:
+        errors.append("Téléphone trop long")
+
+    partnership = codes.get(code)
+    if partnership is None:
+        errors.append("Code partenaire invalide ou inactif" if code else "Code partenaire manquant")
+
+    program = None
+    if program_name:
+        program = programs.get(program_name.lower())
+        if program is None:
+            errors.append(f"Programme inconnu: {program_name}")
+
+    if errors:
+        return None, errors
+
+    return Student(
+        full_name=full_name or None,
+        email=email,
+        phone=phone,
+        partner=partnership.partner,
+        partnership_code=partnership,
+        referral_code=partnership.code,
+        program=program,
+    ), []
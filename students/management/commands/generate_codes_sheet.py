@@ -0,0 +1,67 @@
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from partnerships.models import Partner, PartnershipCode
+from partnerships.pdf import get_codes_pdf
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un seul PDF (une page par code) avec tous les codes actifs "
+        "d'un partenaire, ou de tous les partenaires."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partner', help='ID ou nom du partenaire (défaut: tous les partenaires)')
+        parser.add_argument(
+            '--base-url',
+            default=settings.SITE_URL,
+            help='URL publique du site encodée dans les QR codes (défaut: SITE_URL)',
+        )
+        parser.add_argument(
+            '--output',
+            default=os.path.join(settings.BASE_DIR, 'static', 'qrcodes', 'Codes_partenaires.pdf'),
+            help='Fichier PDF de sortie',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        codes = PartnershipCode.objects.filter(is_active=True).select_related('partner')
+        if options['partner']:
+            codes = codes.filter(partner=self._get_partner(options['partner']))
+
+        codes = [(code.code, code.partner.name) for code in codes.order_by('partner__name', 'code')]
+        if not codes:
+            self.stdout.write(self.style.WARNING('Aucun code de partenariat trouvé'))
+            return
+
+        _, pdf = get_codes_pdf(codes, options['base_url'])
+
+        output = options['output']
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        # Écriture atomique : jamais de fichier à moitié écrit dans le dossier servi
+        with open(f'{output}.tmp', 'wb') as f:
+            f.write(pdf)
+        os.replace(f'{output}.tmp', output)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(codes)} code(s) dans {output} ({len(pdf) // 1024} Ko) '
+            f'en {time.monotonic() - started:.1f}s'
+        ))
+
+    @staticmethod
+    def _get_partner(value):
+        try:
+            lookup = Q(id=uuid.UUID(value)) | Q(name=value)
+        except ValueError:
+            # Pas un UUID : recherche par nom seulement
+            lookup = Q(name=value)
+        partner = Partner.objects.filter(lookup).first()
+        if partner is None:
+            raise CommandError(f'Partenaire introuvable: {value}')
+        return partner
@@ -1,57 +1,145 @@
-from django.core.management.base import BaseCommand
-from django.conf import settings
-import qrcode
+import json
 import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
 from partnerships.models import PartnershipCode
+from partnerships.pdf import PDF_QR_PARAMS, pdf_key, registration_url, render_code_pdf
+from partnerships.qrcodes import ERROR_CORRECT_H, qr_key, render_qr_png
+
+MANIFEST_NAME = 'manifest.json'
+
+# QR codes PNG à imprimer : correction d'erreur maximale
+PNG_QR_PARAMS = {'error_correction': ERROR_CORRECT_H}
+
+
+def render_job(job):
+    """Rendu d'un fichier (exécuté dans un processus du pool)"""
+    kind, filename, code, partner_name, url = job
+    if kind == 'png':
+        return filename, render_qr_png(url, **PNG_QR_PARAMS)
+    return filename, render_code_pdf(code, partner_name, render_qr_png(url, **PDF_QR_PARAMS))
 
 
 class Command(BaseCommand):
-    help = 'Generates QR codes for all partnership codes'
+    help = (
+        'Génère les QR codes (PNG) et, avec --pdf, les PDF de tous les codes actifs. '
+        "Seuls les fichiers dont le contenu a changé sont régénérés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url',
+            default=settings.SITE_URL,
+            help='URL publique du site encodée dans les QR codes (défaut: SITE_URL)',
+        )
+        parser.add_argument(
+            '--output',
+            default=os.path.join(settings.BASE_DIR, 'static', 'qrcodes'),
+            help='Dossier de sortie',
+        )
+        parser.add_argument('--pdf', action='store_true', help='Générer aussi les PDF des codes')
+        parser.add_argument('--zip', help='Regrouper les PDF dans cette archive ZIP (implique --pdf)')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Nombre de processus de rendu (1 = sans pool)',
+        )
+        parser.add_argument('--force', action='store_true', help='Tout régénérer, même les fichiers à jour')
 
     def handle(self, *args, **options):
-        # Creer le dossier s'il n'existe pas
-        qrcode_dir = os.path.join(settings.BASE_DIR, 'static', 'qrcodes')
-        os.makedirs(qrcode_dir, exist_ok=True)
+        started = time.monotonic()
+        output_dir = options['output']
+        os.makedirs(output_dir, exist_ok=True)
+        with_pdf = options['pdf'] or bool(options['zip'])
 
         # Récupérer tous les codes actifs
-        codes = PartnershipCode.objects.filter(is_active=True)
-
+        codes = PartnershipCode.objects.filter(is_active=True).select_related('partner').order_by('code')
         if not codes.exists():
             self.stdout.write(self.style.WARNING('Aucun code de partenariat trouvé'))
             return
 
-        count = 0
+        manifest = self._load_manifest(output_dir)
+        jobs, keys, pdf_files = [], {}, []
+        total = 0
         for code in codes:
-            # URL complète pour le QR code
-            url = f'http://localhost:8000/register/?code={code.code}'
-
-            # Générer le QR code
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_H,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(url)
-            qr.make(fit=True)
-
-            # Créer l'image
-            img = qr.make_image(fill_color='black', back_color='white')
-
-            # Sauvegarder le fichier
-            filename = f'{code.code.lower()}.png'
-            filepath = os.path.join(qrcode_dir, filename)
-
-            img.save(filepath)
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'OK - QR code cree: {filename}'
-                )
-            )
-            count += 1
-
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'\n{count} QR code(s) generes avec succes dans {qrcode_dir}'
-            )
-        )
+            url = registration_url(options['base_url'], code.code)
+            wanted = [('png', f'{code.code.lower()}.png', qr_key(url, **PNG_QR_PARAMS))]
+            if with_pdf:
+                pdf_filename = f'Code_{code.code}.pdf'
+                wanted.append(('pdf', pdf_filename, pdf_key(code.code, code.partner.name, url)))
+                pdf_files.append(pdf_filename)
+
+            for kind, filename, key in wanted:
+                total += 1
+                # Fichier déjà à jour : même empreinte que lors de la dernière génération
+                if (not options['force'] and manifest.get(filename) == key
+                        and os.path.exists(os.path.join(output_dir, filename))):
+                    continue
+                jobs.append((kind, filename, code.code, code.partner.name, url))
+                keys[filename] = key
+
+        skipped = total - len(jobs)
+        for done, (filename, data) in enumerate(self._render(jobs, options['workers']), start=1):
+            self._write(os.path.join(output_dir, filename), data)
+            manifest[filename] = keys[filename]
+            self._progress(done, len(jobs))
+        self._save_manifest(output_dir, manifest)
+
+        if options['zip']:
+            self._zip(options['zip'], output_dir, pdf_files)
+            self.stdout.write(f"Archive: {options['zip']} ({len(pdf_files)} PDF)")
+
+        elapsed = time.monotonic() - started
+        rate = len(jobs) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(jobs)} fichier(s) généré(s), {skipped} à jour, dans {output_dir} '
+            f'en {elapsed:.1f}s ({rate:.1f} fichiers/s)'
+        ))
+
+    def _render(self, jobs, workers):
+        """Rendu des fichiers, en parallèle sur `workers` processus"""
+        if workers <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                yield render_job(job)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(render_job, job) for job in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _progress(self, done, total):
+        width = 30
+        filled = width * done // total
+        bar = '#' * filled + '-' * (width - filled)
+        self.stdout.write(f'\r[{bar}] {done}/{total}', ending='\n' if done == total else '')
+        self.stdout.flush()
+
+    @staticmethod
+    def _write(path, data):
+        # Écriture atomique : jamais de fichier à moitié écrit dans le dossier servi
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _load_manifest(output_dir):
+        try:
+            with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, output_dir, manifest):
+        self._write(os.path.join(output_dir, MANIFEST_NAME), json.dumps(manifest, indent=2).encode())
+
+    @staticmethod
+    def _zip(zip_path, output_dir, filenames):
+        # Les PDF sont déjà compressés : stockés tels quels
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for filename in filenames:
+                archive.write(os.path.join(output_dir, filename), arcname=filename)
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from students.imports import BATCH_SIZE, CHUNK_SIZE, import_students_csv
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe des élèves depuis un fichier CSV (colonnes: full_name, email, phone, "
+        "referral_code, program) et met en file leurs emails d'inscription."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Fichier CSV (UTF-8)')
+        parser.add_argument('--errors', help="Écrire le rapport des lignes rejetées dans ce fichier CSV")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Lignes validées par paquet')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Lignes par INSERT')
+        parser.add_argument('--no-emails', action='store_true', help="Ne pas envoyer les emails d'inscription")
+        parser.add_argument('--dry-run', action='store_true', help='Valider seulement, sans rien enregistrer')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            # utf-8-sig : accepte les CSV exportés par Excel (BOM)
+            with open(options['path'], encoding='utf-8-sig', newline='') as f:
+                report = import_students_csv(
+                    f,
+                    chunk_size=options['chunk_size'],
+                    batch_size=options['batch_size'],
+                    send_emails=not options['no_emails'],
+                    dry_run=options['dry_run'],
+                )
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(f'Lecture impossible: {e}')
+
+        if options['errors']:
+            with open(options['errors'], 'w', encoding='utf-8', newline='') as f:
+                report.write_errors(f)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{report.rows} ligne(s) lue(s), {report.created} élève(s) importé(s), "
+            f"{len(report.errors)} ligne(s) rejetée(s) en {elapsed:.1f}s"
+            + (' (simulation)' if options['dry_run'] else '')
+        ))
+        for line, email, errors in report.errors[:20]:
+            self.stdout.write(self.style.WARNING(f'  ligne {line} ({email}): {errors}'))
+        if len(report.errors) > 20 and not options['errors']:
+            self.stdout.write('  ... utilisez --errors pour le rapport complet')
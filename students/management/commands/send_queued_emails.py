@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from students.email_service import flush_email_digests, send_queued_emails
+
+
+class Command(BaseCommand):
+    help = (
+        "Envoie les emails de l'outbox (EmailOutbox) sur une connexion SMTP réutilisée, "
+        "après y avoir ajouté les digests dont la fenêtre est écoulée. "
+        "Avec --loop, tourne en continu comme worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails envoyés par lot')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Tentatives avant abandon')
+        parser.add_argument('--backoff', type=int, default=60, help='Délai (secondes) avant la 1re nouvelle tentative')
+        parser.add_argument('--loop', action='store_true', help='Tourner en continu')
+        parser.add_argument('--interval', type=float, default=5, help='Pause (secondes) quand la file est vide')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        elapsed = 0
+
+        while True:
+            digests = flush_email_digests()
+            if digests:
+                self.stdout.write(f'{digests} digest(s) mis en file')
+
+            started = time.monotonic()
+            sent, failed = send_queued_emails(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+                backoff=options['backoff'],
+            )
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                batch_elapsed = time.monotonic() - started
+                elapsed += batch_elapsed
+                self.stdout.write(
+                    f'{sent} email(s) envoyé(s), {failed} échec(s) '
+                    f'({_rate(sent + failed, batch_elapsed):.1f} msg/s)'
+                )
+
+            # Lot complet : il reste probablement des emails, on enchaîne
+            if sent + failed >= options['batch_size']:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Terminé: {total_sent} email(s) envoyé(s), {total_failed} échec(s) '
+            f'({_rate(total_sent + total_failed, elapsed):.1f} msg/s)'
+        ))
+
+
+def _rate(count, elapsed):
+    """Débit en messages par seconde"""
+    return count / elapsed if elapsed else 0
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partnerships', '0009_auditlog'),
+        ('students', '0004_remove_student_birth_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='confirmed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Date de confirmation'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['partner', 'is_confirmed', 'confirmed_at'], name='students_st_partner_1bc4aa_idx'),
+        ),
+    ]
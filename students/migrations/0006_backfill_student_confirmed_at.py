@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_confirmed_at(apps, schema_editor):
+    """Date de confirmation = dernier log d'audit 'student_confirmed', sinon updated_at"""
+    Student = apps.get_model('students', 'Student')
+    AuditLog = apps.get_model('partnerships', 'AuditLog')
+
+    last_confirmation = AuditLog.objects.filter(
+        action='student_confirmed',
+        student_id=OuterRef('pk'),
+    ).order_by().values('student_id').annotate(last=Max('created_at')).values('last')
+
+    Student.objects.filter(is_confirmed=True, confirmed_at__isnull=True).update(
+        confirmed_at=Coalesce(Subquery(last_confirmation), F('updated_at'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0005_student_confirmed_at'),
+        ('partnerships', '0009_auditlog'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_confirmed_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partnerships', '0009_auditlog'),
+        ('students', '0006_backfill_student_confirmed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['partner', 'status', 'is_confirmed'], name='students_st_partner_617448_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['referral_code', 'status', 'is_confirmed'], name='students_st_referra_9525cb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['partner', 'status', '-enrollment_date'], name='students_st_partner_d6547d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['-enrollment_date'], name='students_st_enrollm_f72017_idx'),
+        ),
+    ]
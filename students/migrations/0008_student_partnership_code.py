@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partnerships', '0009_auditlog'),
+        ('students', '0007_student_dashboard_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='partnership_code',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='students', to='partnerships.partnershipcode', verbose_name='Code partenaire'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['partnership_code', 'status', 'is_confirmed'], name='students_st_partner_685513_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Upper
+
+
+def backfill_partnership_code(apps, schema_editor):
+    """Relie chaque étudiant au code correspondant à son referral_code"""
+    Student = apps.get_model('students', 'Student')
+    PartnershipCode = apps.get_model('partnerships', 'PartnershipCode')
+
+    # Comparaison insensible à la casse des deux côtés (codes historiques en minuscules compris)
+    matching_code = PartnershipCode.objects.annotate(code_upper=Upper('code')).filter(
+        code_upper=Upper(OuterRef('referral_code'))
+    ).values('pk')[:1]
+
+    Student.objects.filter(partnership_code__isnull=True).exclude(referral_code='').update(
+        partnership_code=Subquery(matching_code)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0008_student_partnership_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_partnership_code, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partnerships', '0009_auditlog'),
+        ('students', '0009_backfill_student_partnership_code'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='student',
+            name='students_st_partner_d6547d_idx',
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['partner', 'status', '-enrollment_date', '-id'], name='students_st_partner_71e2fa_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0011_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailDigestEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('partner', 'Partenaire'), ('admin', 'Administrateurs')], max_length=20, verbose_name='Type')),
+                ('recipient', models.EmailField(max_length=254, verbose_name='Destinataire')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='digest_entries', to='students.student', verbose_name='Élève')),
+            ],
+            options={
+                'verbose_name': 'Notification groupée',
+                'verbose_name_plural': 'Notifications groupées',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['kind', 'recipient', 'created_at'], name='students_em_kind_24242a_idx'), models.Index(fields=['created_at'], name='students_em_created_e2c5b6_idx')],
+            },
+        ),
+    ]
@@ -1,5 +1,9 @@
-from django.db import models
-from partnerships.models import Partner
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+from partnerships.models import AuditLog, Partner, PartnerBalance, PartnershipCode
 import uuid
 
 
@@ -44,6 +48,14 @@ class Student(models.Model):
         verbose_name="Code de parrainage utilisé",
         blank=True
     )
+    partnership_code = models.ForeignKey(
+        PartnershipCode,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='students',
+        verbose_name="Code partenaire"
+    )
 
     # Informations d'inscription
     enrollment_date = models.DateTimeField(auto_now_add=True, verbose_name="Date d'inscription")
@@ -80,6 +92,11 @@ class Student(models.Model):
         verbose_name="Inscription confirmée",
         help_text="Cochez pour confirmer l'inscription officielle (montant de 1000 DA acquis)"
     )
+    confirmed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Date de confirmation"
+    )
 
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
@@ -88,6 +105,215 @@ class Student(models.Model):
         verbose_name = "Élève"
         verbose_name_plural = "Élèves"
         ordering = ['-enrollment_date']
+        indexes = [
+            models.Index(fields=['partner', 'is_confirmed', 'confirmed_at']),
+            # Filtres des dashboards
+            models.Index(fields=['partner', 'status', 'is_confirmed']),
+            models.Index(fields=['referral_code', 'status', 'is_confirmed']),
+            models.Index(fields=['partnership_code', 'status', 'is_confirmed']),
+            # Listes triées par date d'inscription (les plus récents d'abord), paginées par curseur
+            models.Index(fields=['partner', 'status', '-enrollment_date', '-id']),
+            models.Index(fields=['-enrollment_date']),
+        ]
 
     def __str__(self):
         return self.full_name
+
+    def save(self, *args, **kwargs):
+        """Horodater la confirmation (utilisée pour les fenêtres de paiement)"""
+        if self.is_confirmed and not self.confirmed_at:
+            self.confirmed_at = timezone.now()
+        elif not self.is_confirmed:
+            self.confirmed_at = None
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def bulk_confirm(cls, students, user=None):
+        """
+        Confirme d'un coup les élèves actifs en attente parmi `students`
+        (queryset) ; les élèves inactifs ou suspendus ne sont jamais confirmés.
+
+        Une seule requête UPDATE, les AuditLog en bulk_create, puis un recalcul
+        du solde par partenaire touché (update() ne déclenche pas les signaux).
+        Retourne (nombre d'élèves confirmés, {partner_id: PartnerBalance}).
+        """
+        from partnerships.cache import invalidate_partner_stats
+
+        with transaction.atomic():
+            rows = list(
+                students.filter(is_confirmed=False, status='active')
+                .select_for_update(of=('self',))
+                .values('id', 'full_name', 'email', 'partner_id', 'partner__name')
+            )
+            if not rows:
+                return 0, {}
+
+            now = timezone.now()
+            # updated_at : auto_now n'agit pas sur update(), refresh_daily_stats s'en sert
+            cls.objects.filter(pk__in=[row['id'] for row in rows]).update(
+                is_confirmed=True, confirmed_at=now, updated_at=now,
+            )
+            AuditLog.log_student_confirmations(rows, confirmed_at=now, user=user)
+
+            balances = {}
+            for partner_id in {row['partner_id'] for row in rows} - {None}:
+                invalidate_partner_stats(partner_id)
+                balances[partner_id] = PartnerBalance.refresh(partner_id)
+        return len(rows), balances
+
+
+class EmailOutbox(models.Model):
+    """
+    File d'attente durable des emails (pattern outbox).
+
+    Les emails sont écrits dans la même transaction que l'inscription, puis
+    envoyés par la commande `send_queued_emails` hors du cycle requête/réponse.
+
+    Un worker réserve ses emails (statut 'sending', bail dans next_attempt_at)
+    dans une transaction courte et les envoie hors transaction. Si le worker
+    s'arrête en cours de lot, les emails sont repris à l'expiration du bail.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('sending', 'En cours d\'envoi'),
+        ('sent', 'Envoyé'),
+        ('failed', 'Échec définitif'),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name="Sujet")
+    body = models.TextField(verbose_name="Message")
+    from_email = models.CharField(max_length=255, verbose_name="Expéditeur")
+    recipients = models.JSONField(default=list, verbose_name="Destinataires")
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Statut")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentatives")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Prochaine tentative")
+    last_error = models.TextField(blank=True, verbose_name="Dernière erreur")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Date d'envoi")
+
+    class Meta:
+        verbose_name = "Email en attente"
+        verbose_name_plural = "Emails en attente"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.recipients)}"
+
+    @classmethod
+    def build(cls, subject, body, recipients, from_email=None):
+        """Email non enregistré (pour bulk_create)"""
+        return cls(
+            subject=subject,
+            body=body,
+            recipients=list(recipients),
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        )
+
+    @classmethod
+    def enqueue(cls, subject, body, recipients, from_email=None):
+        """Ajoute un email à la file (à appeler dans la transaction métier)"""
+        email = cls.build(subject, body, recipients, from_email)
+        email.save()
+        return email
+
+    @classmethod
+    def due(cls, limit=100):
+        """
+        Emails à envoyer maintenant (en attente, ou réservés dont le bail a
+        expiré), verrouillés pour les workers concurrents
+        """
+        return cls.objects.select_for_update(skip_locked=True).filter(
+            status__in=['pending', 'sending'], next_attempt_at__lte=timezone.now()
+        ).order_by('next_attempt_at')[:limit]
+
+    @classmethod
+    def claim(cls, limit=100, lease=None):
+        """
+        Réserve jusqu'à `limit` emails dus pour ce worker, dans une transaction
+        courte : statut 'sending', tentative comptée, bail de `lease` secondes
+        (EMAIL_SENDING_LEASE). Les envois se font ensuite hors transaction.
+        """
+        lease = settings.EMAIL_SENDING_LEASE if lease is None else lease
+        lease_end = timezone.now() + timedelta(seconds=lease)
+        with transaction.atomic():
+            emails = list(cls.due(limit))
+            cls.objects.filter(pk__in=[email.pk for email in emails]).update(
+                status='sending', attempts=models.F('attempts') + 1, next_attempt_at=lease_end,
+            )
+        for email in emails:
+            email.status = 'sending'
+            email.attempts += 1
+            email.next_attempt_at = lease_end
+        return emails
+
+    def mark_sent(self):
+        """Envoi réussi (la tentative a été comptée par claim)"""
+        self.status = 'sent'
+        self.sent_at = timezone.now()
+        self.last_error = ''
+        self.save(update_fields=['status', 'sent_at', 'last_error'])
+
+    def mark_failed(self, error, max_attempts, backoff):
+        """Reprogramme l'envoi avec un délai exponentiel, ou abandonne après max_attempts"""
+        self.last_error = str(error)
+        if self.attempts >= max_attempts:
+            self.status = 'failed'
+        else:
+            self.status = 'pending'
+            delay = backoff * 2 ** (self.attempts - 1)
+            self.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        self.save(update_fields=['status', 'last_error', 'next_attempt_at'])
+
+
+class EmailDigestEntry(models.Model):
+    """
+    Notification en attente de regroupement (mode digest, EMAIL_DIGEST_ENABLED).
+
+    Une entrée par destinataire et par inscription ; `send_queued_emails` les
+    regroupe en un seul email par destinataire et par fenêtre.
+    """
+    KIND_CHOICES = [
+        ('partner', 'Partenaire'),
+        ('admin', 'Administrateurs'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Type")
+    recipient = models.EmailField(verbose_name="Destinataire")
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.CASCADE,
+        related_name='digest_entries',
+        verbose_name="Élève"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+
+    class Meta:
+        verbose_name = "Notification groupée"
+        verbose_name_plural = "Notifications groupées"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['kind', 'recipient', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} → {self.recipient}"
+
+    @classmethod
+    def add(cls, kind, recipients, student):
+        """Ajoute l'inscription au prochain digest de chaque destinataire"""
+        return cls.objects.bulk_create([
+            cls(kind=kind, recipient=recipient, student=student)
+            for recipient in recipients
+        ])
+
+    @classmethod
+    def due_recipients(cls, window):
+        """(type, destinataire) dont la plus ancienne notification a dépassé la fenêtre (minutes)"""
+        cutoff = timezone.now() - timedelta(minutes=window)
+        return set(cls.objects.filter(created_at__lte=cutoff).values_list('kind', 'recipient').distinct())
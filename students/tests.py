@@ -1,7 +1,46 @@
-from django.test import TestCase
-from students.models import Student, Program
+import csv
+import importlib.util
+import json
+import os
+import re
+import shutil
+import smtplib
+import socket
+import tempfile
+import uuid
+import zipfile
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMessage
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from students import imports
+from students.imports import import_students_csv
+from students.email_backends import PooledSMTPEmailBackend, close_pools
+from students.email_service import flush_email_digests, send_queued_emails
+from students.models import EmailDigestEntry, EmailOutbox, Student, Program
 from students.forms import StudentRegistrationForm
-from partnerships.models import Partner, PartnershipCode
+from partnerships.models import Partner, PartnerBalance, PartnershipCode
+from partnerships.qrcodes import ERROR_CORRECT_H, render_qr_png
+from partnerships.tests import TEST_STORAGES
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
 
 
 class StudentRegistrationFormTests(TestCase):
@@ -93,6 +132,7 @@ class StudentRegistrationFormTests(TestCase):
         self.assertEqual(student.full_name, 'Jane Smith')
         self.assertEqual(student.email, 'jane@example.com')
         self.assertEqual(student.partner, self.partner)
+        self.assertEqual(student.partnership_code, self.code)
         self.assertEqual(student.referral_code, 'LIB4F6')
 
     def test_code_case_insensitive(self):
@@ -120,3 +160,519 @@ class StudentRegistrationFormTests(TestCase):
         student = form.save()
         self.assertEqual(student.referral_code, 'LIB4F6')
 
+    def test_code_looked_up_once(self):
+        """Test que le code n'est cherché qu'une fois (validation et enregistrement)"""
+        form = StudentRegistrationForm(data={
+            'full_name': 'John Doe',
+            'email': 'john@example.com',
+            'program': self.program.id,
+            'referral_code': 'LIB4F6'
+        })
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(form.is_valid())
+            student = form.save()
+        self.assertEqual(sum('partnerships_partnershipcode' in q['sql'] for q in queries), 1)
+        self.assertEqual(student.partner, self.partner)
+
+
+class StudentConfirmationTimestampTests(TestCase):
+    """Tests de l'horodatage confirmed_at"""
+
+    def setUp(self):
+        self.program = Program.objects.create(name="Python Course")
+        self.partner = Partner.objects.create(name="Tech Library", email="tech@lib.com")
+
+    def test_confirmed_at_set_and_kept(self):
+        """Test que confirmed_at est posé à la confirmation et conservé ensuite"""
+        student = Student.objects.create(
+            full_name="John Doe", email="john@example.com", partner=self.partner, program=self.program
+        )
+        self.assertIsNone(student.confirmed_at)
+
+        student.is_confirmed = True
+        student.save()
+        confirmed_at = student.confirmed_at
+        self.assertIsNotNone(confirmed_at)
+
+        student.phone = "0541234567"
+        student.save()
+        self.assertEqual(student.confirmed_at, confirmed_at)
+
+    def test_unconfirm_clears_confirmed_at(self):
+        """Test qu'annuler la confirmation efface confirmed_at"""
+        student = Student.objects.create(
+            full_name="Jane", email="jane@example.com", partner=self.partner,
+            program=self.program, is_confirmed=True
+        )
+        student.is_confirmed = False
+        student.save()
+        self.assertIsNone(student.confirmed_at)
+
+
+class StudentQueryPlanTests(TestCase):
+    """Vérifie via EXPLAIN que les requêtes des dashboards utilisent les index"""
+
+    def setUp(self):
+        self.program = Program.objects.create(name="Python Course")
+        self.partner = Partner.objects.create(name="Tech Library", email="tech@lib.com")
+        self.code = PartnershipCode.objects.create(partner=self.partner, code="LIB4F6")
+        Student.objects.bulk_create([
+            Student(
+                full_name=f"Student {i}",
+                email=f"plan{i}@example.com",
+                partner=self.partner,
+                program=self.program,
+                referral_code="LIB4F6",
+                partnership_code=self.code,
+                is_confirmed=i % 3 == 0,
+            )
+            for i in range(200)
+        ])
+
+    def dashboard_querysets(self):
+        active = Student.objects.filter(status='active')
+        return {
+            'students_by_partner': active.filter(partner=self.partner).order_by('-enrollment_date'),
+            'students_page_by_partner': active.filter(partner=self.partner).filter(
+                Q(enrollment_date__lt=timezone.now()) | Q(enrollment_date=timezone.now(), id__lt=uuid.uuid4())
+            ).order_by('-enrollment_date', '-id')[:51],
+            'pending_by_partner': active.filter(partner=self.partner, is_confirmed=False),
+            'confirmed_by_code': active.filter(referral_code="LIB4F6", is_confirmed=True),
+            'confirmed_by_partnership_code': self.code.students.filter(status='active', is_confirmed=True),
+            'counts_by_code': PartnershipCode.objects.with_counts(),
+            'recent_students': Student.objects.order_by('-enrollment_date')[:10],
+            'confirmed_since_checkpoint': Student.objects.filter(
+                partner=self.partner, is_confirmed=True, confirmed_at__gt=timezone.now()
+            ),
+        }
+
+    def assertNoFullScan(self, name, queryset):
+        if connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            self.assertNotRegex(plan, r'SCAN students_student(?! USING)', f"{name}:\n{plan}")
+        elif connection.vendor == 'mysql':
+            plan = json.loads(queryset.explain(format='json'))
+            tables = re.findall(r'"table_name": "students_student".*?"access_type": "(\w+)"', json.dumps(plan))
+            self.assertNotIn('ALL', tables, f"{name}:\n{plan}")
+        else:
+            self.skipTest(f"EXPLAIN non vérifié pour {connection.vendor}")
+
+    def test_dashboard_queries_use_indexes(self):
+        for name, queryset in self.dashboard_querysets().items():
+            with self.subTest(name):
+                self.assertNoFullScan(name, queryset)
+
+
+class FailingBackend(locmem.EmailBackend):
+    """Backend qui refuse tous les envois"""
+
+    def send_messages(self, messages):
+        raise smtplib.SMTPServerDisconnected("Connexion perdue")
+
+
+class ClaimCheckingBackend(locmem.EmailBackend):
+    """Backend qui relève, à chaque envoi, le statut en base et ce qu'un autre worker pourrait réserver"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen = []
+
+    def send_messages(self, messages):
+        self.seen.append((
+            list(EmailOutbox.objects.values_list('status', flat=True)),
+            EmailOutbox.claim(),
+        ))
+        return super().send_messages(messages)
+
+
+@override_settings(ADMINS=[('Admin', 'admin@test.com')])
+class EmailOutboxTests(TestCase):
+    """Tests de l'outbox des emails d'inscription"""
+
+    def setUp(self):
+        self.program = Program.objects.create(name="Python Course")
+        self.partner = Partner.objects.create(name="Tech Library", email="tech@lib.com")
+        PartnershipCode.objects.create(partner=self.partner, code="LIB4F6")
+
+    def register(self):
+        return self.client.post(reverse('student-register'), {
+            'full_name': 'John Doe',
+            'email': 'john@example.com',
+            'phone': '0541234567',
+            'program': self.program.id,
+            'referral_code': 'LIB4F6',
+        })
+
+    def test_registration_queues_emails(self):
+        """Test que l'inscription écrit les emails dans l'outbox sans les envoyer"""
+        self.assertEqual(self.register().status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(EmailOutbox.objects.values_list('recipients', flat=True)),
+            [['admin@test.com'], ['john@example.com'], ['tech@lib.com']],
+        )
+
+    def test_worker_sends_queued_emails(self):
+        """Test que la commande envoie la file et marque les emails envoyés"""
+        self.register()
+        call_command('send_queued_emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(EmailOutbox.objects.exclude(status='sent').exists())
+
+        call_command('send_queued_emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failure_is_retried_with_backoff(self):
+        """Test qu'un échec reprogramme l'email puis l'abandonne après max_attempts"""
+        email = EmailOutbox.enqueue("Sujet", "Message", ['john@example.com'])
+        connection = FailingBackend()
+
+        self.assertEqual(send_queued_emails(max_attempts=2, backoff=60, connection=connection), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'pending')
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+        # Pas encore dû : rien n'est tenté
+        self.assertEqual(send_queued_emails(max_attempts=2, connection=connection), (0, 0))
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        send_queued_emails(max_attempts=2, connection=connection)
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'failed')
+        self.assertIn("Connexion perdue", email.last_error)
+
+    def test_emails_are_claimed_before_sending(self):
+        """Test que le lot est réservé avant les envois et n'est pas repris par un autre worker"""
+        EmailOutbox.enqueue("Sujet", "Message", ['john@example.com'])
+        connection = ClaimCheckingBackend()
+        self.assertEqual(send_queued_emails(connection=connection), (1, 0))
+        self.assertEqual(connection.seen, [(['sending'], [])])
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.status, email.attempts), ('sent', 1))
+
+    def test_expired_claim_is_resent(self):
+        """Test qu'un email réservé par un worker arrêté est repris à l'expiration du bail"""
+        EmailOutbox.enqueue("Sujet", "Message", ['john@example.com'])
+        [email] = EmailOutbox.claim(lease=60)
+
+        # Bail en cours : personne d'autre ne l'envoie
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_queued_emails(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('sent', 2))
+
+        # Trop d'interruptions : abandon sans nouvel envoi
+        email = EmailOutbox.enqueue("Sujet", "Message", ['jane@example.com'])
+        for _ in range(2):
+            EmailOutbox.claim()
+            EmailOutbox.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(send_queued_emails(max_attempts=2), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'failed')
+        self.assertEqual(len(mail.outbox), 1)
+
+
+@override_settings(ADMINS=[('Admin', 'admin@test.com')], EMAIL_DIGEST_ENABLED=True, EMAIL_DIGEST_WINDOW=15)
+class EmailDigestTests(TestCase):
+    """Tests du mode digest des notifications partenaire / admin"""
+
+    def setUp(self):
+        self.program = Program.objects.create(name="Python Course")
+        self.partner = Partner.objects.create(name="Tech Library", email="tech@lib.com")
+        PartnershipCode.objects.create(partner=self.partner, code="LIB4F6")
+        for i in range(3):
+            self.client.post(reverse('student-register'), {
+                'full_name': f'Student {i}',
+                'email': f'student{i}@example.com',
+                'program': self.program.id,
+                'referral_code': 'LIB4F6',
+            })
+
+    def test_notifications_are_grouped(self):
+        """Test un seul email par destinataire et par fenêtre"""
+        # Seuls les emails aux étudiants partent directement
+        self.assertEqual(EmailOutbox.objects.count(), 3)
+        self.assertEqual(EmailDigestEntry.objects.count(), 6)
+
+        # Fenêtre pas encore écoulée
+        self.assertEqual(flush_email_digests(), 0)
+
+        EmailDigestEntry.objects.update(created_at=timezone.now() - timedelta(minutes=16))
+        self.assertEqual(flush_email_digests(), 2)
+        self.assertFalse(EmailDigestEntry.objects.exists())
+
+        partner_digest = EmailOutbox.objects.get(recipients=['tech@lib.com'])
+        self.assertIn("3 nouvel(s) étudiant(s)", partner_digest.body)
+        for i in range(3):
+            self.assertIn(f'Student {i}', partner_digest.body)
+        admin_digest = EmailOutbox.objects.get(recipients=['admin@test.com'])
+        self.assertIn("Tech Library", admin_digest.body)
+
+    def test_worker_flushes_digests(self):
+        """Test que la commande envoie les digests dus"""
+        EmailDigestEntry.objects.update(created_at=timezone.now() - timedelta(minutes=16))
+        call_command('send_queued_emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class PooledSMTPEmailBackendTests(TestCase):
+    """Tests du backend SMTP avec pool de connexions"""
+
+    def setUp(self):
+        self.port = free_port()
+        self.addCleanup(close_pools)
+
+    def backend(self, **kwargs):
+        return PooledSMTPEmailBackend(
+            host='127.0.0.1', port=self.port, username='', password='', use_tls=False, pool_size=3, **kwargs
+        )
+
+    def messages(self, count):
+        return [EmailMessage("Sujet", "Message", 'noreply@test.com', [f'user{i}@test.com']) for i in range(count)]
+
+    def test_unreachable_server_reports_each_message(self):
+        """Test qu'un serveur injoignable donne une erreur par message, sans perdre de connexion du pool"""
+        backend = self.backend(fail_silently=True, timeout=1)
+        results = backend.send_batch(self.messages(5))
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(error is not None for _, error in results))
+        self.assertEqual(backend.pool._idle.qsize(), 3)
+        self.assertEqual(backend.send_messages(self.messages(2)), 0)
+        with self.assertRaises(OSError):
+            self.backend(timeout=1).send_messages(self.messages(1))
+
+    def test_close_error_after_disconnect_stays_per_message(self):
+        """Test qu'un close() qui échoue sur une connexion perdue ne fait pas échouer tout le lot"""
+        connection = MagicMock()
+        connection._send.side_effect = smtplib.SMTPServerDisconnected("Connexion perdue")
+        connection.close.side_effect = OSError("Socket fermée")
+        error = self.backend()._send_one(connection, self.messages(1)[0])
+        self.assertIsInstance(error, smtplib.SMTPServerDisconnected)
+        self.assertEqual(connection.close.call_count, 2)
+
+    def test_smtp_errors_are_not_retried(self):
+        """Test que seule une connexion perdue provoque une reconnexion (serveur SMTP simulé)"""
+        with patch('smtplib.SMTP') as smtp_class:
+            connection = smtp_class.return_value
+            connection.noop.return_value = (250, b'OK')
+            backend = self.backend()
+
+            # Destinataire refusé : erreur du message, sans reconnexion ni renvoi
+            connection.sendmail.side_effect = smtplib.SMTPRecipientsRefused({'user0@test.com': (550, b'Inconnu')})
+            [(_, error)] = backend.send_batch(self.messages(1))
+            self.assertIsInstance(error, smtplib.SMTPRecipientsRefused)
+            self.assertEqual(smtp_class.call_count, 1)
+            self.assertEqual(connection.sendmail.call_count, 1)
+
+            # Connexion coupée : reconnexion puis renvoi réussi
+            connection.sendmail.reset_mock()
+            connection.sendmail.side_effect = [smtplib.SMTPServerDisconnected("Coupée"), {}]
+            [(_, error)] = backend.send_batch(self.messages(1))
+            self.assertIsNone(error)
+            self.assertEqual(smtp_class.call_count, 2)
+            self.assertEqual(connection.sendmail.call_count, 2)
+
+    @skipUnless(Controller, "aiosmtpd n'est pas installé")
+    def test_pooled_delivery_and_reconnect(self):
+        """Test l'envoi sur le pool puis la reconnexion après redémarrage du serveur"""
+        received = []
+
+        class Handler:
+            async def handle_DATA(self, server, session, envelope):
+                received.append(envelope.rcpt_tos)
+                return '250 OK'
+
+        server = Controller(Handler(), hostname='127.0.0.1', port=self.port)
+        server.start()
+        self.addCleanup(server.stop)
+
+        backend = self.backend()
+        self.assertEqual(backend.send_messages(self.messages(30)), 30)
+        self.assertEqual(len(received), 30)
+        self.assertTrue(all(error is None for _, error in backend.results))
+        self.assertGreater(backend.throughput, 0)
+
+        # Connexions du pool coupées par le serveur : reconnexion transparente
+        server.stop()
+        server = Controller(Handler(), hostname='127.0.0.1', port=self.port)
+        server.start()
+        self.addCleanup(server.stop)
+        EmailOutbox.enqueue("Sujet", "Message", ['john@example.com'])
+        self.assertEqual(send_queued_emails(connection=backend), (1, 0))
+        self.assertEqual(len(received), 31)
+
+
+class GenerateQRCodesCommandTests(TestCase):
+    """Tests de la commande generate_qrcodes"""
+
+    def setUp(self):
+        partner = Partner.objects.create(name="Tech Library", email="tech@lib.com")
+        for code in ("LIB001", "LIB002", "LIB003"):
+            PartnershipCode.objects.create(partner=partner, code=code)
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+
+    def generate(self, *args):
+        out = StringIO()
+        call_command('generate_qrcodes', '--output', self.output, *args, stdout=out)
+        return out.getvalue()
+
+    def test_incremental_generation(self):
+        """Test que seuls les fichiers dont le contenu change sont régénérés"""
+        output = self.generate('--base-url', 'https://example.com', '--workers', '2')
+        self.assertIn('3 fichier(s) généré(s), 0 à jour', output)
+        with open(os.path.join(self.output, 'lib001.png'), 'rb') as f:
+            self.assertEqual(f.read(), render_qr_png('https://example.com/register/?code=LIB001', error_correction=ERROR_CORRECT_H))
+
+        self.assertIn('0 fichier(s) généré(s), 3 à jour', self.generate('--base-url', 'https://example.com'))
+
+        PartnershipCode.objects.create(partner=Partner.objects.get(), code="LIB004")
+        self.assertIn('1 fichier(s) généré(s), 3 à jour', self.generate('--base-url', 'https://example.com'))
+
+        # Autre URL de base : tous les QR codes changent
+        self.assertIn('4 fichier(s) généré(s), 0 à jour', self.generate('--base-url', 'https://autre.example.com'))
+
+    @skipUnless(importlib.util.find_spec('reportlab'), "reportlab n'est pas installé")
+    def test_pdf_zip(self):
+        """Test la génération des PDF et de l'archive ZIP"""
+        zip_path = os.path.join(self.output, 'codes.zip')
+        self.generate('--zip', zip_path, '--workers', '1')
+        with zipfile.ZipFile(zip_path) as archive:
+            self.assertEqual(archive.namelist(), ['Code_LIB001.pdf', 'Code_LIB002.pdf', 'Code_LIB003.pdf'])
+            self.assertTrue(archive.read('Code_LIB001.pdf').startswith(b'%PDF'))
+
+    def test_codes_sheet(self):
+        """Test la commande generate_codes_sheet (un seul PDF par partenaire)"""
+        Partner.objects.create(name="Autre", email="autre@lib.com").partnership_codes.create(code="AUT001")
+        output = os.path.join(self.output, 'sheet.pdf')
+        with patch('partnerships.pdf.render_codes_pdf', side_effect=lambda entries: b'%PDF ' + b' '.join(
+                code.encode() for code, _, _ in entries)):
+            out = StringIO()
+            call_command('generate_codes_sheet', '--partner', 'Tech Library', '--output', output, stdout=out)
+        self.assertIn('3 code(s)', out.getvalue())
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), b'%PDF LIB001 LIB002 LIB003')
+
+        with self.assertRaises(CommandError):
+            call_command('generate_codes_sheet', '--partner', 'Inconnu', '--output', output, stdout=StringIO())
+
+
+class StudentImportTests(TestCase):
+    """Tests de l'import CSV d'élèves"""
+
+    def setUp(self):
+        self.program = Program.objects.create(name="Python Course")
+        self.partner = Partner.objects.create(name="Tech Library", email="tech@lib.com", status='active')
+        PartnershipCode.objects.create(partner=self.partner, code="LIB001")
+        Student.objects.create(full_name="Existing", email="existing@test.com", partner=self.partner)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write_csv(self, content):
+        path = os.path.join(self.dir, 'students.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_import_command(self):
+        """Test l'import : lignes valides insérées, lignes invalides dans le rapport"""
+        path = self.write_csv(
+            "nom,email,telephone,code,programme\n"
+            "Alice,alice@test.com,0550000001,lib001,Python Course\n"
+            "Bob,bob@test.com,,LIB001,\n"
+            "Bob bis,bob@test.com,,LIB001,\n"
+            "Existing,existing@test.com,,LIB001,\n"
+            "Bad,not-an-email,,LIB001,\n"
+            "Carol,carol@test.com,,NOPE,Cours inconnu\n"
+        )
+        errors_path = os.path.join(self.dir, 'errors.csv')
+        out = StringIO()
+        call_command('import_students', path, '--errors', errors_path, '--chunk-size', '2', stdout=out)
+        self.assertIn('6 ligne(s) lue(s), 2 élève(s) importé(s), 4 ligne(s) rejetée(s)', out.getvalue())
+
+        alice = Student.objects.get(email="alice@test.com")
+        self.assertEqual((alice.partner, alice.referral_code, alice.program), (self.partner, "LIB001", self.program))
+        self.assertEqual(PartnerBalance.objects.get(partner=self.partner).students_pending, 3)
+        # Email de l'élève + notifications partenaire et admins
+        self.assertEqual(EmailOutbox.objects.filter(recipients=["alice@test.com"]).count(), 1)
+        self.assertEqual(EmailOutbox.objects.count(), 2 * 3)
+
+        with open(errors_path, encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['ligne', 'email', 'erreurs'])
+        self.assertEqual([row[0] for row in rows[1:]], ['4', '5', '6', '7'])
+        self.assertIn("Code partenaire invalide", rows[4][2])
+        self.assertIn("Programme inconnu", rows[4][2])
+
+    def test_emails_compared_case_insensitively(self):
+        """Test qu'un email déjà inscrit avec une autre casse est rejeté"""
+        path = self.write_csv(
+            "full_name,email,referral_code\n"
+            "Existing,EXISTING@test.com,LIB001\n"
+            "Alice,alice@test.com,LIB001\n"
+            "Alice bis,Alice@Test.com,LIB001\n"
+        )
+        with open(path, encoding='utf-8') as f:
+            report = import_students_csv(f, send_emails=False)
+        self.assertEqual(report.created, 1)
+        self.assertEqual([(line, error) for line, _, error in report.errors], [(2, "Email déjà inscrit"), (4, "Email déjà inscrit")])
+
+    def test_concurrent_registration_rejects_only_conflicting_row(self):
+        """Test qu'un email inscrit pendant l'import ne fait pas échouer tout le paquet"""
+        path = self.write_csv(
+            "full_name,email,referral_code\n"
+            "Alice,alice@test.com,LIB001\n"
+            "Bob,bob@test.com,LIB001\n"
+        )
+        build_student = imports._build_student
+
+        def build_and_register(row, *args):
+            # Inscription concurrente, après la vérification des emails du paquet
+            if row['email'] == 'bob@test.com':
+                Student.objects.create(full_name="Bob", email="bob@test.com", partner=self.partner)
+            return build_student(row, *args)
+
+        with open(path, encoding='utf-8') as f, patch('students.imports._build_student', side_effect=build_and_register):
+            report = import_students_csv(f)
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.errors, [(3, "bob@test.com", "Email déjà inscrit")])
+        self.assertTrue(Student.objects.filter(email="alice@test.com").exists())
+        self.assertEqual(EmailOutbox.objects.filter(recipients=["alice@test.com"]).count(), 1)
+        self.assertFalse(EmailOutbox.objects.filter(recipients=["bob@test.com"]).exists())
+
+    def test_codes_resolved_once(self):
+        """Test que chaque code n'est cherché qu'une fois pour tout le fichier"""
+        path = self.write_csv("full_name,email,referral_code\n" + "".join(
+            f"Student {i},s{i}@test.com,LIB001\n" for i in range(10)
+        ))
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_students', path, '--chunk-size', '3', '--no-emails', stdout=StringIO())
+        self.assertEqual(sum('FROM "partnerships_partnershipcode"' in q['sql'] for q in queries), 1)
+        self.assertEqual(Student.objects.filter(email__startswith='s').count(), 10)
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_dry_run(self):
+        """Test que --dry-run valide sans rien enregistrer"""
+        path = self.write_csv("full_name,email,referral_code\nAlice,alice@test.com,LIB001\n")
+        call_command('import_students', path, '--dry-run', stdout=StringIO())
+        self.assertFalse(Student.objects.filter(email="alice@test.com").exists())
+
+    @override_settings(STORAGES=TEST_STORAGES)
+    def test_admin_upload(self):
+        """Test l'import depuis l'admin"""
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@test.com', 'pass'))
+        upload = SimpleUploadedFile('students.csv', "full_name,email,referral_code\nAlice,alice@test.com,LIB001\nBad,bad,LIB001\n".encode('utf-8-sig'))
+        response = self.client.post(reverse('admin:students_student_import_csv'), {'file': upload, 'send_emails': ''})
+        self.assertContains(response, '1 élève(s) importé(s), 1 ligne(s) rejetée(s)')
+        self.assertTrue(Student.objects.filter(email="alice@test.com").exists())
+        self.assertFalse(EmailOutbox.objects.exists())
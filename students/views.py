@@ -2,14 +2,13 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import CreateView, DetailView, ListView, TemplateView
 from django.urls import reverse_lazy, reverse
 from django.contrib import messages
-from django.db.models import Count, Sum
-from django.http import HttpResponse
-from io import BytesIO
-import qrcode
+from django.db import transaction
+from django.db.models import Count, Q, Sum
 from .models import Student
 from .forms import StudentRegistrationForm
-from .email_service import send_student_registration_email, send_partner_notification_email, send_admin_notification_email
+from .email_service import queue_registration_emails
 from partnerships.models import Partner, PartnershipCode
+from partnerships.qrcodes import ERROR_CORRECT_H, ERROR_CORRECT_L, ERROR_CORRECT_M, ERROR_CORRECT_Q, qr_response
 
 
 class StudentRegistrationView(CreateView):
@@ -37,67 +36,14 @@ class StudentRegistrationView(CreateView):
         return context
 
     def form_valid(self, form):
-        response = super().form_valid(form)
-
-        student = self.object
-
-        # Afficher email de confirmation dans le terminal
-        self._print_confirmation_email(student)
-
-        # Envoyer les 3 emails
-        send_student_registration_email(student)
-        send_partner_notification_email(student)
-        send_admin_notification_email(student)
+        # Inscription et emails dans la même transaction : l'envoi se fait hors requête (send_queued_emails)
+        with transaction.atomic():
+            response = super().form_valid(form)
+            queue_registration_emails(self.object)
 
         messages.success(self.request, "Inscription reussie ! Merci d'avoir choisi notre ecole.")
         return response
 
-    def _print_confirmation_email(self, student):
-        """Affiche l'email de confirmation dans le terminal"""
-        print("\n" + "="*80)
-        print("📧 EMAIL DE CONFIRMATION D'INSCRIPTION")
-        print("="*80)
-        print(f"\nTo: {student.email}")
-        print(f"From: noreply@ecole.com")
-        print(f"Subject: Confirmation d'inscription - Bienvenue!")
-        print("\n" + "-"*80)
-        print(f"""
-Bonjour {student.full_name},
-
-Merci pour votre inscription! 🎉
-
-📋 DÉTAILS DE VOTRE INSCRIPTION
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-Nom complet:        {student.full_name}
-Email:              {student.email}
-Téléphone:          {student.phone}
-Programme:          {student.program.name}
-Date d'inscription: {student.enrollment_date.strftime('%d/%m/%Y à %H:%M')}
-
-🏪 PARTENAIRE
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-Partenaire: {student.partner.name if student.partner else 'N/A'}
-Code utilisé: {student.referral_code}
-
-Ce partenaire reçoit une commission pour chaque inscription réussie.
-
-📝 PROCHAINES ÉTAPES
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-1. Vérifiez tous les détails ci-dessus
-2. Préparez vos documents si nécessaire
-3. Consultez notre portail étudiant
-4. Contactez-nous si vous avez des questions
-
-Besoin d'aide?
-Email: support@ecole.com
-Téléphone: +213 XXX XXX XXX
-
-Cordialement,
-L'équipe de l'école
-""")
-        print("-"*80)
-        print("="*80 + "\n")
-
     def form_invalid(self, form):
         for field, errors in form.errors.items():
             for error in errors:
@@ -143,6 +89,15 @@ class PartnerDashboardView(DetailView):
         return context
 
 
+# Niveaux de correction d'erreur acceptés par ?ec= (H pour les QR imprimés)
+QR_ERROR_CORRECTIONS = {
+    'l': ERROR_CORRECT_L,
+    'm': ERROR_CORRECT_M,
+    'q': ERROR_CORRECT_Q,
+    'h': ERROR_CORRECT_H,
+}
+
+
 def generate_qr_code(request, code):
     """Génère un QR code pour un code de partenariat"""
     code = code.upper()
@@ -156,61 +111,34 @@ def generate_qr_code(request, code):
     base_url = request.build_absolute_uri('/register/')
     url_with_code = f"{base_url}?code={code}"
 
-    # Générer le QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url_with_code)
-    qr.make(fit=True)
+    error_correction = QR_ERROR_CORRECTIONS.get(request.GET.get('ec', 'l').lower(), ERROR_CORRECT_L)
 
-    img = qr.make_image(fill_color="black", back_color="white")
+    # Image en cache (rendue une seule fois par URL), avec ETag / 304
+    return qr_response(request, url_with_code, error_correction=error_correction)
 
-    # Retourner l'image
-    response = HttpResponse(content_type="image/png")
-    img.save(response, "PNG")
-    return response
 
-
-class QRCodeListView(TemplateView):
-    """Affiche les QR codes pour chaque partenaire"""
+class QRCodeListView(ListView):
+    """Affiche les QR codes pour chaque partenaire (paginés, images chargées à la demande)"""
     template_name = 'students/qr-codes.html'
+    context_object_name = 'codes'
+    paginate_by = 24
+
+    def get_queryset(self):
+        # Récupérer les codes actifs (avec le solde des partenaires pour les stats affichées)
+        codes = PartnershipCode.objects.filter(is_active=True).select_related('partner', 'partner__balance')
+
+        query = self.request.GET.get('q', '').strip()
+        if query:
+            codes = codes.filter(Q(code__icontains=query) | Q(partner__name__icontains=query))
+
+        return codes.order_by('partner__name', 'code')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Récupérer tous les codes actifs
-        codes = PartnershipCode.objects.filter(is_active=True).select_related('partner')
-
-        codes_with_urls = []
-        for code in codes:
-            register_url = self.request.build_absolute_uri(f'/register/?code={code.code}')
-            # Générer le QR code en base64 pour l'afficher directement
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_H,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(register_url)
-            qr.make(fit=True)
-            img = qr.make_image(fill_color='black', back_color='white')
-
-            # Convertir en base64
-            import base64
-            from io import BytesIO
-            img_buffer = BytesIO()
-            img.save(img_buffer, format='PNG')
-            img_base64 = base64.b64encode(img_buffer.getvalue()).decode()
-
-            codes_with_urls.append({
-                'code': code.code,
-                'partner': code.partner,
-                'register_url': register_url,
-                'qr_base64': f'data:image/png;base64,{img_base64}',
-                'qr_file': f'{code.code.lower()}.png',
-            })
-
-        context['codes'] = codes_with_urls
+        context['query'] = self.request.GET.get('q', '').strip()
+
+        # URL d'inscription de la page courante seulement ; les QR sont servis par generate_qr_code
+        for code in context['codes']:
+            code.register_url = self.request.build_absolute_uri(f'/register/?code={code.code}')
+            code.qr_file = f'{code.code.lower()}.png'
         return context